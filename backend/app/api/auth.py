@@ -4,7 +4,8 @@ from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel, EmailStr
 from passlib.context import CryptContext
-from jose import jwt
+import jwt
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
@@ -16,6 +17,8 @@ from app.models.user import User
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 router = APIRouter(prefix="/auth", tags=["auth"])
+# Parsed once so PEM-based algorithms (EdDSA, RS*, ES*) do not re-load the key on every login.
+_SIGNING_KEY = jwt.get_algorithm_by_name(settings.jwt_algorithm).prepare_key(settings.jwt_secret)
 
 
 class RegisterBody(BaseModel):
@@ -36,10 +39,10 @@ def _verify(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
 
 
-def _create_token(email: str) -> str:
+def _create_token(user: User) -> str:
     expire = datetime.utcnow() + timedelta(hours=settings.jwt_expire_hours)
-    payload = {"sub": email, "exp": expire}
-    return jwt.encode(payload, settings.jwt_secret, algorithm=settings.jwt_algorithm)
+    payload = {"sub": str(user.id), "email": user.email, "exp": expire}
+    return jwt.encode(payload, _SIGNING_KEY, algorithm=settings.jwt_algorithm)
 
 
 @router.post("/register")
@@ -63,7 +66,10 @@ def login(body: LoginBody, request: Request, db: Session = Depends(get_db_sessio
     user = db.query(User).filter(User.email == body.email).first()
     if not user or not _verify(body.password, user.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email or password")
-    if not db.query(KnowledgeBaseMembership).filter(KnowledgeBaseMembership.user_id == user.id).first():
+    has_kb = db.scalar(
+        select(KnowledgeBaseMembership.id).where(KnowledgeBaseMembership.user_id == user.id).limit(1)
+    )
+    if has_kb is None:
         bootstrap_user_kb(db, user)
         db.commit()
-    return {"access_token": _create_token(user.email), "token_type": "bearer"}
+    return {"access_token": _create_token(user), "token_type": "bearer"}
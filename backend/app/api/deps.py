@@ -1,49 +1,178 @@
 """FastAPI dependencies: auth."""
-from typing import Annotated
+import re
+import time
+from typing import Annotated, Any
 
-from fastapi import Depends, HTTPException, status
+import jwt
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from jwt import ExpiredSignatureError, ImmatureSignatureError, InvalidTokenError
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, load_only
 
 from app.core.config import settings
-from app.models.base import SessionLocal
+from app.models.base import AsyncSessionLocal, ReplicaSessionLocal, SessionLocal
 from app.models.user import User
+from app.services.auth_cache import CachedUser, ExpiringCache, token_cache_key
+from app.services.token_decoder import build_token_decoder
 
 security = HTTPBearer(auto_error=False)
+TOKEN_RE = re.compile(r"[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+")
 
 
-def get_db_session():
-    db = SessionLocal()
+def _load_verification_key(algorithm: str, secret: str, public_key: str = "") -> Any:
+    """Parse the configured key once: raw bytes for HS*, a key object for PEM-based algorithms (e.g. EdDSA)."""
+    key = jwt.get_algorithm_by_name(algorithm).prepare_key(public_key or secret)
+    # Verification only needs the public half when a private PEM is configured.
+    to_public = getattr(key, "public_key", None)
+    return to_public() if callable(to_public) else key
+
+
+_VERIFICATION_KEY = _load_verification_key(settings.jwt_algorithm, settings.jwt_secret, settings.jwt_public_key)
+_verify_token = build_token_decoder(settings.jwt_algorithm, _VERIFICATION_KEY, required=("exp", "sub"))
+_verified_tokens = ExpiringCache(max_entries=settings.auth_token_cache_max_entries)
+_users_by_subject = ExpiringCache(max_entries=5000)
+_rejected_tokens = ExpiringCache(max_entries=10000)
+
+
+async def get_db_session(request: Request) -> Session:
+    """Request-scoped sync session, created on first use and closed by `DbSessionMiddleware`."""
+    db = getattr(request.state, "db", None)
+    if db is None:
+        db = SessionLocal()
+        request.state.db = db
+    return db
+
+
+async def get_async_db_session(request: Request) -> AsyncSession:
+    """Request-scoped async session, created on first use and closed by `DbSessionMiddleware`."""
+    db = getattr(request.state, "async_db", None)
+    if db is None:
+        db = AsyncSessionLocal()
+        request.state.async_db = db
+    return db
+
+
+def _decode_token(token: str) -> dict[str, Any]:
+    """Verify a bearer token, reusing the payload of a previously verified token until its `exp`."""
+    if not TOKEN_RE.fullmatch(token):
+        raise InvalidTokenError("Malformed token")
+    key = token_cache_key(token)
+    cached = _verified_tokens.get(key)
+    if cached is not None:
+        return cached
+    if _rejected_tokens.get(key) is not None:
+        raise InvalidTokenError("Token previously rejected")
     try:
-        yield db
-    finally:
-        db.close()
+        payload = _verify_token(token)
+    except (ExpiredSignatureError, ImmatureSignatureError):
+        # Time-based rejections are cheap (checked before the signature) and an `nbf` token presented early becomes
+        # valid later, so they are never remembered.
+        raise
+    except InvalidTokenError:
+        ttl = settings.auth_rejected_token_cache_ttl_seconds
+        if ttl > 0:
+            _rejected_tokens.set(key, True, expires_at=time.time() + ttl)
+        raise
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        _verified_tokens.set(key, payload, expires_at=float(exp))
+    return payload
+
+
+# users.id is a Postgres INTEGER; larger digit subjects would make the driver raise instead of finding no row.
+_MAX_USER_ID = 2**31 - 1
+
+
+async def _load_user_for_subject(db: AsyncSession, sub: str) -> User | None:
+    # Auth only snapshots id/email; skip password_hash and created_at on the row. Built per call (cache misses
+    # only) because creating the option at import would configure mappers before every model is registered.
+    auth_columns = load_only(User.id, User.email)
+    # isdigit() alone accepts non-ASCII digits such as '²', which int() rejects.
+    if sub.isascii() and sub.isdigit():
+        user_id = int(sub)
+        if user_id > _MAX_USER_ID:
+            return None
+        # Session.get consults the identity map before emitting any SQL.
+        return await db.get(User, user_id, options=[auth_columns])
+    # Tokens issued before the subject switched to the user id carry the email.
+    return await db.scalar(select(User).options(auth_columns).where(User.email == sub))
+
+
+async def _get_user_cached(db: AsyncSession, sub: str) -> CachedUser | None:
+    cached = _users_by_subject.get(sub)
+    if cached is not None:
+        return cached
+    user = await _load_user_for_subject(db, sub)
+    if user is None:
+        return None
+    snapshot = CachedUser(id=user.id, email=user.email)
+    ttl = settings.auth_user_cache_ttl_seconds
+    if ttl > 0:
+        _users_by_subject.set(sub, snapshot, expires_at=time.time() + ttl)
+    return snapshot
 
 
-def get_current_user(
+async def resolve_user_from_subject(sub: str) -> CachedUser | None:
+    """Subject -> user via the user cache; a replica session is opened only on a miss."""
+    cached = _users_by_subject.get(sub)
+    if cached is not None:
+        return cached
+    for attempt in range(2):
+        try:
+            # Read-only lookup: replica lag is bounded by the user-cache TTL anyway.
+            async with ReplicaSessionLocal() as db:
+                return await _get_user_cached(db, sub)
+        except DBAPIError as exc:
+            # Without pre-ping a connection dropped by the server fails once; the pool discards it, so retry.
+            if attempt or not exc.connection_invalidated:
+                raise
+    return None
+
+
+async def resolve_user_from_token(token: str) -> CachedUser | None:
+    """Token -> user using the in-process caches."""
+    return await resolve_user_from_subject(str(_decode_token(token)["sub"]))
+
+
+async def _get_gateway_user(request: Request) -> CachedUser:
+    """Trust the subject a fronting gateway has already verified; no token crypto in-process."""
+    sub = request.headers.get(settings.auth_trusted_subject_header)
+    if not sub:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = await resolve_user_from_subject(sub)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    request.state.current_user = user
+    return user
+
+
+async def get_current_user(
+    request: Request,
     credentials: Annotated[HTTPAuthorizationCredentials | None, Depends(security)],
-    db: Annotated[Session, Depends(get_db_session)],
-) -> User:
+) -> CachedUser:
+    current = getattr(request.state, "current_user", None)
+    if current is not None:
+        return current
+    if settings.auth_trusted_subject_header:
+        return await _get_gateway_user(request)
     if not credentials or credentials.credentials is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    token = credentials.credentials
     try:
-        payload = jwt.decode(
-            token,
-            settings.jwt_secret,
-            algorithms=[settings.jwt_algorithm],
-        )
-        sub = payload.get("sub")
-        if sub is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    except JWTError:
+        user = await resolve_user_from_token(credentials.credentials)
+    except InvalidTokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    user = db.query(User).filter(User.email == sub).first()
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    request.state.current_user = user
     return user
@@ -0,0 +1,82 @@
+"""ASGI middleware: resolve the bearer-token user and own the request DB session."""
+from __future__ import annotations
+
+import logging
+
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.api.deps import resolve_user_from_subject, resolve_user_from_token
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _header(scope: Scope, name: bytes) -> str | None:
+    for key, value in scope.get("headers") or []:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _bearer_token(scope: Scope) -> str | None:
+    value = _header(scope, b"authorization")
+    if value is None:
+        return None
+    scheme, _, token = value.partition(" ")
+    if scheme.lower() == "bearer" and token.strip():
+        return token.strip()
+    return None
+
+
+class CurrentUserMiddleware:
+    """Populate `request.state.current_user` from the auth caches.
+
+    Resolution is best-effort: failures leave the state unset so `get_current_user`
+    still produces the 401 on routes that require auth, and public routes are unaffected.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            try:
+                user = await self._resolve(scope)
+            except Exception as exc:
+                logger.debug("Bearer token not resolved in middleware: %s", exc)
+                user = None
+            if user is not None:
+                scope.setdefault("state", {})["current_user"] = user
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _resolve(scope: Scope):
+        if settings.auth_trusted_subject_header:
+            sub = _header(scope, settings.auth_trusted_subject_header.lower().encode("latin-1"))
+            return await resolve_user_from_subject(sub) if sub else None
+        token = _bearer_token(scope)
+        return await resolve_user_from_token(token) if token is not None else None
+
+
+class DbSessionMiddleware:
+    """Close the sessions `get_db_session`/`get_async_db_session` lazily placed on `request.state`, after the response is sent."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            state = scope.get("state") or {}
+            db = state.pop("db", None)
+            if db is not None:
+                # close() rolls back and returns the connection to the pool; both block, so keep them off the loop.
+                await run_in_threadpool(db.close)
+            async_db = state.pop("async_db", None)
+            if async_db is not None:
+                await async_db.close()
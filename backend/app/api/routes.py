@@ -1,20 +1,26 @@
 """API routes for upload, search, and chat."""
 from datetime import datetime
+from functools import lru_cache
+import asyncio
 import hashlib
 import io
-import json
 import logging
 import re
+import string
 import time
 import uuid
-from typing import Any
+from typing import Any, AsyncIterator, BinaryIO
 
+import anyio
 from fastapi import File, Query, UploadFile
 from fastapi import HTTPException, status
 from fastapi.responses import HTMLResponse, StreamingResponse
-from sqlalchemy import desc, func
+import orjson
+from sqlalchemy import and_, bindparam, delete, desc, exists, func, literal, null, select, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
-from app.models.base import SessionLocal
 from app.models.analytics import ChatFeedback, FeedbackRating
 from app.models.chat import ChatJob, ChatJobStatus, ChatMessage, ChatRole, ChatSession
 from app.models.audit import AuditLog
@@ -31,10 +37,27 @@ from app.models.tenant import (
 )
 from app.models.user import User
 from app.core.config import settings
-from app.services.access import get_default_accessible_kb_id, list_user_knowledge_bases, require_kb_access
+from app.services import answer_cache
+from app.services.access import (
+    cached_kb_resolution,
+    cached_org_role,
+    cached_team_role,
+    get_default_accessible_kb_id,
+    list_user_knowledge_bases,
+    remember_kb_resolution,
+    require_kb_access,
+)
 from app.services.analytics import build_rag_analytics_report
-from app.services.audit import log_audit_event, parse_details
-from app.services.context import assemble_context
+from app.services.audit import buffer_audit_event, log_audit_event, parse_details
+from app.services.context import CHAT_SYSTEM_PROMPT, assemble_context, build_user_prompt, select_chat_sources
+from app.services.chat_history import (
+    HISTORY_LINES,
+    append_history,
+    cached_history,
+    forget_history_sync,
+    history_line,
+    store_history,
+)
 from app.services.citations import append_citation_legend, enforce_citation_format
 from app.services.embedding_versions import (
     fail_embedding_migration,
@@ -56,12 +79,12 @@ from app.services.ingestion_tracking import (
 from app.services.llm import generate as llm_generate
 from app.services.llm import generate_stream as llm_generate_stream
 from app.services.onboarding import build_onboarding_status
-from app.services.query_expansion import build_query_variants
+from app.services.query_expansion import build_query_variants, hyde_variant, lexical_query_variants, with_hyde_variant
 from app.services.qdrant_client import delete_all_collections_for_kb, delete_document_chunks
-from app.services.retrieval import hybrid_retrieve
-from app.services.storage import delete_file, upload_file
+from app.services.retrieval import hybrid_retrieve, query_embedding
+from app.services.storage import delete_file, delete_files, upload_file
 from app.tasks.chat import process_chat_job
-from app.tasks.ingestion import _update_doc_status, ingest_document, migrate_kb_embedding_namespace
+from app.tasks.ingestion import ingest_document, migrate_kb_embedding_namespace
 
 VALID_KB_ROLES = {
     KnowledgeBaseRole.OWNER,
@@ -82,13 +105,95 @@ VALID_TEAM_ROLES = {
     TeamRole.MANAGER,
     TeamRole.MEMBER,
 }
-SESSION_ID_RE = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+_SESSION_ID_CHARS = frozenset(string.ascii_letters + string.digits + "._:-")
 ASYNC_HINT_RE = re.compile(
     r"\b(long|detailed|in-depth|comprehensive|elaborate|step[- ]by[- ]step|thorough|bullet)\b",
     re.IGNORECASE,
 )
+# Literal stems of every ASYNC_HINT_RE alternative. Most messages contain none of them, and a few `in` scans over
+# the lowered text reject those several times faster than entering the regex engine.
+_ASYNC_HINT_STEMS = ("long", "detailed", "in-depth", "comprehensive", "elaborate", "step", "thorough", "bullet")
 logger = logging.getLogger(__name__)
 
+# Newline -> space for single-line previews, done in one C-level pass.
+_NEWLINES_TO_SPACES = str.maketrans({"\n": " ", "\r": " "})
+
+# Naive UTC from the database clock, matching the columns' `datetime.utcnow` defaults without clock skew
+# between workers.
+_DB_UTC_NOW = func.timezone("utc", func.now())
+# Seconds between SSE heartbeat frames while the LLM is generating.
+_HEARTBEAT_SECONDS = 2.5
+# Characters of the latest message shown in the session list.
+_PREVIEW_CHARS = 140
+
+# Hot lookups built once; parameters are bound per call and the compiled SQL is reused from the engine cache.
+# Only the two columns the prompt needs; no ORM instances are built for history.
+_RECENT_MESSAGES_STMT = (
+    select(ChatMessage.role, ChatMessage.content)
+    .where(ChatMessage.session_id == bindparam("session_id"))
+    .order_by(desc(ChatMessage.id))
+    .limit(bindparam("limit"))
+)
+# A session's messages with the caller's rating on each; (user_id, chat_message_id) is unique, so the outer
+# join never duplicates a message.
+_SESSION_MESSAGES_STMT = (
+    select(ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.created_at, ChatFeedback.rating)
+    .outerjoin(
+        ChatFeedback,
+        and_(ChatFeedback.chat_message_id == ChatMessage.id, ChatFeedback.user_id == bindparam("user_id")),
+    )
+    .where(ChatMessage.session_id == bindparam("session_id"))
+    .order_by(desc(ChatMessage.id))
+    .limit(bindparam("limit"))
+)
+_JOB_ASSISTANT_MESSAGE_ID = (
+    select(func.max(ChatMessage.id))
+    .where(ChatMessage.session_id == ChatJob.session_id, ChatMessage.role == ChatRole.ASSISTANT)
+    .correlate(ChatJob)
+    .scalar_subquery()
+)
+# The job, the latest assistant message of its session and the caller's feedback on it, in one round trip.
+_CHAT_JOB_FOR_USER_STMT = (
+    select(
+        ChatJob,
+        _JOB_ASSISTANT_MESSAGE_ID.label("assistant_message_id"),
+        select(ChatFeedback.rating)
+        .where(ChatFeedback.user_id == ChatJob.user_id, ChatFeedback.chat_message_id == _JOB_ASSISTANT_MESSAGE_ID)
+        .correlate(ChatJob)
+        .limit(1)
+        .scalar_subquery()
+        .label("feedback_rating"),
+    )
+    .where(ChatJob.id == bindparam("job_id"), ChatJob.user_id == bindparam("user_id"))
+    .limit(1)
+)
+# Listing columns only: rows come back as plain tuples instead of hydrated ORM instances.
+_ORGANIZATIONS_FOR_USER_STMT = (
+    select(
+        Organization.id,
+        Organization.name,
+        Organization.description,
+        OrganizationMembership.role,
+        Organization.created_at,
+    )
+    .join(OrganizationMembership, OrganizationMembership.organization_id == Organization.id)
+    .where(OrganizationMembership.user_id == bindparam("user_id"))
+    .order_by(Organization.created_at.asc(), Organization.id.asc())
+)
+_ORGANIZATION_TEAMS_STMT = (
+    select(Team.id, Team.organization_id, Team.name, Team.description, Team.created_at)
+    .where(Team.organization_id == bindparam("org_id"))
+    .order_by(Team.created_at.asc(), Team.id.asc())
+)
+_KB_OWNER_COUNT_STMT = (
+    select(func.count())
+    .select_from(KnowledgeBaseMembership)
+    .where(
+        KnowledgeBaseMembership.knowledge_base_id == bindparam("kb_id"),
+        KnowledgeBaseMembership.role == KnowledgeBaseRole.OWNER,
+    )
+)
+
 
 def _normalize_session_id(session_id: str | None) -> str:
     if session_id is None:
@@ -96,7 +201,7 @@ def _normalize_session_id(session_id: str | None) -> str:
     normalized = session_id.strip()
     if not normalized:
         return uuid.uuid4().hex
-    if not SESSION_ID_RE.match(normalized):
+    if len(normalized) > 128 or not _SESSION_ID_CHARS.issuperset(normalized):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="session_id must be 1-128 chars and contain only letters, numbers, ., _, :, -",
@@ -105,10 +210,15 @@ def _normalize_session_id(session_id: str | None) -> str:
 
 
 def _should_queue_async(message: str) -> bool:
-    normalized = (message or "").strip()
-    if len(normalized) >= 260:
+    message = message or ""
+    # Stripping can only shorten, so short messages skip the copy; edge whitespace never changes a hint match.
+    if len(message) >= 260 and len(message.strip()) >= 260:
         return True
-    return bool(ASYNC_HINT_RE.search(normalized))
+    lowered = message.lower()
+    if not any(stem in lowered for stem in _ASYNC_HINT_STEMS):
+        return False
+    # A stem hit may still be part of a longer word ("belong", "longer"); the regex settles word boundaries.
+    return bool(ASYNC_HINT_RE.search(message))
 
 
 def _compact_query_text(query: str, limit: int = 240) -> str:
@@ -118,6 +228,12 @@ def _compact_query_text(query: str, limit: int = 240) -> str:
     return normalized[: max(1, limit - 3)] + "..."
 
 
+def _query_audit_fields(message: str) -> dict[str, Any]:
+    """`message_length` and `query_text` for a chat audit row, from a single strip of the message."""
+    stripped = (message or "").strip()
+    return {"message_length": len(stripped), "query_text": _compact_query_text(stripped)}
+
+
 def _normalize_feedback_rating(value: str) -> str:
     normalized = (value or "").strip().lower()
     if normalized not in VALID_FEEDBACK_RATINGS:
@@ -168,21 +284,15 @@ def _require_org_membership(
     user_id: int,
     org_id: int,
     min_role: str = OrganizationRole.MEMBER,
-) -> OrganizationMembership:
-    membership = (
-        db.query(OrganizationMembership)
-        .filter(
-            OrganizationMembership.organization_id == org_id,
-            OrganizationMembership.user_id == user_id,
-        )
-        .first()
-    )
-    if membership is None or not _role_at_least(ORG_ROLE_RANK, membership.role, min_role):
+) -> str:
+    """Caller's organization role, from the access cache; only the role column is ever read."""
+    role = cached_org_role(db, user_id, org_id)
+    if role is None or not _role_at_least(ORG_ROLE_RANK, role, min_role):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"Insufficient permissions for organization {org_id}",
         )
-    return membership
+    return role
 
 
 def _require_team_membership(
@@ -190,99 +300,173 @@ def _require_team_membership(
     user_id: int,
     team_id: int,
     min_role: str = TeamRole.MEMBER,
-) -> TeamMembership:
-    membership = (
-        db.query(TeamMembership)
-        .filter(
-            TeamMembership.team_id == team_id,
-            TeamMembership.user_id == user_id,
-        )
-        .first()
-    )
-    if membership is None or not _role_at_least(TEAM_ROLE_RANK, membership.role, min_role):
+) -> str:
+    """Caller's team role, from the access cache; only the role column is ever read."""
+    role = cached_team_role(db, user_id, team_id)
+    if role is None or not _role_at_least(TEAM_ROLE_RANK, role, min_role):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"Insufficient permissions for team {team_id}",
         )
-    return membership
+    return role
 
 
-def _sse(event: str, payload: dict[str, Any]) -> str:
-    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=True)}\n\n"
+def _sse(event: str, payload: dict[str, Any]) -> bytes:
+    # Streamed as UTF-8 bytes so StreamingResponse does not re-encode each frame.
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n\n"
 
 
-def _reasoning_event(step: str, detail: str, elapsed_ms: int) -> dict[str, Any]:
-    return {
-        "step": step,
-        "detail": detail,
-        "elapsed_ms": elapsed_ms,
-    }
+def _sse_token(delta: str) -> bytes:
+    """`_sse("token", {"delta": delta})` without building a dict; this is the per-chunk frame."""
+    return b'event: token\ndata: {"delta":' + orjson.dumps(delta) + b"}\n\n"
+
+
+class _StreamFailed:
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+async def _with_heartbeats(stream: AsyncIterator[str], interval: float) -> AsyncIterator[str | None]:
+    """Yield `stream`'s chunks, plus None every `interval` seconds, including while the stream is stalled.
+
+    The stream is consumed by its own task and a ticker task marks heartbeats, so a stalled stream still yields
+    None on schedule without a timeout around each chunk read. Errors raised by the stream are re-raised here, and
+    both tasks are cancelled and awaited when the caller stops iterating.
+    """
+    queue: asyncio.Queue[Any] = asyncio.Queue()
+    finished = object()
+
+    async def pump() -> None:
+        try:
+            async for chunk in stream:
+                queue.put_nowait(chunk)
+        except Exception as exc:
+            queue.put_nowait(_StreamFailed(exc))
+        finally:
+            queue.put_nowait(finished)
+
+    async def tick() -> None:
+        while True:
+            await asyncio.sleep(interval)
+            queue.put_nowait(None)
+
+    tasks = (asyncio.create_task(pump()), asyncio.create_task(tick()))
+    try:
+        while (item := await queue.get()) is not finished:
+            if isinstance(item, _StreamFailed):
+                raise item.error
+            yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@lru_cache(maxsize=64)
+def _reasoning_frame_prefix(step: str, detail: str) -> bytes:
+    encoded = b'{"step":' + orjson.dumps(step) + b',"detail":' + orjson.dumps(detail)
+    return b"event: reasoning\ndata: " + encoded + b',"elapsed_ms":'
+
+
+def _reasoning_frame(step: str, detail: str, elapsed_ms: int) -> bytes:
+    """The same bytes as `_sse("reasoning", {"step": ..., "detail": ..., "elapsed_ms": ...})`.
+
+    The encoded step/detail prefix is cached, so only the elapsed time is encoded per frame.
+    """
+    return _reasoning_frame_prefix(step, detail) + str(int(elapsed_ms)).encode() + b"}\n\n"
 
 
 def _source_previews(sources: list[dict[str, Any]], limit: int = 3) -> list[dict[str, Any]]:
     previews: list[dict[str, Any]] = []
-    for i, item in enumerate(sources[:limit]):
+    for i, item in enumerate(sources[:limit], 1):
         metadata = item.get("metadata") or {}
-        name = metadata.get("source") or metadata.get("filename") or f"Source {i + 1}"
-        snippet = (item.get("snippet") or "").replace("\n", " ").strip()
+        name = metadata.get("source") or metadata.get("filename") or f"Source {i}"
+        snippet = (item.get("snippet") or "").translate(_NEWLINES_TO_SPACES).strip()
         previews.append(
             {
                 "name": name,
                 "score": float(item.get("score", 0.0)),
-                "snippet_preview": snippet[:120] + ("..." if len(snippet) > 120 else ""),
+                "snippet_preview": snippet[:120] + "..." if len(snippet) > 120 else snippet,
             }
         )
     return previews
 
 
-def _get_or_create_chat_session(db, user_id: int, kb_id: int, session_id: str) -> ChatSession:
-    session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
-    if session:
-        if session.user_id != user_id:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
-        if session.knowledge_base_id != kb_id:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Session belongs to a different knowledge base.",
-            )
-        return session
-    session = ChatSession(id=session_id, user_id=user_id, knowledge_base_id=kb_id)
-    db.add(session)
-    db.flush()
-    return session
+def _check_chat_session_owner(session: ChatSession, user_id: int, kb_id: int) -> None:
+    if session.user_id != user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+    if session.knowledge_base_id != kb_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Session belongs to a different knowledge base.",
+        )
 
 
-def _history_for_prompt(db, session_id: str, max_messages: int = 10) -> str:
-    rows = (
-        db.query(ChatMessage)
-        .filter(ChatMessage.session_id == session_id)
-        .order_by(desc(ChatMessage.id))
-        .limit(max_messages)
-        .all()
+async def _get_or_create_chat_session(db: AsyncSession, user_id: int, kb_id: int, session_id: str) -> ChatSession:
+    """Create the session or touch its `updated_at` in one `INSERT .. ON CONFLICT .. RETURNING` round trip.
+
+    Concurrent first messages for the same id both succeed instead of racing on the primary key. When the row
+    belongs to someone else the owner check raises and the caller's transaction is never committed.
+    """
+    stmt = (
+        pg_insert(ChatSession)
+        .values(
+            id=session_id,
+            user_id=user_id,
+            knowledge_base_id=kb_id,
+            created_at=_DB_UTC_NOW,
+            updated_at=_DB_UTC_NOW,
+        )
+        .on_conflict_do_update(index_elements=[ChatSession.id], set_={"updated_at": _DB_UTC_NOW})
+        .returning(ChatSession)
     )
+    session = await db.scalar(stmt, execution_options={"populate_existing": True})
+    _check_chat_session_owner(session, user_id, kb_id)
+    return session
+
+
+async def _history_for_prompt(db: AsyncSession, session_id: str, max_messages: int = 10) -> str:
+    if max_messages <= HISTORY_LINES:
+        cached = await cached_history(session_id)
+        if cached is not None:
+            return "\n".join(cached[-max_messages:])
+    rows = (await db.execute(_RECENT_MESSAGES_STMT, {"session_id": session_id, "limit": max_messages})).all()
     if not rows:
         return ""
-    ordered = list(reversed(rows))
-    lines = []
-    for msg in ordered:
-        speaker = "User" if msg.role == ChatRole.USER else "Assistant"
-        lines.append(f"{speaker}: {msg.content}")
+    lines = [history_line(role, content) for role, content in rows[::-1]]
+    if max_messages >= HISTORY_LINES or len(rows) < max_messages:
+        await store_history(session_id, lines)
     return "\n".join(lines)
 
 
-def _resolve_kb_for_user(user: User, kb_id: int | None, min_role: str) -> int:
-    db = SessionLocal()
-    try:
-        resolved = kb_id if kb_id is not None else get_default_accessible_kb_id(db, user.id, min_role=min_role)
-        if resolved is None:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="No accessible knowledge base found for this user.",
-            )
-        require_kb_access(db, user.id, resolved, min_role=min_role)
+def _resolve_kb_in_session(db, user_id: int, kb_id: int | None, min_role: str) -> int:
+    resolved = kb_id if kb_id is not None else get_default_accessible_kb_id(db, user_id, min_role=min_role)
+    if resolved is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No accessible knowledge base found for this user.",
+        )
+    require_kb_access(db, user_id, resolved, min_role=min_role)
+    return resolved
+
+
+async def _resolve_kb_for_user(db: AsyncSession, user: User, kb_id: int | None, min_role: str) -> int:
+    # Hot path for upload/search/chat: a repeat resolution is answered from the access cache without the
+    # greenlet hop into the sync helpers.
+    resolved = cached_kb_resolution(user.id, kb_id, min_role)
+    if resolved is not None:
         return resolved
-    finally:
-        db.close()
+    # The access helpers are shared with sync routes and workers; run them on the async connection.
+    resolved = await db.run_sync(_resolve_kb_in_session, user.id, kb_id, min_role)
+    remember_kb_resolution(user.id, kb_id, min_role, resolved)
+    return resolved
+
+
+async def _release_connection(db: AsyncSession) -> None:
+    """End the current transaction so the pooled connection is returned while the request awaits retrieval or the LLM."""
+    await db.commit()
 
 
 def _normalize_document_filename(filename: str) -> str:
@@ -298,6 +482,63 @@ def _document_filename_key(filename: str) -> str:
     return (filename or "").strip().lower()
 
 
+def _digest_upload(stream: BinaryIO) -> tuple[str, int]:
+    """SHA-256 and size of an upload, streamed from its spooled temp file and rewound for the object store."""
+    stream.seek(0)
+    content_hash = hashlib.file_digest(stream, "sha256").hexdigest()
+    size = stream.tell()
+    stream.seek(0)
+    return content_hash, size
+
+
+_DEDUP_STATUSES = (
+    DocumentStatus.PENDING,
+    DocumentStatus.PROCESSING,
+    DocumentStatus.INDEXED,
+    DocumentStatus.FAILED,
+)
+
+
+def _upload_matches_stmt(kb_id: int, filename_key: str, content_hash: str):
+    """Newest same-name document and newest live same-content document in a KB, as one UNION ALL round-trip.
+
+    Rows carry a `match` column of "name" or "hash"; each branch keeps its own ORDER BY/LIMIT so a burst of
+    rows on one side cannot crowd out the other. The hash branch reads only indexed columns (no `object_key`) so
+    it stays an index-only scan on ix_documents_kb_hash_status.
+    """
+    by_name = (
+        select(
+            literal("name").label("match"),
+            Document.id,
+            Document.content_hash,
+            Document.status,
+            Document.object_key,
+        )
+        .where(Document.knowledge_base_id == kb_id, func.lower(Document.filename) == filename_key)
+        .order_by(Document.id.desc())
+        .limit(1)
+        .subquery()
+    )
+    by_hash = (
+        select(
+            literal("hash").label("match"),
+            Document.id,
+            Document.content_hash,
+            Document.status,
+            null().label("object_key"),
+        )
+        .where(
+            Document.knowledge_base_id == kb_id,
+            Document.content_hash == content_hash,
+            Document.status.in_(_DEDUP_STATUSES),
+        )
+        .order_by(Document.id.desc())
+        .limit(1)
+        .subquery()
+    )
+    return union_all(select(by_name), select(by_hash))
+
+
 def _normalize_kb_name(name: str) -> str:
     normalized = (name or "").strip()
     if not normalized:
@@ -319,10 +560,10 @@ def _normalize_kb_description(description: str | None) -> str | None:
 def _compute_confidence_score(sources: list[dict[str, Any]]) -> float:
     if not sources:
         return 0.0
-    raw_scores = [float(s.get("score", 0.0)) for s in sources]
-    top = max(raw_scores)
-    top_n = sorted(raw_scores, reverse=True)[:3]
-    avg_top = sum(top_n) / max(1, len(top_n))
+    # One C-level sort of a handful of floats beats numpy here: array setup alone costs more than the whole loop.
+    top_n = sorted([float(s.get("score", 0.0)) for s in sources], reverse=True)[:3]
+    top = top_n[0]
+    avg_top = sum(top_n) / len(top_n)
     top_norm = top / (top + 0.05) if top > 0 else 0.0
     avg_norm = avg_top / (avg_top + 0.05) if avg_top > 0 else 0.0
     coverage = min(1.0, len(sources) / max(1, settings.chat_context_max_sources))
@@ -348,33 +589,6 @@ def _faithfulness_signals(answer: str, sources: list[dict[str, Any]]) -> dict[st
     )
 
 
-def _source_identity(source: dict[str, Any], index: int) -> str:
-    metadata = source.get("metadata") or {}
-    doc_id = metadata.get("doc_id")
-    if doc_id is not None:
-        return f"doc:{doc_id}"
-    name = metadata.get("source") or metadata.get("filename") or metadata.get("title")
-    if isinstance(name, str) and name.strip():
-        return f"name:{name.strip().lower()}"
-    return f"idx:{index}"
-
-
-def _dedupe_sources_for_chat(sources: list[dict[str, Any]], limit: int) -> list[dict[str, Any]]:
-    if not settings.chat_unique_sources_per_document:
-        return sources[:limit]
-    deduped: list[dict[str, Any]] = []
-    seen: set[str] = set()
-    for idx, source in enumerate(sources):
-        key = _source_identity(source, idx)
-        if key in seen:
-            continue
-        seen.add(key)
-        deduped.append(source)
-        if len(deduped) >= limit:
-            break
-    return deduped
-
-
 def _enforce_citation_format(answer: str, sources: list[dict[str, Any]]) -> str:
     return enforce_citation_format(
         answer,
@@ -387,7 +601,7 @@ def _append_citation_legend(answer: str, sources: list[dict[str, Any]]) -> str:
     return append_citation_legend(answer, sources, legend_header="Source references")
 
 
-def _queue_document_ingestion_job(
+def _create_document_ingestion_job(
     db,
     *,
     user_id: int | None,
@@ -406,226 +620,253 @@ def _queue_document_ingestion_job(
         requested_by_user_id=user_id,
         reason=normalized_reason,
     )
+    # Read the id before commit: the sync session expires on commit and job.id would cost a refresh SELECT.
+    # The commit itself must precede the publish so the worker always finds the job row.
+    job_id = job.id
     db.commit()
-    db.refresh(job)
+    return job_id
+
+
+def _mark_ingestion_queue_failed(db, document_id: int, job_id: int, queue_err: Exception) -> None:
+    doc = db.query(Document).filter(Document.id == document_id).first()
+    if doc is not None:
+        doc.status = DocumentStatus.FAILED
+        doc.error_message = str(queue_err)
+        db.commit()
+    mark_ingestion_job_failed(
+        db,
+        job_id=job_id,
+        error_message=str(queue_err),
+        failure_stage="queue",
+        record_dead_letter=True,
+    )
 
+
+def _ingestion_queue_unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Failed to queue ingestion job.",
+    )
+
+
+def _queue_document_ingestion_job(
+    db,
+    *,
+    user_id: int | None,
+    kb_id: int,
+    document_id: int,
+    reason: str,
+) -> int:
+    job_id = _create_document_ingestion_job(
+        db, user_id=user_id, kb_id=kb_id, document_id=document_id, reason=reason
+    )
     try:
-        queued = ingest_document.delay(document_id, job.id)
+        queued = ingest_document.delay(document_id, job_id)
         task_id = getattr(queued, "id", None)
-        mark_ingestion_job_queued(db, job_id=job.id, celery_task_id=task_id)
-        return job.id
+        mark_ingestion_job_queued(db, job_id=job_id, celery_task_id=task_id)
+        return job_id
     except Exception as queue_err:
-        doc = db.query(Document).filter(Document.id == document_id).first()
-        if doc is not None:
-            doc.status = DocumentStatus.FAILED
-            doc.error_message = str(queue_err)
-            db.commit()
-        mark_ingestion_job_failed(
-            db,
-            job_id=job.id,
-            error_message=str(queue_err),
-            failure_stage="queue",
-            record_dead_letter=True,
-        )
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Failed to queue ingestion job.",
-        ) from queue_err
+        _mark_ingestion_queue_failed(db, document_id, job_id, queue_err)
+        raise _ingestion_queue_unavailable() from queue_err
+
+
+async def _queue_document_ingestion_job_async(
+    db: AsyncSession,
+    *,
+    user_id: int | None,
+    kb_id: int,
+    document_id: int,
+    reason: str,
+) -> int:
+    """Same as `_queue_document_ingestion_job`, with the broker publish kept off the event loop."""
+    job_id = await db.run_sync(
+        _create_document_ingestion_job, user_id=user_id, kb_id=kb_id, document_id=document_id, reason=reason
+    )
+    try:
+        queued = await asyncio.to_thread(ingest_document.delay, document_id, job_id)
+        task_id = getattr(queued, "id", None)
+        await db.run_sync(mark_ingestion_job_queued, job_id=job_id, celery_task_id=task_id)
+        return job_id
+    except Exception as queue_err:
+        await db.run_sync(_mark_ingestion_queue_failed, document_id, job_id, queue_err)
+        raise _ingestion_queue_unavailable() from queue_err
+
+
+async def _store_upload(db: AsyncSession, object_key: str, file: UploadFile, size: int) -> None:
+    """Stream an upload to the object store. Only called once the dedup checks have ruled out a duplicate.
+
+    Nothing is pending on the session at that point, so its connection goes back to the pool for the PUT.
+    """
+    await _release_connection(db)
+    await asyncio.to_thread(
+        upload_file, object_key, file.file, size, file.content_type or "application/octet-stream"
+    )
 
 
 async def upload_document(
+    db: AsyncSession,
     user: User,
     file: UploadFile = File(...),
     kb_id: int = Query(None, description="Knowledge base ID"),
     replace_existing: bool = True,
 ):
-    content = await file.read()
-    kb = _resolve_kb_for_user(user, kb_id, min_role=KnowledgeBaseRole.EDITOR)
+    kb = await _resolve_kb_for_user(db, user, kb_id, min_role=KnowledgeBaseRole.EDITOR)
     filename = _normalize_document_filename(file.filename or "")
     filename_key = _document_filename_key(filename)
     try:
         object_key = f"uploads/{uuid.uuid4().hex}/{filename}"
-        content_hash = hashlib.sha256(content).hexdigest()
-        db = SessionLocal()
-        try:
-            existing_by_name = (
-                db.query(Document)
-                .filter(
-                    Document.knowledge_base_id == kb,
-                    func.lower(Document.filename) == filename_key,
-                )
-                .order_by(Document.id.desc())
-                .first()
-            )
-            existing_by_hash = (
-                db.query(Document)
-                .filter(
-                    Document.knowledge_base_id == kb,
-                    Document.content_hash == content_hash,
-                    Document.status.in_(
-                        [
-                            DocumentStatus.PENDING,
-                            DocumentStatus.PROCESSING,
-                            DocumentStatus.INDEXED,
-                            DocumentStatus.FAILED,
-                        ]
-                    ),
-                )
-                .order_by(Document.id.desc())
-                .first()
+        # Hash off the event loop; the upload is never materialized as one bytes object.
+        content_hash, content_size = await asyncio.to_thread(_digest_upload, file.file)
+        # Name and content duplicates come back in one round-trip as plain rows; nothing is hydrated.
+        matches = {
+            row.match: row
+            for row in (await db.execute(_upload_matches_stmt(kb, filename_key, content_hash))).all()
+        }
+        existing_by_name = matches.get("name")
+        existing_by_hash = matches.get("hash")
+
+        if (
+            existing_by_name is not None
+            and existing_by_name.content_hash == content_hash
+            and existing_by_name.status in _DEDUP_STATUSES
+        ):
+            buffer_audit_event(
+                user_id=user.id,
+                knowledge_base_id=kb,
+                action="document.upload.deduplicated",
+                resource_type="document",
+                resource_id=str(existing_by_name.id),
+                details={"filename": filename},
             )
-
-            if (
-                existing_by_name is not None
-                and existing_by_name.content_hash == content_hash
-                and existing_by_name.status
-                in [DocumentStatus.PENDING, DocumentStatus.PROCESSING, DocumentStatus.INDEXED, DocumentStatus.FAILED]
-            ):
-                log_audit_event(
-                    db,
-                    user_id=user.id,
-                    knowledge_base_id=kb,
-                    action="document.upload.deduplicated",
-                    resource_type="document",
-                    resource_id=str(existing_by_name.id),
-                    details={"filename": filename},
-                )
-                db.commit()
-                if existing_by_name.status == DocumentStatus.FAILED:
-                    return {
-                        "filename": filename,
-                        "status": "failed",
-                        "document_id": existing_by_name.id,
-                        "deduplicated": True,
-                        "message": "Identical content already exists and last ingestion failed. Use retry ingestion for this document.",
-                    }
+            if existing_by_name.status == DocumentStatus.FAILED:
                 return {
                     "filename": filename,
-                    "status": "queued",
+                    "status": "failed",
                     "document_id": existing_by_name.id,
                     "deduplicated": True,
-                    "message": "Identical content already queued/indexed in this knowledge base.",
+                    "message": "Identical content already exists and last ingestion failed. Use retry ingestion for this document.",
                 }
+            return {
+                "filename": filename,
+                "status": "queued",
+                "document_id": existing_by_name.id,
+                "deduplicated": True,
+                "message": "Identical content already queued/indexed in this knowledge base.",
+            }
 
-            if existing_by_name is not None:
-                if should_replace_existing_upload(
-                    existing_hash=existing_by_name.content_hash,
-                    incoming_hash=content_hash,
-                    replace_existing=bool(replace_existing),
-                ):
-                    previous_object_key = existing_by_name.object_key
-                    upload_file(
-                        object_key,
-                        io.BytesIO(content),
-                        len(content),
-                        file.content_type or "application/octet-stream",
-                    )
-                    existing_by_name.object_key = object_key
-                    existing_by_name.content_hash = content_hash
-                    existing_by_name.status = DocumentStatus.PENDING
-                    existing_by_name.error_message = None
-                    log_audit_event(
-                        db,
-                        user_id=user.id,
-                        knowledge_base_id=kb,
-                        action="document.upload.replaced",
-                        resource_type="document",
-                        resource_id=str(existing_by_name.id),
-                        details={"filename": filename},
-                    )
-                    db.commit()
-                    db.refresh(existing_by_name)
-                    try:
-                        delete_file(previous_object_key)
-                    except Exception:
-                        pass
-
-                    job_id = _queue_document_ingestion_job(
-                        db,
-                        user_id=user.id,
-                        kb_id=kb,
-                        document_id=existing_by_name.id,
-                        reason=IngestionJobReason.REPLACE,
+        if existing_by_name is not None:
+            if should_replace_existing_upload(
+                existing_hash=existing_by_name.content_hash,
+                incoming_hash=content_hash,
+                replace_existing=bool(replace_existing),
+            ):
+                previous_object_key = existing_by_name.object_key
+                await _store_upload(db, object_key, file, content_size)
+                await db.execute(
+                    update(Document)
+                    .where(Document.id == existing_by_name.id)
+                    .values(
+                        object_key=object_key,
+                        content_hash=content_hash,
+                        status=DocumentStatus.PENDING,
+                        error_message=None,
                     )
-                    return {
-                        "filename": filename,
-                        "status": "queued",
-                        "document_id": existing_by_name.id,
-                        "ingestion_job_id": job_id,
-                        "replaced": True,
-                        "message": "Existing document replaced and re-indexing queued.",
-                    }
-
+                )
                 log_audit_event(
                     db,
                     user_id=user.id,
                     knowledge_base_id=kb,
-                    action="document.upload.name_conflict",
+                    action="document.upload.replaced",
                     resource_type="document",
                     resource_id=str(existing_by_name.id),
-                    details={"filename": filename, "replace_existing": bool(replace_existing)},
+                    details={"filename": filename},
                 )
-                db.commit()
-                return {
-                    "filename": filename,
-                    "status": "exists",
-                    "document_id": existing_by_name.id,
-                    "replace_required": True,
-                    "message": "Filename already exists in this knowledge base (case-insensitive). Set replace_existing=true to replace and re-index, or rename/delete the existing document first.",
-                }
+                await db.commit()
+                try:
+                    await asyncio.to_thread(delete_file, previous_object_key)
+                except Exception:
+                    pass
 
-            if existing_by_hash:
-                log_audit_event(
+                job_id = await _queue_document_ingestion_job_async(
                     db,
                     user_id=user.id,
-                    knowledge_base_id=kb,
-                    action="document.upload.deduplicated",
-                    resource_type="document",
-                    resource_id=str(existing_by_hash.id),
-                    details={"filename": filename},
+                    kb_id=kb,
+                    document_id=existing_by_name.id,
+                    reason=IngestionJobReason.REPLACE,
                 )
-                db.commit()
-                if existing_by_hash.status == DocumentStatus.FAILED:
-                    return {
-                        "filename": filename,
-                        "status": "failed",
-                        "document_id": existing_by_hash.id,
-                        "deduplicated": True,
-                        "message": "Identical content already exists and last ingestion failed. Use retry ingestion for this document.",
-                    }
                 return {
                     "filename": filename,
                     "status": "queued",
-                    "document_id": existing_by_hash.id,
-                    "deduplicated": True,
-                    "message": "Identical content already exists in this knowledge base.",
+                    "document_id": existing_by_name.id,
+                    "ingestion_job_id": job_id,
+                    "replaced": True,
+                    "message": "Existing document replaced and re-indexing queued.",
                 }
 
-            upload_file(object_key, io.BytesIO(content), len(content), file.content_type or "application/octet-stream")
-            doc = Document(knowledge_base_id=kb, filename=filename, object_key=object_key, content_hash=content_hash)
-            db.add(doc)
-            db.flush()
-            log_audit_event(
-                db,
+            buffer_audit_event(
                 user_id=user.id,
                 knowledge_base_id=kb,
-                action="document.upload.queued",
+                action="document.upload.name_conflict",
                 resource_type="document",
-                resource_id=str(doc.id),
-                details={"filename": filename},
+                resource_id=str(existing_by_name.id),
+                details={"filename": filename, "replace_existing": bool(replace_existing)},
             )
-            db.commit()
-            db.refresh(doc)
-            job_id = _queue_document_ingestion_job(
-                db,
+            return {
+                "filename": filename,
+                "status": "exists",
+                "document_id": existing_by_name.id,
+                "replace_required": True,
+                "message": "Filename already exists in this knowledge base (case-insensitive). Set replace_existing=true to replace and re-index, or rename/delete the existing document first.",
+            }
+
+        if existing_by_hash is not None:
+            buffer_audit_event(
                 user_id=user.id,
-                kb_id=kb,
-                document_id=doc.id,
-                reason=IngestionJobReason.UPLOAD,
+                knowledge_base_id=kb,
+                action="document.upload.deduplicated",
+                resource_type="document",
+                resource_id=str(existing_by_hash.id),
+                details={"filename": filename},
             )
-            return {"filename": filename, "status": "queued", "document_id": doc.id, "ingestion_job_id": job_id}
-        finally:
-            db.close()
+            if existing_by_hash.status == DocumentStatus.FAILED:
+                return {
+                    "filename": filename,
+                    "status": "failed",
+                    "document_id": existing_by_hash.id,
+                    "deduplicated": True,
+                    "message": "Identical content already exists and last ingestion failed. Use retry ingestion for this document.",
+                }
+            return {
+                "filename": filename,
+                "status": "queued",
+                "document_id": existing_by_hash.id,
+                "deduplicated": True,
+                "message": "Identical content already exists in this knowledge base.",
+            }
+
+        await _store_upload(db, object_key, file, content_size)
+        doc = Document(knowledge_base_id=kb, filename=filename, object_key=object_key, content_hash=content_hash)
+        db.add(doc)
+        await db.flush()
+        log_audit_event(
+            db,
+            user_id=user.id,
+            knowledge_base_id=kb,
+            action="document.upload.queued",
+            resource_type="document",
+            resource_id=str(doc.id),
+            details={"filename": filename},
+        )
+        # No commit here: the document row, its audit event and the ingestion job share the job helper's commit,
+        # which still lands before the broker publish. flush() has already assigned doc.id.
+        job_id = await _queue_document_ingestion_job_async(
+            db,
+            user_id=user.id,
+            kb_id=kb,
+            document_id=doc.id,
+            reason=IngestionJobReason.UPLOAD,
+        )
+        return {"filename": filename, "status": "queued", "document_id": doc.id, "ingestion_job_id": job_id}
     except HTTPException:
         raise
     except Exception as e:
@@ -635,45 +876,32 @@ async def upload_document(
         ) from e
 
 
-async def search_documents(user: User, query: str, kb_id: int = Query(None)):
-    kb = _resolve_kb_for_user(user, kb_id, min_role=KnowledgeBaseRole.VIEWER)
+async def search_documents(db: AsyncSession, user: User, query: str, kb_id: int = Query(None)):
+    kb = await _resolve_kb_for_user(db, user, kb_id, min_role=KnowledgeBaseRole.VIEWER)
+    await _release_connection(db)
     started = time.monotonic()
     try:
         query_variants = await build_query_variants(query=query)
-        results = hybrid_retrieve(kb_id=kb, query=query, top_k=5, query_variants=query_variants)
+        results = await asyncio.to_thread(
+            hybrid_retrieve, kb_id=kb, query=query, top_k=5, query_variants=query_variants, snippet_chars=300
+        )
         retrieval_ms = int((time.monotonic() - started) * 1000)
-        db = SessionLocal()
-        try:
-            log_audit_event(
-                db,
-                user_id=user.id,
-                knowledge_base_id=kb,
-                action="search.query",
-                resource_type="knowledge_base",
-                resource_id=str(kb),
-                details={
-                    "query_text": _compact_query_text(query),
-                    "result_count": len(results),
-                    "zero_result": len(results) == 0,
-                    "retrieval_ms": retrieval_ms,
-                },
-            )
-            db.commit()
-        except Exception:
-            db.rollback()
-            logger.warning("Failed to persist search analytics for kb_id=%s", kb)
-        finally:
-            db.close()
-        return [
-            {
-                "snippet": (r.get("snippet") or "")[:300],
-                "score": r.get("score", 0.0),
-                "metadata": r.get("metadata", {}),
-                "dense_score": r.get("dense_score", 0.0),
-                "sparse_score": r.get("sparse_score", 0.0),
-            }
-            for r in results
-        ]
+        # The analytics row is this request's only write, so it goes to the batched audit buffer instead of
+        # costing a transaction here.
+        buffer_audit_event(
+            user_id=user.id,
+            knowledge_base_id=kb,
+            action="search.query",
+            resource_type="knowledge_base",
+            resource_id=str(kb),
+            details={
+                "query_text": _compact_query_text(query),
+                "result_count": len(results),
+                "zero_result": len(results) == 0,
+                "retrieval_ms": retrieval_ms,
+            },
+        )
+        return results
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -700,11 +928,7 @@ def _retrieve_for_chat(
         else:
             # Backward-compatible invocation shape (used by existing tests/mocks).
             results = hybrid_retrieve(kb_id=kb_id, query=query, top_k=retrieval_limit)
-        mapped = [
-            {"snippet": r.get("snippet", ""), "metadata": r.get("metadata", {}), "score": r.get("score", 0.0)}
-            for r in results
-        ]
-        return _dedupe_sources_for_chat(mapped, limit=limit)
+        return select_chat_sources(results, limit)
     except Exception as e:
         logger.exception("Chat retrieval failed for kb_id=%s", kb_id)
         raise HTTPException(
@@ -713,6 +937,34 @@ def _retrieve_for_chat(
         ) from e
 
 
+def _start_hyde_variant(message: str, history: str) -> asyncio.Task | None:
+    if not (settings.retrieval_enable_hyde and settings.retrieval_enable_query_expansion):
+        return None
+    return asyncio.create_task(hyde_variant(message, history=history))
+
+
+async def _retrieve_chat_sources(kb_id: int, message: str, limit: int) -> list[dict[str, Any]]:
+    """First retrieval pass on the lexical variants, run off the event loop while any HyDE call is in flight."""
+    query_variants = lexical_query_variants(message)
+    return await asyncio.to_thread(_retrieve_for_chat, kb_id, message, limit=limit, query_variants=query_variants)
+
+
+async def _refine_chat_sources(
+    kb_id: int, message: str, limit: int, sources: list[dict[str, Any]], hyde_task: asyncio.Task | None
+) -> list[dict[str, Any]]:
+    """Retrieve again with the HyDE passage, but only when the first pass came back low-confidence."""
+    if hyde_task is None:
+        return sources
+    if sources and _compute_confidence_score(sources) >= settings.chat_low_confidence_threshold:
+        hyde_task.cancel()
+        return sources
+    hyde = await hyde_task
+    if not hyde:
+        return sources
+    query_variants = with_hyde_variant(message, hyde)
+    return await asyncio.to_thread(_retrieve_for_chat, kb_id, message, limit=limit, query_variants=query_variants)
+
+
 def _build_chat_prompt(
     message: str,
     history: str,
@@ -728,25 +980,9 @@ def _build_chat_prompt(
         per_source_char_limit=source_char_limit,
     )
     context_blocks = assembly.context_blocks
-    system = (
-        "You are a grounded assistant for this RAG system. "
-        "Use only the provided context blocks for factual claims; never invent details. "
-        "Use conversation history only for continuity. "
-        "Answer the user directly from available evidence, regardless of document type "
-        "(for example PRDs, runbooks, policies, specs, tickets, or notes). "
-        "If partial evidence exists, provide what is known and mark missing parts as "
-        "\"Not specified in provided context.\" "
-        "Do not ask for more context unless zero relevant evidence exists. "
-        "Do not say \"I couldn't find\" when at least one relevant fact is available. "
-        "When the question asks for lists (features, phases, requirements, steps, risks), "
-        "respond in a concise structured list. "
-        "For every factual bullet/sentence, append citations in the form [Source N]."
-    )
-    history_block = f"Conversation history:\n{history}\n\n" if history else ""
-    user_prompt = f"{history_block}Context:\n\n{context_blocks}\n\nQuestion: {message}"
     return (
-        system,
-        user_prompt,
+        CHAT_SYSTEM_PROMPT,
+        build_user_prompt(message, history, context_blocks),
         context_blocks,
         assembly.sources,
         {
@@ -758,76 +994,94 @@ def _build_chat_prompt(
 
 
 def _fallback_answer_from_sources(question: str, sources: list[dict[str, Any]], detail: str) -> str:
-    snippets = [
-        (s.get("snippet") or "").replace("\n", " ").strip()
-        for s in sources
-        if (s.get("snippet") or "").strip()
-    ]
-    if not snippets:
+    # Only the first three non-empty snippets are shown, so stop normalizing once they are found.
+    preview_lines: list[str] = []
+    for s in sources:
+        snippet = (s.get("snippet") or "").translate(_NEWLINES_TO_SPACES).strip()
+        if not snippet:
+            continue
+        preview_lines.append(f"- {snippet[:220]}..." if len(snippet) > 220 else f"- {snippet}")
+        if len(preview_lines) == 3:
+            break
+    if not preview_lines:
         return f"LLM unavailable ({detail}). No retrieved content is available yet."
-
-    preview_lines = []
-    for snippet in snippets[:3]:
-        cut = snippet[:220] + ("..." if len(snippet) > 220 else "")
-        preview_lines.append(f"- {cut}")
     return (
         f"LLM unavailable ({detail}). I could not generate a model answer. "
         "Top retrieved excerpts:\n" + "\n".join(preview_lines)
     )
 
 
-def _queue_async_chat_job(user: User, kb: int, session_key: str, message: str) -> dict[str, Any]:
-    job_id = uuid.uuid4().hex
-    db = SessionLocal()
-    try:
-        _get_or_create_chat_session(db, user_id=user.id, kb_id=kb, session_id=session_key)
-        db.add(ChatMessage(session_id=session_key, role=ChatRole.USER, content=message))
+async def _answer_cache_vector(message: str, history: str) -> tuple[float, ...] | None:
+    """Question embedding to look up in `answer_cache`, or None when the cache is off or the session has history.
 
-        job = ChatJob(
-            id=job_id,
-            user_id=user.id,
-            knowledge_base_id=kb,
-            session_id=session_key,
-            question=message,
-            status=ChatJobStatus.QUEUED,
-        )
-        db.add(job)
-        log_audit_event(
-            db,
-            user_id=user.id,
-            knowledge_base_id=kb,
-            action="chat.query.queued",
-            resource_type="chat_job",
-            resource_id=job_id,
-            details={"session_id": session_key, "message_length": len((message or "").strip())},
-        )
-        db.commit()
-    finally:
-        db.close()
+    `query_embedding` is memoized, so dense retrieval reuses the vector on a miss.
+    """
+    if history or not answer_cache.enabled():
+        return None
+    return await asyncio.to_thread(query_embedding, message.strip())
 
-    try:
-        process_chat_job.delay(job_id)
-    except Exception as exc:
-        db2 = SessionLocal()
-        try:
-            failed_job = db2.query(ChatJob).filter(ChatJob.id == job_id).first()
-            if failed_job is not None:
-                failed_job.status = ChatJobStatus.FAILED
-                failed_job.error_message = str(exc)
-                failed_job.finished_at = datetime.utcnow()
-                log_audit_event(
-                    db2,
-                    user_id=user.id,
-                    knowledge_base_id=kb,
-                    action="chat.query.queue_failed",
-                    resource_type="chat_job",
-                    resource_id=job_id,
-                    details={"detail": str(exc)},
-                )
-                db2.commit()
-        finally:
-            db2.close()
-        raise HTTPException(
+
+def _answer_cache_payload(
+    answer: str, sources: list[dict[str, Any]], context_stats: dict[str, int], citation_enforced: bool
+) -> dict[str, Any]:
+    return {
+        "answer": answer,
+        "sources": sources,
+        "context_stats": context_stats,
+        "citation_enforced": citation_enforced,
+    }
+
+
+async def _queue_async_chat_job(db: AsyncSession, user: User, kb: int, session_key: str, message: str) -> dict[str, Any]:
+    job_id = uuid.uuid4().hex
+    # The session upsert is one ON CONFLICT statement; the message, job and audit rows below go out in the single
+    # flush of the commit, one INSERT per table.
+    await _get_or_create_chat_session(db, user_id=user.id, kb_id=kb, session_id=session_key)
+    db.add_all(
+        [
+            ChatMessage(session_id=session_key, role=ChatRole.USER, content=message),
+            ChatJob(
+                id=job_id,
+                user_id=user.id,
+                knowledge_base_id=kb,
+                session_id=session_key,
+                question=message,
+                status=ChatJobStatus.QUEUED,
+            ),
+        ]
+    )
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=kb,
+        action="chat.query.queued",
+        resource_type="chat_job",
+        resource_id=job_id,
+        details={"session_id": session_key, "message_length": len((message or "").strip())},
+    )
+    await db.commit()
+    await append_history(session_key, history_line(ChatRole.USER, message))
+
+    try:
+        await asyncio.to_thread(process_chat_job.delay, job_id)
+    except Exception as exc:
+        # Still in the identity map from the insert above, so no query is issued.
+        failed_job = await db.get(ChatJob, job_id)
+        if failed_job is not None:
+            failed_job.status = ChatJobStatus.FAILED
+            failed_job.error_message = str(exc)
+            failed_job.finished_at = _DB_UTC_NOW
+            log_audit_event(
+                db,
+                user_id=user.id,
+                knowledge_base_id=kb,
+                action="chat.query.queue_failed",
+                resource_type="chat_job",
+                resource_id=job_id,
+                details={"detail": str(exc)},
+            )
+            await db.commit()
+        raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Failed to queue chat job. Check worker and broker availability.",
         ) from exc
@@ -835,6 +1089,7 @@ def _queue_async_chat_job(user: User, kb: int, session_key: str, message: str) -
 
 
 async def chat_rag(
+    db: AsyncSession,
     user: User,
     message: str,
     kb_id: int | None = None,
@@ -842,26 +1097,37 @@ async def chat_rag(
     async_mode: bool | None = None,
 ) -> dict:
     """RAG chat: sync response for short queries, async job for long ones."""
-    kb = _resolve_kb_for_user(user, kb_id, min_role=KnowledgeBaseRole.VIEWER)
+    kb = await _resolve_kb_for_user(db, user, kb_id, min_role=KnowledgeBaseRole.VIEWER)
     session_key = _normalize_session_id(session_id)
     should_queue_async = async_mode if async_mode is not None else _should_queue_async(message)
     if should_queue_async:
-        return _queue_async_chat_job(user=user, kb=kb, session_key=session_key, message=message)
+        return await _queue_async_chat_job(db, user=user, kb=kb, session_key=session_key, message=message)
 
-    db = SessionLocal()
-    try:
-        session = _get_or_create_chat_session(db, user_id=user.id, kb_id=kb, session_id=session_key)
-        history = _history_for_prompt(db, session_key, max_messages=10)
+    existing_session = await db.get(ChatSession, session_key)
+    history = ""
+    if existing_session is not None:
+        _check_chat_session_owner(existing_session, user.id, kb)
+        history = await _history_for_prompt(db, session_key, max_messages=10)
+    await _release_connection(db)
 
-        source_limit = max(1, settings.chat_context_max_sources)
-        retrieval_started = time.monotonic()
-        query_variants = await build_query_variants(query=message, history=history)
-        retrieved_sources: list[dict[str, Any]] = _retrieve_for_chat(
-            kb,
-            message,
-            limit=source_limit,
-            query_variants=query_variants,
-        )
+    source_limit = max(1, settings.chat_context_max_sources)
+    retrieval_started = time.monotonic()
+    cache_vector = await _answer_cache_vector(message, history)
+    cached = await answer_cache.cached_answer(kb, user.id, cache_vector) if cache_vector is not None else None
+    if cached is not None:
+        answer = cached["answer"]
+        sources = cached["sources"]
+        context_stats = cached["context_stats"]
+        citation_enforced = cached["citation_enforced"]
+        retrieval_ms = 0
+    else:
+        hyde_task = _start_hyde_variant(message, history)
+        try:
+            retrieved_sources = await _retrieve_chat_sources(kb, message, source_limit)
+            retrieved_sources = await _refine_chat_sources(kb, message, source_limit, retrieved_sources, hyde_task)
+        finally:
+            if hyde_task is not None:
+                hyde_task.cancel()
         retrieval_ms = int((time.monotonic() - retrieval_started) * 1000)
         system, user_prompt, context_blocks, sources, context_stats = _build_chat_prompt(
             message=message,
@@ -870,132 +1136,154 @@ async def chat_rag(
         )
         if not context_blocks:
             answer = "No relevant documents found in the selected knowledge base yet. Upload documents and try again."
-            quality = _chat_quality_signals(sources=[])
-            faithfulness = _faithfulness_signals(answer=answer, sources=[])
-            db.add(ChatMessage(session_id=session_key, role=ChatRole.USER, content=message))
-            assistant_message = ChatMessage(session_id=session_key, role=ChatRole.ASSISTANT, content=answer)
-            db.add(assistant_message)
-            db.flush()
-            session.updated_at = datetime.utcnow()
-            log_audit_event(
-                db,
-                user_id=user.id,
-                knowledge_base_id=kb,
-                action="chat.query.sync",
-                resource_type="chat_session",
-                resource_id=session_key,
-                details={
-                    "message_length": len((message or "").strip()),
-                    "query_text": _compact_query_text(message),
-                    "source_count": 0,
-                    "zero_result": True,
-                    "retrieval_ms": retrieval_ms,
-                    "confidence_score": quality["confidence_score"],
-                    "low_confidence": quality["low_confidence"],
-                    "context_token_budget": context_stats["token_budget"],
-                    "context_token_used": context_stats["token_used"],
-                    "context_compressed_sources": context_stats["compressed_sources"],
-                    "faithfulness_score": faithfulness["faithfulness_score"],
-                    "low_faithfulness": faithfulness["low_faithfulness"],
-                },
-            )
-            db.commit()
-            return {
-                "answer": answer,
-                "sources": [],
-                "session_id": session_key,
-                "assistant_message_id": assistant_message.id,
-                "citation_enforced": False,
-                "context_token_budget": context_stats["token_budget"],
-                "context_token_used": context_stats["token_used"],
-                **quality,
-                **faithfulness,
-            }
+            sources = []
+            citation_enforced = False
+        else:
+            generated = False
+            try:
+                answer = await llm_generate(user_prompt, system=system)
+                generated = True
+            except Exception as e:
+                detail = str(e).strip() or e.__class__.__name__
+                logger.warning("LLM generation failed for kb_id=%s session_id=%s: %s", kb, session_key, detail)
+                answer = _fallback_answer_from_sources(message, sources, detail)
+            answer = _enforce_citation_format(answer, sources)
+            answer = _append_citation_legend(answer, sources)
+            citation_enforced = bool(settings.chat_enforce_citation_format and sources)
+            if generated and cache_vector is not None:
+                await answer_cache.store_answer(
+                    kb, user.id, cache_vector, _answer_cache_payload(answer, sources, context_stats, citation_enforced)
+                )
+    quality = _chat_quality_signals(sources)
+    faithfulness = _faithfulness_signals(answer=answer, sources=sources)
+
+    await _get_or_create_chat_session(db, user_id=user.id, kb_id=kb, session_id=session_key)
+    assistant_message = ChatMessage(session_id=session_key, role=ChatRole.ASSISTANT, content=answer)
+    # Both rows go out as one multi-row INSERT .. RETURNING when the commit flushes, together with the audit row;
+    # ids stay loaded afterwards because the async session does not expire on commit.
+    db.add_all([ChatMessage(session_id=session_key, role=ChatRole.USER, content=message), assistant_message])
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=kb,
+        action="chat.query.sync",
+        resource_type="chat_session",
+        resource_id=session_key,
+        details={
+            **_query_audit_fields(message),
+            "source_count": len(sources),
+            "zero_result": len(sources) == 0,
+            "retrieval_ms": retrieval_ms,
+            "answer_cache_hit": cached is not None,
+            "confidence_score": quality["confidence_score"],
+            "low_confidence": quality["low_confidence"],
+            "context_token_budget": context_stats["token_budget"],
+            "context_token_used": context_stats["token_used"],
+            "context_compressed_sources": context_stats["compressed_sources"],
+            "faithfulness_score": faithfulness["faithfulness_score"],
+            "low_faithfulness": faithfulness["low_faithfulness"],
+        },
+    )
+    await db.commit()
+    await append_history(session_key, history_line(ChatRole.USER, message), history_line(ChatRole.ASSISTANT, answer))
+    return {
+        "answer": answer,
+        "sources": sources,
+        "session_id": session_key,
+        "assistant_message_id": assistant_message.id,
+        "citation_enforced": citation_enforced,
+        "context_token_budget": context_stats["token_budget"],
+        "context_token_used": context_stats["token_used"],
+        **quality,
+        **faithfulness,
+    }
 
-        try:
-            answer = await llm_generate(user_prompt, system=system)
-        except Exception as e:
-            detail = str(e).strip() or e.__class__.__name__
-            logger.warning("LLM generation failed for kb_id=%s session_id=%s: %s", kb, session_key, detail)
-            answer = _fallback_answer_from_sources(message, sources, detail)
-        answer = _enforce_citation_format(answer, sources)
-        answer = _append_citation_legend(answer, sources)
-        quality = _chat_quality_signals(sources)
-        faithfulness = _faithfulness_signals(answer=answer, sources=sources)
 
-        db.add(ChatMessage(session_id=session_key, role=ChatRole.USER, content=message))
-        assistant_message = ChatMessage(session_id=session_key, role=ChatRole.ASSISTANT, content=answer)
-        db.add(assistant_message)
-        db.flush()
-        session.updated_at = datetime.utcnow()
-        log_audit_event(
+async def _record_stream_turn(
+    db: AsyncSession,
+    *,
+    user_id: int,
+    kb: int,
+    session_key: str,
+    message: str,
+    answer: str | None,
+    action: str,
+    details: dict[str, Any],
+) -> list[ChatMessage]:
+    """Persist a streamed turn in one transaction: the question, the answer when there is one, and its audit row.
+
+    Returns the committed rows. Appending them to the cached history is left to the caller, so it can mark the turn
+    as recorded first and a disconnect during that Redis call cannot store the question twice.
+    """
+    await _get_or_create_chat_session(db, user_id=user_id, kb_id=kb, session_id=session_key)
+    rows = [ChatMessage(session_id=session_key, role=ChatRole.USER, content=message)]
+    if answer is not None:
+        rows.append(ChatMessage(session_id=session_key, role=ChatRole.ASSISTANT, content=answer))
+    db.add_all(rows)
+    log_audit_event(
+        db,
+        user_id=user_id,
+        knowledge_base_id=kb,
+        action=action,
+        resource_type="chat_session",
+        resource_id=session_key,
+        details=details,
+    )
+    await db.commit()
+    return rows
+
+
+async def _append_turn_history(session_key: str, rows: list[ChatMessage]) -> None:
+    await append_history(session_key, *(history_line(row.role, row.content) for row in rows))
+
+
+async def _record_abandoned_stream_turn(
+    db: AsyncSession, *, user_id: int, kb: int, session_key: str, message: str, started: float
+) -> None:
+    try:
+        await db.rollback()
+        rows = await _record_stream_turn(
             db,
-            user_id=user.id,
-            knowledge_base_id=kb,
-            action="chat.query.sync",
-            resource_type="chat_session",
-            resource_id=session_key,
+            user_id=user_id,
+            kb=kb,
+            session_key=session_key,
+            message=message,
+            answer=None,
+            action="chat.query.stream.aborted",
             details={
-                "message_length": len((message or "").strip()),
-                "query_text": _compact_query_text(message),
-                "source_count": len(sources),
-                "zero_result": len(sources) == 0,
-                "retrieval_ms": retrieval_ms,
-                "confidence_score": quality["confidence_score"],
-                "low_confidence": quality["low_confidence"],
-                "context_token_budget": context_stats["token_budget"],
-                "context_token_used": context_stats["token_used"],
-                "context_compressed_sources": context_stats["compressed_sources"],
-                "faithfulness_score": faithfulness["faithfulness_score"],
-                "low_faithfulness": faithfulness["low_faithfulness"],
+                **_query_audit_fields(message),
+                "elapsed_ms": int((time.monotonic() - started) * 1000),
             },
         )
-        db.commit()
-        return {
-            "answer": answer,
-            "sources": sources,
-            "session_id": session_key,
-            "assistant_message_id": assistant_message.id,
-            "citation_enforced": bool(settings.chat_enforce_citation_format and sources),
-            "context_token_budget": context_stats["token_budget"],
-            "context_token_used": context_stats["token_used"],
-            **quality,
-            **faithfulness,
-        }
-    finally:
-        db.close()
+        await _append_turn_history(session_key, rows)
+    except Exception:
+        logger.exception("Failed to record abandoned chat stream for session_id=%s", session_key)
 
 
 async def chat_rag_stream(
+    db: AsyncSession,
     user: User,
     message: str,
     kb_id: int | None = None,
     session_id: str | None = None,
 ) -> StreamingResponse:
     """RAG chat streaming endpoint returning SSE token events."""
-    kb = _resolve_kb_for_user(user, kb_id, min_role=KnowledgeBaseRole.VIEWER)
+    kb = await _resolve_kb_for_user(db, user, kb_id, min_role=KnowledgeBaseRole.VIEWER)
     session_key = _normalize_session_id(session_id)
 
-    db = SessionLocal()
-    try:
-        session = _get_or_create_chat_session(db, user_id=user.id, kb_id=kb, session_id=session_key)
-        history = _history_for_prompt(db, session_key, max_messages=10)
-        db.add(ChatMessage(session_id=session_key, role=ChatRole.USER, content=message))
-        session.updated_at = datetime.utcnow()
-        log_audit_event(
-            db,
-            user_id=user.id,
-            knowledge_base_id=kb,
-            action="chat.query.stream.started",
-            resource_type="chat_session",
-            resource_id=session_key,
-            details={"message_length": len((message or "").strip())},
-        )
-        db.commit()
-    finally:
-        db.close()
+    existing_session = await db.get(ChatSession, session_key)
+    history = ""
+    if existing_session is not None:
+        _check_chat_session_owner(existing_session, user.id, kb)
+        history = await _history_for_prompt(db, session_key, max_messages=10)
+    # Nothing is written before the stream: the question is stored with the answer in one transaction at the end,
+    # or on its own if the stream is abandoned. The request session stays open until the response has been sent.
+    await _release_connection(db)
+    stream_started = time.monotonic()
+    turn_recorded = False
 
     async def event_stream():
+        nonlocal turn_recorded
         started_at = time.monotonic()
         retrieval_started = time.monotonic()
         retrieval_ms = 0
@@ -1008,45 +1296,48 @@ async def chat_rag_stream(
         }
         answer = ""
         fallback = False
-        last_heartbeat = started_at
 
         def elapsed_ms() -> int:
             return int((time.monotonic() - started_at) * 1000)
 
         yield _sse("meta", {"session_id": session_key, "trace_mode": "public"})
-        yield _sse("reasoning", _reasoning_event("understand", "Understanding your question.", elapsed_ms()))
-        yield _sse("reasoning", _reasoning_event("retrieve", "Searching relevant knowledge base content.", elapsed_ms()))
-
-        try:
-            query_variants = await build_query_variants(query=message, history=history)
-            sources = _retrieve_for_chat(
-                kb,
-                message,
-                limit=source_limit,
-                query_variants=query_variants,
-            )
-        except HTTPException as e:
-            detail = str(e.detail).strip() if getattr(e, "detail", None) else "Retrieval backend unavailable"
-            fallback = True
-            answer = f"Retrieval unavailable ({detail}). Please try again shortly."
-            yield _sse("error", {"detail": detail, "stage": "retrieve"})
-            yield _sse("reasoning", _reasoning_event("fallback", "Switching to fallback mode.", elapsed_ms()))
-            sources = []
+        yield _reasoning_frame("understand", "Understanding your question.", elapsed_ms())
+        yield _reasoning_frame("retrieve", "Searching relevant knowledge base content.", elapsed_ms())
+
+        cache_vector = await _answer_cache_vector(message, history)
+        cached = await answer_cache.cached_answer(kb, user.id, cache_vector) if cache_vector is not None else None
+        if cached is not None:
+            answer = cached["answer"]
+            sources = cached["sources"]
+            context_stats = cached["context_stats"]
+            yield _reasoning_frame("evidence", "Reusing a recent answer to the same question.", elapsed_ms())
+            yield _sse_token(answer)
         else:
-            yield _sse(
-                "reasoning",
-                _reasoning_event("evidence", f"Found {len(sources)} relevant chunks.", elapsed_ms()),
-            )
-            previews = _source_previews(sources, limit=3)
-            if previews:
-                yield _sse("sources_preview", {"sources": previews, "elapsed_ms": elapsed_ms()})
-        finally:
-            retrieval_ms = int((time.monotonic() - retrieval_started) * 1000)
+            hyde_task = _start_hyde_variant(message, history)
+            try:
+                sources = await _retrieve_chat_sources(kb, message, source_limit)
+                # The preview goes out on the first pass; a HyDE pass, if one is needed, runs after it.
+                yield _reasoning_frame("evidence", f"Found {len(sources)} relevant chunks.", elapsed_ms())
+                previews = _source_previews(sources, limit=3)
+                if previews:
+                    yield _sse("sources_preview", {"sources": previews, "elapsed_ms": elapsed_ms()})
+                sources = await _refine_chat_sources(kb, message, source_limit, sources, hyde_task)
+            except HTTPException as e:
+                detail = str(e.detail).strip() if getattr(e, "detail", None) else "Retrieval backend unavailable"
+                fallback = True
+                answer = f"Retrieval unavailable ({detail}). Please try again shortly."
+                yield _sse("error", {"detail": detail, "stage": "retrieve"})
+                yield _reasoning_frame("fallback", "Switching to fallback mode.", elapsed_ms())
+                sources = []
+            finally:
+                if hyde_task is not None:
+                    hyde_task.cancel()
+                retrieval_ms = int((time.monotonic() - retrieval_started) * 1000)
 
         system = ""
         user_prompt = ""
         context_blocks = ""
-        if not fallback:
+        if not fallback and cached is None:
             system, user_prompt, context_blocks, sources, context_stats = _build_chat_prompt(
                 message=message,
                 history=history,
@@ -1056,38 +1347,56 @@ async def chat_rag_stream(
             if not context_blocks:
                 fallback = True
                 answer = "No relevant documents found in the selected knowledge base yet. Upload documents and try again."
-                yield _sse("reasoning", _reasoning_event("no_context", "No grounded context found for this question.", elapsed_ms()))
+                yield _reasoning_frame("no_context", "No grounded context found for this question.", elapsed_ms())
             else:
                 chunks: list[str] = []
                 first_token = True
-                yield _sse("reasoning", _reasoning_event("draft", "Drafting an answer from retrieved evidence.", elapsed_ms()))
+                # Tokens are coalesced into one frame per `coalesce_chars` or `coalesce_window`, whichever comes
+                # first, so a fast model does not cost one write and loop wakeup per token.
+                coalesce_chars = max(1, settings.chat_stream_coalesce_chars)
+                coalesce_window = max(0, settings.chat_stream_coalesce_ms) / 1000
+                pending_from = 0
+                pending_chars = 0
+                last_flush = time.monotonic()
+                yield _reasoning_frame("draft", "Drafting an answer from retrieved evidence.", elapsed_ms())
+                # Heartbeats come from a timer alongside the LLM stream, so they also go out while it stalls.
+                llm_stream = _with_heartbeats(llm_generate_stream(user_prompt, system=system), _HEARTBEAT_SECONDS)
                 try:
-                    async for chunk in llm_generate_stream(user_prompt, system=system):
+                    async for chunk in llm_stream:
+                        if chunk is None:
+                            # A stall is the worst time to hold text back: flush it ahead of the heartbeat.
+                            if pending_from < len(chunks):
+                                yield _sse_token("".join(chunks[pending_from:]))
+                                pending_from = len(chunks)
+                                pending_chars = 0
+                                last_flush = time.monotonic()
+                            yield _sse(
+                                "heartbeat",
+                                {"state": "generating", "elapsed_ms": elapsed_ms(), "tokens": len(chunks)},
+                            )
+                            continue
                         if not chunk:
                             continue
                         if first_token:
                             first_token = False
-                            yield _sse("reasoning", _reasoning_event("evolve", "Evolving response in real time.", elapsed_ms()))
+                            yield _reasoning_frame("evolve", "Evolving response in real time.", elapsed_ms())
                         chunks.append(chunk)
-                        yield _sse("token", {"delta": chunk})
+                        pending_chars += len(chunk)
                         now = time.monotonic()
-                        if now - last_heartbeat >= 2.5:
-                            last_heartbeat = now
-                            yield _sse(
-                                "heartbeat",
-                                {
-                                    "state": "generating",
-                                    "elapsed_ms": elapsed_ms(),
-                                    "tokens": len(chunks),
-                                },
-                            )
+                        if pending_chars >= coalesce_chars or now - last_flush >= coalesce_window:
+                            yield _sse_token("".join(chunks[pending_from:]))
+                            pending_from = len(chunks)
+                            pending_chars = 0
+                            last_flush = now
+                    if pending_from < len(chunks):
+                        yield _sse_token("".join(chunks[pending_from:]))
                 except Exception as e:
                     detail = str(e).strip() or e.__class__.__name__
                     logger.warning("Streaming LLM failed for kb_id=%s session_id=%s: %s", kb, session_key, detail)
                     fallback = True
                     answer = _fallback_answer_from_sources(message, sources, detail)
                     yield _sse("error", {"detail": detail, "stage": "generate"})
-                    yield _sse("reasoning", _reasoning_event("fallback", "LLM unavailable. Returning extractive fallback.", elapsed_ms()))
+                    yield _reasoning_frame("fallback", "LLM unavailable. Returning extractive fallback.", elapsed_ms())
                 if not fallback:
                     answer = "".join(chunks).strip() or "No response generated."
 
@@ -1096,44 +1405,40 @@ async def chat_rag_stream(
         quality = _chat_quality_signals(sources)
         faithfulness = _faithfulness_signals(answer=answer, sources=sources)
         citation_enforced = bool(settings.chat_enforce_citation_format and sources)
-        assistant_message_id: int | None = None
-
-        db2 = SessionLocal()
-        try:
-            session = _get_or_create_chat_session(db2, user_id=user.id, kb_id=kb, session_id=session_key)
-            assistant_message = ChatMessage(session_id=session_key, role=ChatRole.ASSISTANT, content=answer)
-            db2.add(assistant_message)
-            db2.flush()
-            assistant_message_id = assistant_message.id
-            session.updated_at = datetime.utcnow()
-            log_audit_event(
-                db2,
-                user_id=user.id,
-                knowledge_base_id=kb,
-                action="chat.query.stream.completed",
-                resource_type="chat_session",
-                resource_id=session_key,
-                details={
-                    "query_text": _compact_query_text(message),
-                    "source_count": len(sources),
-                    "zero_result": len(sources) == 0,
-                    "fallback": fallback,
-                    "retrieval_ms": retrieval_ms,
-                    "elapsed_ms": elapsed_ms(),
-                    "confidence_score": quality["confidence_score"],
-                    "low_confidence": quality["low_confidence"],
-                    "context_token_budget": context_stats["token_budget"],
-                    "context_token_used": context_stats["token_used"],
-                    "context_compressed_sources": context_stats["compressed_sources"],
-                    "faithfulness_score": faithfulness["faithfulness_score"],
-                    "low_faithfulness": faithfulness["low_faithfulness"],
-                },
+        if cached is None and cache_vector is not None and not fallback:
+            await answer_cache.store_answer(
+                kb, user.id, cache_vector, _answer_cache_payload(answer, sources, context_stats, citation_enforced)
             )
-            db2.commit()
-        finally:
-            db2.close()
+        rows = await _record_stream_turn(
+            db,
+            user_id=user.id,
+            kb=kb,
+            session_key=session_key,
+            message=message,
+            answer=answer,
+            action="chat.query.stream.completed",
+            details={
+                **_query_audit_fields(message),
+                "source_count": len(sources),
+                "zero_result": len(sources) == 0,
+                "fallback": fallback,
+                "retrieval_ms": retrieval_ms,
+                "answer_cache_hit": cached is not None,
+                "elapsed_ms": elapsed_ms(),
+                "confidence_score": quality["confidence_score"],
+                "low_confidence": quality["low_confidence"],
+                "context_token_budget": context_stats["token_budget"],
+                "context_token_used": context_stats["token_used"],
+                "context_compressed_sources": context_stats["compressed_sources"],
+                "faithfulness_score": faithfulness["faithfulness_score"],
+                "low_faithfulness": faithfulness["low_faithfulness"],
+            },
+        )
+        turn_recorded = True
+        await _append_turn_history(session_key, rows)
+        assistant_message_id = rows[1].id
 
-        yield _sse("reasoning", _reasoning_event("finalize", "Finalizing response and sources.", elapsed_ms()))
+        yield _reasoning_frame("finalize", "Finalizing response and sources.", elapsed_ms())
         yield _sse(
             "done",
             {
@@ -1151,84 +1456,72 @@ async def chat_rag_stream(
             },
         )
 
+    async def recorded_stream():
+        try:
+            async for frame in event_stream():
+                yield frame
+        finally:
+            if not turn_recorded:
+                # Client disconnect cancels the stream; shield the write so the question is still kept.
+                with anyio.CancelScope(shield=True):
+                    await _record_abandoned_stream_turn(
+                        db, user_id=user.id, kb=kb, session_key=session_key, message=message, started=stream_started
+                    )
+
     return StreamingResponse(
-        event_stream(),
+        recorded_stream(),
         media_type="text/event-stream",
+        # No hop-by-hop `Connection` header: HTTP/1.1 keeps the connection open by default and HTTP/2 proxies
+        # reject it.
         headers={
             "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
             "X-Accel-Buffering": "no",
         },
     )
 
 
-def get_chat_job(user: User, job_id: str) -> dict[str, Any]:
-    db = SessionLocal()
-    try:
-        job = (
-            db.query(ChatJob)
-            .filter(ChatJob.id == job_id, ChatJob.user_id == user.id)
-            .first()
-        )
-        if job is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat job not found")
-        require_kb_access(db, user.id, job.knowledge_base_id, min_role=KnowledgeBaseRole.VIEWER)
-        sources: list[dict[str, Any]] = []
-        if job.sources_json:
-            try:
-                parsed = json.loads(job.sources_json)
-                if isinstance(parsed, list):
-                    sources = parsed
-            except json.JSONDecodeError:
-                sources = []
-        assistant_message_id = None
-        if job.status == ChatJobStatus.COMPLETED:
-            row = (
-                db.query(ChatMessage.id)
-                .filter(
-                    ChatMessage.session_id == job.session_id,
-                    ChatMessage.role == ChatRole.ASSISTANT,
-                )
-                .order_by(desc(ChatMessage.id))
-                .first()
-            )
-            assistant_message_id = int(row[0]) if row else None
-        feedback_rating = None
-        if assistant_message_id is not None:
-            feedback_row = (
-                db.query(ChatFeedback)
-                .filter(
-                    ChatFeedback.user_id == user.id,
-                    ChatFeedback.chat_message_id == assistant_message_id,
-                )
-                .first()
-            )
-            if feedback_row is not None:
-                feedback_rating = feedback_row.rating
-        quality = _chat_quality_signals(sources)
-        answer_text = job.answer or ""
-        faithfulness = _faithfulness_signals(answer=answer_text, sources=sources)
-        return {
-            "job_id": job.id,
-            "status": job.status,
-            "session_id": job.session_id,
-            "answer": job.answer,
-            "sources": sources,
-            "assistant_message_id": assistant_message_id,
-            "feedback_rating": feedback_rating,
-            "citation_enforced": bool(settings.chat_enforce_citation_format and sources),
-            **quality,
-            **faithfulness,
-            "error_message": job.error_message,
-            "created_at": job.created_at.isoformat() if job.created_at else None,
-            "started_at": job.started_at.isoformat() if job.started_at else None,
-            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
-        }
-    finally:
-        db.close()
+def get_chat_job(db: Session, user: User, job_id: str) -> dict[str, Any]:
+    row = db.execute(_CHAT_JOB_FOR_USER_STMT, {"job_id": job_id, "user_id": user.id}).first()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat job not found")
+    job = row.ChatJob
+    require_kb_access(db, user.id, job.knowledge_base_id, min_role=KnowledgeBaseRole.VIEWER)
+    sources: list[dict[str, Any]] = []
+    if job.sources_json:
+        try:
+            parsed = orjson.loads(job.sources_json)
+            if isinstance(parsed, list):
+                sources = parsed
+        except orjson.JSONDecodeError:
+            sources = []
+    assistant_message_id = None
+    feedback_rating = None
+    if job.status == ChatJobStatus.COMPLETED and row.assistant_message_id is not None:
+        assistant_message_id = int(row.assistant_message_id)
+        feedback_rating = row.feedback_rating
+    quality = _chat_quality_signals(sources)
+    answer_text = job.answer or ""
+    faithfulness = _faithfulness_signals(answer=answer_text, sources=sources)
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "session_id": job.session_id,
+        "answer": job.answer,
+        "sources": sources,
+        "assistant_message_id": assistant_message_id,
+        "feedback_rating": feedback_rating,
+        "citation_enforced": bool(settings.chat_enforce_citation_format and sources),
+        **quality,
+        **faithfulness,
+        "error_message": job.error_message,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
 
 
 def submit_chat_feedback(
+    db: Session,
     user: User,
     message_id: int,
     rating: str,
@@ -1237,80 +1530,72 @@ def submit_chat_feedback(
     normalized_rating = _normalize_feedback_rating(rating)
     normalized_comment = (comment or "").strip()[:1000] or None
 
-    db = SessionLocal()
-    try:
-        message = db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
-        if message is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat message not found")
-        if message.role != ChatRole.ASSISTANT:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Feedback is only allowed for assistant messages")
-
-        session = db.query(ChatSession).filter(ChatSession.id == message.session_id).first()
-        if session is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat session not found")
-        if session.user_id != user.id:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat message not found")
-        require_kb_access(db, user.id, session.knowledge_base_id, min_role=KnowledgeBaseRole.VIEWER)
-
-        row = (
-            db.query(ChatFeedback)
-            .filter(
-                ChatFeedback.user_id == user.id,
-                ChatFeedback.chat_message_id == message.id,
-            )
-            .first()
+    message = db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
+    if message is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat message not found")
+    if message.role != ChatRole.ASSISTANT:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Feedback is only allowed for assistant messages")
+
+    session = db.query(ChatSession).filter(ChatSession.id == message.session_id).first()
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat session not found")
+    if session.user_id != user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat message not found")
+    require_kb_access(db, user.id, session.knowledge_base_id, min_role=KnowledgeBaseRole.VIEWER)
+
+    row = (
+        db.query(ChatFeedback)
+        .filter(
+            ChatFeedback.user_id == user.id,
+            ChatFeedback.chat_message_id == message.id,
         )
-        if row is None:
-            row = ChatFeedback(
-                user_id=user.id,
-                knowledge_base_id=session.knowledge_base_id,
-                session_id=session.id,
-                chat_message_id=message.id,
-                rating=normalized_rating,
-                comment=normalized_comment,
-            )
-            db.add(row)
-        else:
-            row.rating = normalized_rating
-            row.comment = normalized_comment
-            row.knowledge_base_id = session.knowledge_base_id
-            row.session_id = session.id
-
-        log_audit_event(
-            db,
+        .first()
+    )
+    if row is None:
+        row = ChatFeedback(
             user_id=user.id,
             knowledge_base_id=session.knowledge_base_id,
-            action="chat.feedback.submit",
-            resource_type="chat_message",
-            resource_id=str(message.id),
-            details={
-                "rating": normalized_rating,
-                "comment_length": len(normalized_comment or ""),
-                "session_id": session.id,
-            },
-        )
-        db.commit()
-        db.refresh(row)
-        return {
-            "message_id": message.id,
+            session_id=session.id,
+            chat_message_id=message.id,
+            rating=normalized_rating,
+            comment=normalized_comment,
+        )
+        db.add(row)
+    else:
+        row.rating = normalized_rating
+        row.comment = normalized_comment
+        row.knowledge_base_id = session.knowledge_base_id
+        row.session_id = session.id
+
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=session.knowledge_base_id,
+        action="chat.feedback.submit",
+        resource_type="chat_message",
+        resource_id=str(message.id),
+        details={
+            "rating": normalized_rating,
+            "comment_length": len(normalized_comment or ""),
             "session_id": session.id,
-            "kb_id": session.knowledge_base_id,
-            "rating": row.rating,
-            "comment": row.comment,
-            "created_at": row.created_at.isoformat() if row.created_at else None,
-            "updated_at": row.updated_at.isoformat() if row.updated_at else None,
-        }
-    finally:
-        db.close()
+        },
+    )
+    db.commit()
+    db.refresh(row)
+    return {
+        "message_id": message.id,
+        "session_id": session.id,
+        "kb_id": session.knowledge_base_id,
+        "rating": row.rating,
+        "comment": row.comment,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+    }
 
 
-def get_kb_rag_analytics(user: User, kb_id: int, days: int | None = None) -> dict[str, Any]:
-    db = SessionLocal()
-    try:
-        require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
-        return build_rag_analytics_report(db, kb_id=kb_id, days=days)
-    finally:
-        db.close()
+def get_kb_rag_analytics(db: Session, user: User, kb_id: int, days: int | None = None) -> dict[str, Any]:
+    require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
+    return build_rag_analytics_report(db, kb_id=kb_id, days=days)
 
 
 async def chat(message: str) -> dict:
@@ -1325,804 +1610,697 @@ async def root() -> HTMLResponse:
     )
 
 
-def list_knowledge_bases(user: User) -> list:
-    db = SessionLocal()
-    try:
-        return list_user_knowledge_bases(db, user.id)
-    finally:
-        db.close()
+def list_knowledge_bases(db: Session, user: User) -> list:
+    return list_user_knowledge_bases(db, user.id)
 
 
-def get_onboarding_status(user: User) -> dict[str, Any]:
-    db = SessionLocal()
-    try:
-        return build_onboarding_status(db, user_id=user.id)
-    finally:
-        db.close()
+def get_onboarding_status(db: Session, user: User) -> dict[str, Any]:
+    return build_onboarding_status(db, user_id=user.id)
+
+
+# The starter document never changes; encode and hash it once.
+_SAMPLE_KB_CONTENT = (
+    "# Ragnatic Starter Guide\n\n"
+    "## Welcome\n"
+    "This starter knowledge base helps you run your first grounded query quickly.\n\n"
+    "## Suggested Questions\n"
+    "- What are the first onboarding steps?\n"
+    "- How do we verify retrieval quality?\n"
+    "- Which endpoints are used for uploads and chat?\n\n"
+    "## Validation Checklist\n"
+    "1. Upload at least one document.\n"
+    "2. Run search for a policy term.\n"
+    "3. Ask a chat question and verify citations.\n"
+).encode("utf-8")
+_SAMPLE_KB_CONTENT_HASH = hashlib.sha256(_SAMPLE_KB_CONTENT).hexdigest()
 
 
-def create_onboarding_sample_kb(user: User) -> dict[str, Any]:
+def create_onboarding_sample_kb(db: Session, user: User) -> dict[str, Any]:
     sample_kb_name = "Ragnatic Starter KB"
     sample_kb_description = "Preloaded starter knowledge base for first-time onboarding."
     sample_filename = "Ragnatic-starter-guide.md"
-    sample_text = (
-        "# Ragnatic Starter Guide\n\n"
-        "## Welcome\n"
-        "This starter knowledge base helps you run your first grounded query quickly.\n\n"
-        "## Suggested Questions\n"
-        "- What are the first onboarding steps?\n"
-        "- How do we verify retrieval quality?\n"
-        "- Which endpoints are used for uploads and chat?\n\n"
-        "## Validation Checklist\n"
-        "1. Upload at least one document.\n"
-        "2. Run search for a policy term.\n"
-        "3. Ask a chat question and verify citations.\n"
-    )
-    content = sample_text.encode("utf-8")
-    content_hash = hashlib.sha256(content).hexdigest()
+    content, content_hash = _SAMPLE_KB_CONTENT, _SAMPLE_KB_CONTENT_HASH
     object_key = f"uploads/{uuid.uuid4().hex}/{sample_filename}"
 
-    db = SessionLocal()
-    try:
-        kb = KnowledgeBase(name=sample_kb_name, description=sample_kb_description)
-        db.add(kb)
-        db.flush()
-        db.add(
-            KnowledgeBaseMembership(
-                knowledge_base_id=kb.id,
-                user_id=user.id,
-                role=KnowledgeBaseRole.OWNER,
-            )
-        )
-        upload_file(object_key, io.BytesIO(content), len(content), "text/markdown")
-        doc = Document(
+    kb = KnowledgeBase(name=sample_kb_name, description=sample_kb_description)
+    db.add(kb)
+    db.flush()
+    db.add(
+        KnowledgeBaseMembership(
             knowledge_base_id=kb.id,
-            filename=sample_filename,
-            object_key=object_key,
-            content_hash=content_hash,
-            status=DocumentStatus.PENDING,
-        )
-        db.add(doc)
-        db.flush()
-        job_id = create_ingestion_job(
-            db,
-            requested_by_user_id=user.id,
-            kb_id=kb.id,
-            document_id=doc.id,
-            reason=IngestionJobReason.UPLOAD,
-        )
-        log_audit_event(
-            db,
             user_id=user.id,
-            knowledge_base_id=kb.id,
-            action="onboarding.sample_kb.create",
-            resource_type="knowledge_base",
-            resource_id=str(kb.id),
-            details={"sample_document": sample_filename, "ingestion_job_id": job_id},
+            role=KnowledgeBaseRole.OWNER,
         )
-        db.commit()
-    finally:
-        db.close()
+    )
+    upload_file(object_key, io.BytesIO(content), len(content), "text/markdown")
+    doc = Document(
+        knowledge_base_id=kb.id,
+        filename=sample_filename,
+        object_key=object_key,
+        content_hash=content_hash,
+        status=DocumentStatus.PENDING,
+    )
+    db.add(doc)
+    db.flush()
+    kb_id, doc_id = kb.id, doc.id
+    job_id = create_ingestion_job(
+        db,
+        document_id=doc_id,
+        knowledge_base_id=kb_id,
+        requested_by_user_id=user.id,
+        reason=IngestionJobReason.UPLOAD,
+    ).id
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=kb_id,
+        action="onboarding.sample_kb.create",
+        resource_type="knowledge_base",
+        resource_id=str(kb_id),
+        details={"sample_document": sample_filename, "ingestion_job_id": job_id},
+    )
+    db.commit()
 
+    # Enqueue only after the commit so the worker can see the rows; a broker failure is recorded on the
+    # same session rather than a second one.
     try:
-        ingest_document.delay(doc.id, content, sample_filename, object_key)
+        queued = ingest_document.delay(doc_id, job_id)
+        mark_ingestion_job_queued(db, job_id=job_id, celery_task_id=getattr(queued, "id", None))
     except Exception as exc:
-        db2 = SessionLocal()
-        try:
-            _update_doc_status(doc.id, DocumentStatus.FAILED, str(exc))
-            mark_ingestion_job_failed(db2, job_id=job_id, error_message=str(exc), progress=0)
-            db2.commit()
-        finally:
-            db2.close()
+        _mark_ingestion_queue_failed(db, doc_id, job_id, exc)
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Failed to queue onboarding sample ingestion job.",
         ) from exc
 
     return {
-        "kb_id": kb.id,
+        "kb_id": kb_id,
         "kb_name": sample_kb_name,
-        "document_id": doc.id,
+        "document_id": doc_id,
         "ingestion_job_id": job_id,
         "status": "queued",
     }
 
 
-def list_organizations(user: User) -> list[dict[str, Any]]:
-    db = SessionLocal()
-    try:
-        rows = (
-            db.query(Organization, OrganizationMembership.role)
-            .join(
-                OrganizationMembership,
-                OrganizationMembership.organization_id == Organization.id,
-            )
-            .filter(OrganizationMembership.user_id == user.id)
-            .order_by(Organization.created_at.asc(), Organization.id.asc())
-            .all()
-        )
-        return [
-            {
-                "id": org.id,
-                "name": org.name,
-                "description": org.description,
-                "role": role,
-                "created_at": org.created_at.isoformat() if org.created_at else None,
-            }
-            for org, role in rows
-        ]
-    finally:
-        db.close()
+def list_organizations(db: Session, user: User) -> list[dict[str, Any]]:
+    rows = db.execute(_ORGANIZATIONS_FOR_USER_STMT, {"user_id": user.id}).all()
+    return [
+        {
+            "id": org_id,
+            "name": name,
+            "description": description,
+            "role": role,
+            "created_at": created_at.isoformat() if created_at else None,
+        }
+        for org_id, name, description, role, created_at in rows
+    ]
 
 
-def create_organization(user: User, name: str, description: str | None = None) -> dict[str, Any]:
+def create_organization(db: Session, user: User, name: str, description: str | None = None) -> dict[str, Any]:
     org_name = _normalize_kb_name(name)
     org_description = _normalize_kb_description(description)
-    db = SessionLocal()
-    try:
-        org = Organization(name=org_name, description=org_description)
-        db.add(org)
-        db.flush()
-        db.add(
-            OrganizationMembership(
-                organization_id=org.id,
-                user_id=user.id,
-                role=OrganizationRole.OWNER,
-            )
-        )
-        log_audit_event(
-            db,
+    org = Organization(name=org_name, description=org_description)
+    db.add(org)
+    db.flush()
+    db.add(
+        OrganizationMembership(
+            organization_id=org.id,
             user_id=user.id,
-            knowledge_base_id=None,
-            action="org.create",
-            resource_type="organization",
-            resource_id=str(org.id),
-            details={"name": org_name},
+            role=OrganizationRole.OWNER,
         )
-        db.commit()
-        return {
-            "id": org.id,
-            "name": org.name,
-            "description": org.description,
-            "role": OrganizationRole.OWNER,
-            "created_at": org.created_at.isoformat() if org.created_at else None,
-        }
-    finally:
-        db.close()
+    )
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=None,
+        action="org.create",
+        resource_type="organization",
+        resource_id=str(org.id),
+        details={"name": org_name},
+    )
+    db.commit()
+    return {
+        "id": org.id,
+        "name": org.name,
+        "description": org.description,
+        "role": OrganizationRole.OWNER,
+        "created_at": org.created_at.isoformat() if org.created_at else None,
+    }
 
 
-def add_organization_member(user: User, org_id: int, email: str, role: str) -> dict[str, Any]:
+def add_organization_member(db: Session, user: User, org_id: int, email: str, role: str) -> dict[str, Any]:
     target_role = _normalize_org_role(role)
-    db = SessionLocal()
-    try:
-        _require_org_membership(db, user.id, org_id, min_role=OrganizationRole.ADMIN)
-        target_user = db.query(User).filter(User.email == email.strip().lower()).first()
-        if target_user is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User '{email}' not found.")
-
-        membership = (
-            db.query(OrganizationMembership)
-            .filter(
-                OrganizationMembership.organization_id == org_id,
-                OrganizationMembership.user_id == target_user.id,
-            )
-            .first()
+    _require_org_membership(db, user.id, org_id, min_role=OrganizationRole.ADMIN)
+    target_user = db.query(User).filter(User.email == email.strip().lower()).first()
+    if target_user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User '{email}' not found.")
+
+    membership = (
+        db.query(OrganizationMembership)
+        .filter(
+            OrganizationMembership.organization_id == org_id,
+            OrganizationMembership.user_id == target_user.id,
         )
-        if membership is None:
-            membership = OrganizationMembership(
-                organization_id=org_id,
-                user_id=target_user.id,
-                role=target_role,
-            )
-            db.add(membership)
-        else:
-            membership.role = target_role
-        log_audit_event(
-            db,
-            user_id=user.id,
-            knowledge_base_id=None,
-            action="org.member.upsert",
-            resource_type="organization_membership",
-            resource_id=f"{org_id}:{target_user.id}",
-            details={"email": target_user.email, "role": target_role},
-        )
-        db.commit()
-        return {
-            "org_id": org_id,
-            "user_id": target_user.id,
-            "email": target_user.email,
-            "role": membership.role,
-            "created_at": membership.created_at.isoformat() if membership.created_at else None,
-        }
-    finally:
-        db.close()
+        .first()
+    )
+    if membership is None:
+        membership = OrganizationMembership(
+            organization_id=org_id,
+            user_id=target_user.id,
+            role=target_role,
+        )
+        db.add(membership)
+    else:
+        membership.role = target_role
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=None,
+        action="org.member.upsert",
+        resource_type="organization_membership",
+        resource_id=f"{org_id}:{target_user.id}",
+        details={"email": target_user.email, "role": target_role},
+    )
+    db.commit()
+    return {
+        "org_id": org_id,
+        "user_id": target_user.id,
+        "email": target_user.email,
+        "role": membership.role,
+        "created_at": membership.created_at.isoformat() if membership.created_at else None,
+    }
 
 
-def list_organization_teams(user: User, org_id: int) -> list[dict[str, Any]]:
-    db = SessionLocal()
-    try:
-        _require_org_membership(db, user.id, org_id, min_role=OrganizationRole.MEMBER)
-        rows = (
-            db.query(Team)
-            .filter(Team.organization_id == org_id)
-            .order_by(Team.created_at.asc(), Team.id.asc())
-            .all()
-        )
-        return [
-            {
-                "id": team.id,
-                "organization_id": team.organization_id,
-                "name": team.name,
-                "description": team.description,
-                "created_at": team.created_at.isoformat() if team.created_at else None,
-            }
-            for team in rows
-        ]
-    finally:
-        db.close()
+def list_organization_teams(db: Session, user: User, org_id: int) -> list[dict[str, Any]]:
+    _require_org_membership(db, user.id, org_id, min_role=OrganizationRole.MEMBER)
+    rows = db.execute(_ORGANIZATION_TEAMS_STMT, {"org_id": org_id}).all()
+    return [
+        {
+            "id": team_id,
+            "organization_id": team_org_id,
+            "name": name,
+            "description": description,
+            "created_at": created_at.isoformat() if created_at else None,
+        }
+        for team_id, team_org_id, name, description, created_at in rows
+    ]
 
 
-def create_organization_team(user: User, org_id: int, name: str, description: str | None = None) -> dict[str, Any]:
+def create_organization_team(db: Session, user: User, org_id: int, name: str, description: str | None = None) -> dict[str, Any]:
     team_name = _normalize_kb_name(name)
     team_description = _normalize_kb_description(description)
-    db = SessionLocal()
-    try:
-        _require_org_membership(db, user.id, org_id, min_role=OrganizationRole.ADMIN)
-        team = Team(organization_id=org_id, name=team_name, description=team_description)
-        db.add(team)
-        db.flush()
-        db.add(
-            TeamMembership(
-                team_id=team.id,
-                user_id=user.id,
-                role=TeamRole.MANAGER,
-            )
-        )
-        log_audit_event(
-            db,
+    _require_org_membership(db, user.id, org_id, min_role=OrganizationRole.ADMIN)
+    team = Team(organization_id=org_id, name=team_name, description=team_description)
+    db.add(team)
+    db.flush()
+    db.add(
+        TeamMembership(
+            team_id=team.id,
             user_id=user.id,
-            knowledge_base_id=None,
-            action="team.create",
-            resource_type="team",
-            resource_id=str(team.id),
-            details={"organization_id": org_id, "name": team_name},
+            role=TeamRole.MANAGER,
         )
-        db.commit()
-        return {
-            "id": team.id,
-            "organization_id": team.organization_id,
-            "name": team.name,
-            "description": team.description,
-            "created_at": team.created_at.isoformat() if team.created_at else None,
-        }
-    finally:
-        db.close()
+    )
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=None,
+        action="team.create",
+        resource_type="team",
+        resource_id=str(team.id),
+        details={"organization_id": org_id, "name": team_name},
+    )
+    db.commit()
+    return {
+        "id": team.id,
+        "organization_id": team.organization_id,
+        "name": team.name,
+        "description": team.description,
+        "created_at": team.created_at.isoformat() if team.created_at else None,
+    }
 
 
-def add_team_member(user: User, team_id: int, email: str, role: str) -> dict[str, Any]:
+def add_team_member(db: Session, user: User, team_id: int, email: str, role: str) -> dict[str, Any]:
     target_role = _normalize_team_role(role)
-    db = SessionLocal()
-    try:
-        team = db.query(Team).filter(Team.id == team_id).first()
-        if team is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Team not found")
-        _require_org_membership(db, user.id, team.organization_id, min_role=OrganizationRole.ADMIN)
-
-        target_user = db.query(User).filter(User.email == email.strip().lower()).first()
-        if target_user is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User '{email}' not found.")
-
-        org_membership = (
-            db.query(OrganizationMembership)
-            .filter(
-                OrganizationMembership.organization_id == team.organization_id,
-                OrganizationMembership.user_id == target_user.id,
-            )
-            .first()
+    team = db.query(Team).filter(Team.id == team_id).first()
+    if team is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Team not found")
+    _require_org_membership(db, user.id, team.organization_id, min_role=OrganizationRole.ADMIN)
+
+    target_user = db.query(User).filter(User.email == email.strip().lower()).first()
+    if target_user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User '{email}' not found.")
+
+    # Both memberships are single-statement upserts: atomic under concurrent adds, one round trip each. An
+    # existing organization role is kept; the team role is overwritten.
+    db.execute(
+        pg_insert(OrganizationMembership)
+        .values(organization_id=team.organization_id, user_id=target_user.id, role=OrganizationRole.MEMBER)
+        .on_conflict_do_nothing(index_elements=[OrganizationMembership.organization_id, OrganizationMembership.user_id])
+    )
+    membership = db.execute(
+        pg_insert(TeamMembership)
+        .values(team_id=team_id, user_id=target_user.id, role=target_role)
+        .on_conflict_do_update(
+            index_elements=[TeamMembership.team_id, TeamMembership.user_id],
+            set_={"role": target_role},
         )
-        if org_membership is None:
-            org_membership = OrganizationMembership(
-                organization_id=team.organization_id,
-                user_id=target_user.id,
-                role=OrganizationRole.MEMBER,
-            )
-            db.add(org_membership)
+        .returning(TeamMembership.role, TeamMembership.created_at)
+    ).one()
 
-        membership = (
-            db.query(TeamMembership)
-            .filter(
-                TeamMembership.team_id == team_id,
-                TeamMembership.user_id == target_user.id,
-            )
-            .first()
-        )
-        if membership is None:
-            membership = TeamMembership(team_id=team_id, user_id=target_user.id, role=target_role)
-            db.add(membership)
-        else:
-            membership.role = target_role
-
-        log_audit_event(
-            db,
-            user_id=user.id,
-            knowledge_base_id=None,
-            action="team.member.upsert",
-            resource_type="team_membership",
-            resource_id=f"{team_id}:{target_user.id}",
-            details={"email": target_user.email, "role": target_role},
-        )
-        db.commit()
-        return {
-            "team_id": team_id,
-            "user_id": target_user.id,
-            "email": target_user.email,
-            "role": membership.role,
-            "created_at": membership.created_at.isoformat() if membership.created_at else None,
-        }
-    finally:
-        db.close()
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=None,
+        action="team.member.upsert",
+        resource_type="team_membership",
+        resource_id=f"{team_id}:{target_user.id}",
+        details={"email": target_user.email, "role": target_role},
+    )
+    db.commit()
+    return {
+        "team_id": team_id,
+        "user_id": target_user.id,
+        "email": target_user.email,
+        "role": membership.role,
+        "created_at": membership.created_at.isoformat() if membership.created_at else None,
+    }
 
 
-def assign_team_kb_access(user: User, team_id: int, kb_id: int, role: str) -> dict[str, Any]:
+def assign_team_kb_access(db: Session, user: User, team_id: int, kb_id: int, role: str) -> dict[str, Any]:
     target_role = _assert_valid_kb_role(role)
-    db = SessionLocal()
-    try:
-        team = db.query(Team).filter(Team.id == team_id).first()
-        if team is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Team not found")
-        _require_org_membership(db, user.id, team.organization_id, min_role=OrganizationRole.ADMIN)
-        require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
-
-        row = (
-            db.query(TeamKnowledgeBaseAccess)
-            .filter(
-                TeamKnowledgeBaseAccess.team_id == team_id,
-                TeamKnowledgeBaseAccess.knowledge_base_id == kb_id,
-            )
-            .first()
-        )
-        if row is None:
-            row = TeamKnowledgeBaseAccess(team_id=team_id, knowledge_base_id=kb_id, role=target_role)
-            db.add(row)
-        else:
-            row.role = target_role
+    team = db.query(Team).filter(Team.id == team_id).first()
+    if team is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Team not found")
+    _require_org_membership(db, user.id, team.organization_id, min_role=OrganizationRole.ADMIN)
+    require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
+
+    row = db.execute(
+        pg_insert(TeamKnowledgeBaseAccess)
+        .values(team_id=team_id, knowledge_base_id=kb_id, role=target_role)
+        .on_conflict_do_update(
+            index_elements=[TeamKnowledgeBaseAccess.team_id, TeamKnowledgeBaseAccess.knowledge_base_id],
+            set_={"role": target_role},
+        )
+        .returning(TeamKnowledgeBaseAccess.role, TeamKnowledgeBaseAccess.created_at)
+    ).one()
+
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=kb_id,
+        action="team.kb_access.upsert",
+        resource_type="team_kb_access",
+        resource_id=f"{team_id}:{kb_id}",
+        details={"team_id": team_id, "role": target_role},
+    )
+    db.commit()
+    return {
+        "team_id": team_id,
+        "kb_id": kb_id,
+        "role": row.role,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+    }
 
-        log_audit_event(
-            db,
-            user_id=user.id,
-            knowledge_base_id=kb_id,
-            action="team.kb_access.upsert",
-            resource_type="team_kb_access",
-            resource_id=f"{team_id}:{kb_id}",
-            details={"team_id": team_id, "role": target_role},
-        )
-        db.commit()
-        return {
-            "team_id": team_id,
-            "kb_id": kb_id,
-            "role": row.role,
-            "created_at": row.created_at.isoformat() if row.created_at else None,
+
+def list_kb_team_access(db: Session, user: User, kb_id: int) -> list[dict[str, Any]]:
+    require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.VIEWER)
+    rows = (
+        db.query(TeamKnowledgeBaseAccess, Team)
+        .join(Team, Team.id == TeamKnowledgeBaseAccess.team_id)
+        .filter(TeamKnowledgeBaseAccess.knowledge_base_id == kb_id)
+        .order_by(TeamKnowledgeBaseAccess.created_at.asc(), TeamKnowledgeBaseAccess.id.asc())
+        .all()
+    )
+    return [
+        {
+            "team_id": access.team_id,
+            "team_name": team.name,
+            "organization_id": team.organization_id,
+            "kb_id": access.knowledge_base_id,
+            "role": access.role,
+            "created_at": access.created_at.isoformat() if access.created_at else None,
         }
-    finally:
-        db.close()
+        for access, team in rows
+    ]
 
 
-def list_kb_team_access(user: User, kb_id: int) -> list[dict[str, Any]]:
-    db = SessionLocal()
-    try:
-        require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.VIEWER)
-        rows = (
-            db.query(TeamKnowledgeBaseAccess, Team)
-            .join(Team, Team.id == TeamKnowledgeBaseAccess.team_id)
-            .filter(TeamKnowledgeBaseAccess.knowledge_base_id == kb_id)
-            .order_by(TeamKnowledgeBaseAccess.created_at.asc(), TeamKnowledgeBaseAccess.id.asc())
-            .all()
-        )
-        return [
-            {
-                "team_id": access.team_id,
-                "team_name": team.name,
-                "organization_id": team.organization_id,
-                "kb_id": access.knowledge_base_id,
-                "role": access.role,
-                "created_at": access.created_at.isoformat() if access.created_at else None,
-            }
-            for access, team in rows
-        ]
-    finally:
-        db.close()
+def get_embedding_registry(db: Session, user: User, kb_id: int) -> dict[str, Any]:
+    require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
+    return list_embedding_registry(db, kb_id)
 
 
-def get_embedding_registry(user: User, kb_id: int) -> dict[str, Any]:
-    db = SessionLocal()
-    try:
-        require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
-        return list_embedding_registry(db, kb_id)
-    finally:
-        db.close()
-
-
-def start_embedding_migration_for_kb(user: User, kb_id: int, target_version: str) -> dict[str, Any]:
+def start_embedding_migration_for_kb(db: Session, user: User, kb_id: int, target_version: str) -> dict[str, Any]:
     version = normalize_embedding_version(target_version)
-    db = SessionLocal()
+    require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
+    namespace = start_embedding_migration(
+        db,
+        kb_id=kb_id,
+        target_version=version,
+        model_name=None,
+    )
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=kb_id,
+        action="embedding.migration.start",
+        resource_type="embedding_namespace",
+        resource_id=str(kb_id),
+        details={"target_version": version},
+    )
+    db.commit()
+
     try:
-        require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
-        namespace = start_embedding_migration(
+        queued = migrate_kb_embedding_namespace.delay(kb_id, version)
+        task_id = getattr(queued, "id", None)
+    except Exception as queue_err:
+        fail_embedding_migration(
             db,
             kb_id=kb_id,
-            target_version=version,
-            model_name=None,
-        )
-        log_audit_event(
-            db,
-            user_id=user.id,
-            knowledge_base_id=kb_id,
-            action="embedding.migration.start",
-            resource_type="embedding_namespace",
-            resource_id=str(kb_id),
-            details={"target_version": version},
+            error_message=str(queue_err),
         )
-        db.commit()
-
-        try:
-            queued = migrate_kb_embedding_namespace.delay(kb_id, version)
-            task_id = getattr(queued, "id", None)
-        except Exception as queue_err:
-            fail_embedding_migration(
-                db,
-                kb_id=kb_id,
-                error_message=str(queue_err),
-            )
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Failed to queue embedding migration job.",
-            ) from queue_err
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Failed to queue embedding migration job.",
+        ) from queue_err
 
-        return {
-            "kb_id": kb_id,
-            "active_version": namespace.active_version,
-            "target_version": namespace.target_version,
-            "migration_status": namespace.migration_status,
-            "migration_progress": namespace.migration_progress,
-            "task_id": task_id,
-        }
-    finally:
-        db.close()
+    return {
+        "kb_id": kb_id,
+        "active_version": namespace.active_version,
+        "target_version": namespace.target_version,
+        "migration_status": namespace.migration_status,
+        "migration_progress": namespace.migration_progress,
+        "task_id": task_id,
+    }
 
 
-def create_knowledge_base(user: User, name: str, description: str | None = None) -> dict[str, Any]:
+def create_knowledge_base(db: Session, user: User, name: str, description: str | None = None) -> dict[str, Any]:
     kb_name = _normalize_kb_name(name)
     kb_description = _normalize_kb_description(description)
-    db = SessionLocal()
-    try:
-        kb = KnowledgeBase(name=kb_name, description=kb_description)
-        db.add(kb)
-        db.flush()
-        db.add(
-            KnowledgeBaseMembership(
-                knowledge_base_id=kb.id,
-                user_id=user.id,
-                role=KnowledgeBaseRole.OWNER,
-            )
-        )
-        log_audit_event(
-            db,
-            user_id=user.id,
+    kb = KnowledgeBase(name=kb_name, description=kb_description)
+    db.add(kb)
+    db.flush()
+    db.add(
+        KnowledgeBaseMembership(
             knowledge_base_id=kb.id,
-            action="kb.create",
-            resource_type="knowledge_base",
-            resource_id=str(kb.id),
-            details={"name": kb_name},
+            user_id=user.id,
+            role=KnowledgeBaseRole.OWNER,
         )
-        db.commit()
-        return {
-            "id": kb.id,
-            "name": kb.name,
-            "description": kb.description,
-            "role": KnowledgeBaseRole.OWNER,
-        }
-    finally:
-        db.close()
-
+    )
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=kb.id,
+        action="kb.create",
+        resource_type="knowledge_base",
+        resource_id=str(kb.id),
+        details={"name": kb_name},
+    )
+    db.commit()
+    return {
+        "id": kb.id,
+        "name": kb.name,
+        "description": kb.description,
+        "role": KnowledgeBaseRole.OWNER,
+    }
 
-def update_knowledge_base(user: User, kb_id: int, name: str | None = None, description: str | None = None) -> dict[str, Any]:
-    db = SessionLocal()
-    try:
-        membership = require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
-        kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
-        if kb is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Knowledge base not found")
-
-        changed_fields: dict[str, Any] = {}
-        if name is not None:
-            kb.name = _normalize_kb_name(name)
-            changed_fields["name"] = kb.name
-        if description is not None:
-            kb.description = _normalize_kb_description(description)
-            changed_fields["description"] = kb.description
-        if not changed_fields:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Provide name and/or description to update.",
-            )
 
-        log_audit_event(
-            db,
-            user_id=user.id,
-            knowledge_base_id=kb_id,
-            action="kb.update",
-            resource_type="knowledge_base",
-            resource_id=str(kb_id),
-            details=changed_fields,
+def update_knowledge_base(db: Session, user: User, kb_id: int, name: str | None = None, description: str | None = None) -> dict[str, Any]:
+    membership = require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
+    kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
+    if kb is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Knowledge base not found")
+
+    changed_fields: dict[str, Any] = {}
+    if name is not None:
+        kb.name = _normalize_kb_name(name)
+        changed_fields["name"] = kb.name
+    if description is not None:
+        kb.description = _normalize_kb_description(description)
+        changed_fields["description"] = kb.description
+    if not changed_fields:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide name and/or description to update.",
         )
-        db.commit()
-        return {
-            "id": kb.id,
-            "name": kb.name,
-            "description": kb.description,
-            "role": membership.role,
-        }
-    finally:
-        db.close()
 
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=kb_id,
+        action="kb.update",
+        resource_type="knowledge_base",
+        resource_id=str(kb_id),
+        details=changed_fields,
+    )
+    db.commit()
+    return {
+        "id": kb.id,
+        "name": kb.name,
+        "description": kb.description,
+        "role": membership.role,
+    }
 
-def delete_knowledge_base(user: User, kb_id: int) -> dict[str, Any]:
-    db = SessionLocal()
-    try:
-        require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
-        kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
-        if kb is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Knowledge base not found")
-
-        processing_doc = (
-            db.query(Document)
-            .filter(Document.knowledge_base_id == kb_id, Document.status == DocumentStatus.PROCESSING)
-            .first()
-        )
-        if processing_doc is not None:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Cannot delete knowledge base while documents are processing.",
-            )
 
-        docs = db.query(Document).filter(Document.knowledge_base_id == kb_id).all()
-        deleted_docs = 0
-        for doc in docs:
-            try:
-                delete_document_chunks(kb_id=kb_id, doc_id=doc.id)
-            except Exception as cleanup_err:
-                raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail=f"Failed to remove vector chunks for document {doc.id}: {cleanup_err}",
-                ) from cleanup_err
-            try:
-                delete_file(doc.object_key)
-            except Exception as storage_err:
-                logger.warning("KB delete storage cleanup skipped for document_id=%s: %s", doc.id, storage_err)
-            db.delete(doc)
-            deleted_docs += 1
-
-        session_ids = [
-            sid
-            for (sid,) in db.query(ChatSession.id).filter(ChatSession.knowledge_base_id == kb_id).all()
-        ]
-        if session_ids:
-            db.query(ChatMessage).filter(ChatMessage.session_id.in_(session_ids)).delete(synchronize_session=False)
-        deleted_jobs = (
-            db.query(ChatJob)
-            .filter(ChatJob.knowledge_base_id == kb_id)
-            .delete(synchronize_session=False)
-        )
-        deleted_sessions = (
-            db.query(ChatSession)
-            .filter(ChatSession.knowledge_base_id == kb_id)
-            .delete(synchronize_session=False)
-        )
-        db.query(KnowledgeBaseMembership).filter(
-            KnowledgeBaseMembership.knowledge_base_id == kb_id
-        ).delete(synchronize_session=False)
-        db.delete(kb)
-        log_audit_event(
-            db,
-            user_id=user.id,
-            knowledge_base_id=kb_id,
-            action="kb.delete",
-            resource_type="knowledge_base",
-            resource_id=str(kb_id),
-            details={
-                "name": kb.name,
-                "documents_deleted": deleted_docs,
-                "chat_jobs_deleted": int(deleted_jobs or 0),
-                "chat_sessions_deleted": int(deleted_sessions or 0),
-            },
+def delete_knowledge_base(db: Session, user: User, kb_id: int) -> dict[str, Any]:
+    require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
+    kb = db.query(KnowledgeBase).filter(KnowledgeBase.id == kb_id).first()
+    if kb is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Knowledge base not found")
+
+    processing = db.scalar(
+        select(exists().where(Document.knowledge_base_id == kb_id, Document.status == DocumentStatus.PROCESSING))
+    )
+    if processing:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Cannot delete knowledge base while documents are processing.",
         )
-        db.commit()
-    finally:
-        db.close()
 
+    # Every point in the KB's collections belongs to this KB, so the vectors go with one collection drop per
+    # embedding version instead of a filtered delete per document.
     try:
         delete_all_collections_for_kb(kb_id=kb_id)
-    except Exception as exc:
-        logger.warning("KB collection cleanup skipped for kb_id=%s: %s", kb_id, exc)
+    except Exception as cleanup_err:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Failed to remove vector collections for knowledge base {kb_id}: {cleanup_err}",
+        ) from cleanup_err
+    object_keys = [key for (key,) in db.query(Document.object_key).filter(Document.knowledge_base_id == kb_id).all()]
+    delete_files(object_keys)
+    deleted_docs = (
+        db.query(Document)
+        .filter(Document.knowledge_base_id == kb_id)
+        .delete(synchronize_session=False)
+    )
+
+    # Messages go by subquery and sessions report their ids via RETURNING (needed to drop cached history), so
+    # session ids never make a round trip through Python.
+    kb_sessions = select(ChatSession.id).where(ChatSession.knowledge_base_id == kb_id)
+    db.query(ChatMessage).filter(ChatMessage.session_id.in_(kb_sessions)).delete(synchronize_session=False)
+    deleted_jobs = (
+        db.query(ChatJob)
+        .filter(ChatJob.knowledge_base_id == kb_id)
+        .delete(synchronize_session=False)
+    )
+    session_ids = db.scalars(
+        delete(ChatSession).where(ChatSession.knowledge_base_id == kb_id).returning(ChatSession.id),
+        execution_options={"synchronize_session": False},
+    ).all()
+    deleted_sessions = len(session_ids)
+    db.query(KnowledgeBaseMembership).filter(
+        KnowledgeBaseMembership.knowledge_base_id == kb_id
+    ).delete(synchronize_session=False)
+    db.delete(kb)
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=kb_id,
+        action="kb.delete",
+        resource_type="knowledge_base",
+        resource_id=str(kb_id),
+        details={
+            "name": kb.name,
+            "documents_deleted": int(deleted_docs or 0),
+            "chat_jobs_deleted": int(deleted_jobs or 0),
+            "chat_sessions_deleted": int(deleted_sessions or 0),
+        },
+    )
+    db.commit()
+    forget_history_sync(*session_ids)
     return {"message": "Knowledge base deleted.", "kb_id": kb_id}
 
 
-def list_audit_logs(user: User, kb_id: int, limit: int = 100, action: str | None = None) -> list[dict[str, Any]]:
-    db = SessionLocal()
-    try:
-        require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
-        safe_limit = max(1, min(500, limit))
-        q = (
-            db.query(AuditLog)
-            .filter(AuditLog.knowledge_base_id == kb_id)
-            .order_by(desc(AuditLog.created_at), desc(AuditLog.id))
-        )
-        if action:
-            q = q.filter(AuditLog.action == action.strip())
-        rows = q.limit(safe_limit).all()
-        user_ids = {row.user_id for row in rows if row.user_id is not None}
-        user_by_id = {}
-        if user_ids:
-            user_rows = db.query(User).filter(User.id.in_(user_ids)).all()
-            user_by_id = {u.id: u.email for u in user_rows}
-        return [
-            {
-                "id": row.id,
-                "kb_id": row.knowledge_base_id,
-                "user_id": row.user_id,
-                "user_email": user_by_id.get(row.user_id),
-                "action": row.action,
-                "resource_type": row.resource_type,
-                "resource_id": row.resource_id,
-                "details": parse_details(row.details_json),
-                "created_at": row.created_at.isoformat() if row.created_at else None,
-            }
-            for row in rows
-        ]
-    finally:
-        db.close()
+def list_audit_logs(
+    db: Session,
+    user: User,
+    kb_id: int,
+    limit: int = 100,
+    action: str | None = None,
+    include_details: bool = True,
+) -> list[dict[str, Any]]:
+    """Newest audit rows for a KB with the actor's email joined in.
+
+    `details_json` is the bulk of each row; with `include_details=False` it is never selected and `details` is None.
+    """
+    require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
+    safe_limit = max(1, min(500, limit))
+    details_column = AuditLog.details_json if include_details else null()
+    stmt = (
+        select(
+            AuditLog.id,
+            AuditLog.user_id,
+            User.email,
+            AuditLog.action,
+            AuditLog.resource_type,
+            AuditLog.resource_id,
+            details_column.label("details_json"),
+            AuditLog.created_at,
+        )
+        .outerjoin(User, User.id == AuditLog.user_id)
+        .where(AuditLog.knowledge_base_id == kb_id)
+        .order_by(desc(AuditLog.created_at), desc(AuditLog.id))
+        .limit(safe_limit)
+    )
+    if action:
+        stmt = stmt.where(AuditLog.action == action.strip())
+    return [
+        {
+            "id": row.id,
+            "kb_id": kb_id,
+            "user_id": row.user_id,
+            "user_email": row.email,
+            "action": row.action,
+            "resource_type": row.resource_type,
+            "resource_id": row.resource_id,
+            "details": parse_details(row.details_json),
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+        }
+        for row in db.execute(stmt)
+    ]
 
 
-def get_document_status(user: User, document_id: int) -> dict | None:
-    db = SessionLocal()
-    try:
-        doc = db.query(Document).filter(Document.id == document_id).first()
-        if not doc:
-            return None
-        require_kb_access(db, user.id, doc.knowledge_base_id, min_role=KnowledgeBaseRole.VIEWER)
-        return {"document_id": doc.id, "filename": doc.filename, "status": doc.status, "error_message": doc.error_message}
-    finally:
-        db.close()
+def get_document_status(db: Session, user: User, document_id: int) -> dict | None:
+    doc = db.query(Document).filter(Document.id == document_id).first()
+    if not doc:
+        return None
+    require_kb_access(db, user.id, doc.knowledge_base_id, min_role=KnowledgeBaseRole.VIEWER)
+    return {"document_id": doc.id, "filename": doc.filename, "status": doc.status, "error_message": doc.error_message}
 
 
-def list_documents(user: User, kb_id: int | None = None) -> list[dict[str, Any]]:
-    kb = _resolve_kb_for_user(user, kb_id, min_role=KnowledgeBaseRole.VIEWER)
-    db = SessionLocal()
-    try:
-        docs = (
-            db.query(Document)
-            .filter(Document.knowledge_base_id == kb)
-            .order_by(Document.created_at.desc(), Document.id.desc())
-            .all()
-        )
-        return [
-            {
-                "document_id": d.id,
-                "kb_id": d.knowledge_base_id,
-                "filename": d.filename,
-                "status": d.status,
-                "error_message": d.error_message,
-                "created_at": d.created_at.isoformat() if d.created_at else None,
-            }
-            for d in docs
-        ]
-    finally:
-        db.close()
+def list_documents(db: Session, user: User, kb_id: int | None = None) -> list[dict[str, Any]]:
+    kb = _resolve_kb_in_session(db, user.id, kb_id, min_role=KnowledgeBaseRole.VIEWER)
+    docs = (
+        db.query(Document)
+        .filter(Document.knowledge_base_id == kb)
+        .order_by(Document.created_at.desc(), Document.id.desc())
+        .all()
+    )
+    return [
+        {
+            "document_id": d.id,
+            "kb_id": d.knowledge_base_id,
+            "filename": d.filename,
+            "status": d.status,
+            "error_message": d.error_message,
+            "created_at": d.created_at.isoformat() if d.created_at else None,
+        }
+        for d in docs
+    ]
 
 
 def list_ingestion_dead_letters(
+    db: Session,
     user: User,
     kb_id: int,
     limit: int = 100,
     resolved: bool = False,
 ) -> list[dict[str, Any]]:
-    db = SessionLocal()
-    try:
-        require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.EDITOR)
-        return list_dead_letters(
-            db,
-            knowledge_base_id=kb_id,
-            limit=limit,
-            resolved=resolved,
-        )
-    finally:
-        db.close()
+    require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.EDITOR)
+    return list_dead_letters(
+        db,
+        knowledge_base_id=kb_id,
+        limit=limit,
+        resolved=resolved,
+    )
 
 
-def retry_ingestion_dead_letter(user: User, dead_letter_id: int) -> dict[str, Any]:
-    db = SessionLocal()
-    try:
-        row = db.query(IngestionDeadLetter).filter(IngestionDeadLetter.id == dead_letter_id).first()
-        if row is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dead-letter entry not found")
-
-        require_kb_access(db, user.id, row.knowledge_base_id, min_role=KnowledgeBaseRole.EDITOR)
-        doc = db.query(Document).filter(Document.id == row.document_id).first()
-        if doc is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
-        if doc.status == DocumentStatus.PROCESSING:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Document is currently processing. Retry is blocked until processing finishes.",
-            )
+def retry_ingestion_dead_letter(db: Session, user: User, dead_letter_id: int) -> dict[str, Any]:
+    row = db.query(IngestionDeadLetter).filter(IngestionDeadLetter.id == dead_letter_id).first()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dead-letter entry not found")
 
-        doc.status = DocumentStatus.PENDING
-        doc.error_message = None
-        row.retry_count = int(row.retry_count or 0) + 1
-        row.updated_at = datetime.utcnow()
-        log_audit_event(
-            db,
-            user_id=user.id,
-            knowledge_base_id=row.knowledge_base_id,
-            action="document.dlq.retry",
-            resource_type="ingestion_dead_letter",
-            resource_id=str(row.id),
-            details={"document_id": row.document_id},
+    require_kb_access(db, user.id, row.knowledge_base_id, min_role=KnowledgeBaseRole.EDITOR)
+    doc = db.query(Document).filter(Document.id == row.document_id).first()
+    if doc is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    if doc.status == DocumentStatus.PROCESSING:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Document is currently processing. Retry is blocked until processing finishes.",
         )
-        db.commit()
 
-        job_id = _queue_document_ingestion_job(
-            db,
-            user_id=user.id,
-            kb_id=row.knowledge_base_id,
-            document_id=row.document_id,
-            reason=IngestionJobReason.RETRY,
-        )
-        return {
-            "dead_letter_id": row.id,
-            "document_id": row.document_id,
-            "kb_id": row.knowledge_base_id,
-            "ingestion_job_id": job_id,
-            "message": "Dead-letter retry queued.",
-        }
-    finally:
-        db.close()
+    doc.status = DocumentStatus.PENDING
+    doc.error_message = None
+    row.retry_count = int(row.retry_count or 0) + 1
+    row.updated_at = datetime.utcnow()
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=row.knowledge_base_id,
+        action="document.dlq.retry",
+        resource_type="ingestion_dead_letter",
+        resource_id=str(row.id),
+        details={"document_id": row.document_id},
+    )
+    db.commit()
+
+    job_id = _queue_document_ingestion_job(
+        db,
+        user_id=user.id,
+        kb_id=row.knowledge_base_id,
+        document_id=row.document_id,
+        reason=IngestionJobReason.RETRY,
+    )
+    return {
+        "dead_letter_id": row.id,
+        "document_id": row.document_id,
+        "kb_id": row.knowledge_base_id,
+        "ingestion_job_id": job_id,
+        "message": "Dead-letter retry queued.",
+    }
 
 
-def get_connector_sync_cursor(user: User, kb_id: int, source_type: str, scope_key: str) -> dict[str, Any]:
-    db = SessionLocal()
-    try:
-        require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.EDITOR)
-        row = get_connector_sync_state(
-            db,
-            knowledge_base_id=kb_id,
-            source_type=(source_type or "").strip(),
-            scope_key=(scope_key or "").strip(),
-        )
-        if row is None:
-            return {
-                "kb_id": kb_id,
-                "source_type": source_type,
-                "scope_key": scope_key,
-                "cursor": None,
-                "last_synced_at": None,
-                "last_success_at": None,
-                "last_error": None,
-            }
+def get_connector_sync_cursor(db: Session, user: User, kb_id: int, source_type: str, scope_key: str) -> dict[str, Any]:
+    require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.EDITOR)
+    row = get_connector_sync_state(
+        db,
+        knowledge_base_id=kb_id,
+        source_type=(source_type or "").strip(),
+        scope_key=(scope_key or "").strip(),
+    )
+    if row is None:
         return {
-            "kb_id": row.knowledge_base_id,
-            "source_type": row.source_type,
-            "scope_key": row.scope_key,
-            "cursor": row.cursor,
-            "last_synced_at": row.last_synced_at.isoformat() if row.last_synced_at else None,
-            "last_success_at": row.last_success_at.isoformat() if row.last_success_at else None,
-            "last_error": row.last_error,
+            "kb_id": kb_id,
+            "source_type": source_type,
+            "scope_key": scope_key,
+            "cursor": None,
+            "last_synced_at": None,
+            "last_success_at": None,
+            "last_error": None,
         }
-    finally:
-        db.close()
+    return {
+        "kb_id": row.knowledge_base_id,
+        "source_type": row.source_type,
+        "scope_key": row.scope_key,
+        "cursor": row.cursor,
+        "last_synced_at": row.last_synced_at.isoformat() if row.last_synced_at else None,
+        "last_success_at": row.last_success_at.isoformat() if row.last_success_at else None,
+        "last_error": row.last_error,
+    }
 
 
 def upsert_connector_sync_cursor(
+    db: Session,
     user: User,
     kb_id: int,
     source_type: str,
@@ -2132,313 +2310,285 @@ def upsert_connector_sync_cursor(
     successful: bool = True,
     error: str | None = None,
 ) -> dict[str, Any]:
-    db = SessionLocal()
-    try:
-        require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.EDITOR)
-        row = mark_connector_sync(
-            db,
-            knowledge_base_id=kb_id,
-            source_type=(source_type or "").strip(),
-            scope_key=(scope_key or "").strip(),
-            cursor=cursor,
-            synced_at=last_synced_at,
-            error=error,
-            successful=successful,
-        )
-        return {
-            "kb_id": row.knowledge_base_id,
-            "source_type": row.source_type,
-            "scope_key": row.scope_key,
-            "cursor": row.cursor,
-            "last_synced_at": row.last_synced_at.isoformat() if row.last_synced_at else None,
-            "last_success_at": row.last_success_at.isoformat() if row.last_success_at else None,
-            "last_error": row.last_error,
-        }
-    finally:
-        db.close()
+    require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.EDITOR)
+    row = mark_connector_sync(
+        db,
+        knowledge_base_id=kb_id,
+        source_type=(source_type or "").strip(),
+        scope_key=(scope_key or "").strip(),
+        cursor=cursor,
+        synced_at=last_synced_at,
+        error=error,
+        successful=successful,
+    )
+    return {
+        "kb_id": row.knowledge_base_id,
+        "source_type": row.source_type,
+        "scope_key": row.scope_key,
+        "cursor": row.cursor,
+        "last_synced_at": row.last_synced_at.isoformat() if row.last_synced_at else None,
+        "last_success_at": row.last_success_at.isoformat() if row.last_success_at else None,
+        "last_error": row.last_error,
+    }
 
 
-def rename_document(user: User, document_id: int, filename: str) -> dict[str, Any]:
+def rename_document(db: Session, user: User, document_id: int, filename: str) -> dict[str, Any]:
     new_filename = _normalize_document_filename(filename)
     new_filename_key = _document_filename_key(new_filename)
-    db = SessionLocal()
-    try:
-        doc = db.query(Document).filter(Document.id == document_id).first()
-        if doc is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
-        require_kb_access(db, user.id, doc.knowledge_base_id, min_role=KnowledgeBaseRole.EDITOR)
-
-        conflict = (
-            db.query(Document)
-            .filter(
+    doc = db.query(Document).filter(Document.id == document_id).first()
+    if doc is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    require_kb_access(db, user.id, doc.knowledge_base_id, min_role=KnowledgeBaseRole.EDITOR)
+
+    conflict = db.scalar(
+        select(
+            exists().where(
                 Document.knowledge_base_id == doc.knowledge_base_id,
                 func.lower(Document.filename) == new_filename_key,
                 Document.id != doc.id,
             )
-            .first()
-        )
-        if conflict is not None:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Another document with the same filename already exists in this knowledge base.",
-            )
-        if doc.filename == new_filename:
-            return {
-                "document_id": doc.id,
-                "kb_id": doc.knowledge_base_id,
-                "filename": doc.filename,
-                "status": doc.status,
-                "message": "Filename unchanged. No re-indexing queued.",
-            }
-        if doc.status == DocumentStatus.PROCESSING:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Document is currently processing. Rename is blocked until processing finishes.",
-            )
-
-        old_filename = doc.filename
-        doc.filename = new_filename
-        doc.status = DocumentStatus.PENDING
-        doc.error_message = None
-        log_audit_event(
-            db,
-            user_id=user.id,
-            knowledge_base_id=doc.knowledge_base_id,
-            action="document.rename",
-            resource_type="document",
-            resource_id=str(doc.id),
-            details={"from": old_filename, "to": new_filename},
         )
-        db.commit()
-        db.refresh(doc)
-
-        try:
-            delete_document_chunks(kb_id=doc.knowledge_base_id, doc_id=doc.id)
-        except Exception as cleanup_err:
-            logger.warning(
-                "Rename pre-cleanup skipped for kb_id=%s document_id=%s: %s",
-                doc.knowledge_base_id,
-                doc.id,
-                cleanup_err,
-            )
-
-        job_id = _queue_document_ingestion_job(
-            db,
-            user_id=user.id,
-            kb_id=doc.knowledge_base_id,
-            document_id=doc.id,
-            reason=IngestionJobReason.REINDEX,
+    )
+    if conflict:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Another document with the same filename already exists in this knowledge base.",
         )
-
+    if doc.filename == new_filename:
         return {
             "document_id": doc.id,
             "kb_id": doc.knowledge_base_id,
             "filename": doc.filename,
             "status": doc.status,
-            "ingestion_job_id": job_id,
-            "message": "Document renamed and re-indexing queued.",
+            "message": "Filename unchanged. No re-indexing queued.",
         }
-    finally:
-        db.close()
+    if doc.status == DocumentStatus.PROCESSING:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Document is currently processing. Rename is blocked until processing finishes.",
+        )
 
+    old_filename = doc.filename
+    doc.filename = new_filename
+    doc.status = DocumentStatus.PENDING
+    doc.error_message = None
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=doc.knowledge_base_id,
+        action="document.rename",
+        resource_type="document",
+        resource_id=str(doc.id),
+        details={"from": old_filename, "to": new_filename},
+    )
+    db.commit()
+    db.refresh(doc)
 
-def retry_document_ingestion(user: User, document_id: int) -> dict[str, Any]:
-    db = SessionLocal()
     try:
-        doc = db.query(Document).filter(Document.id == document_id).first()
-        if doc is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
-        require_kb_access(db, user.id, doc.knowledge_base_id, min_role=KnowledgeBaseRole.EDITOR)
-        if doc.status == DocumentStatus.PROCESSING:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Document is currently processing. Retry is blocked until processing finishes.",
-            )
-        previous_status = doc.status
-        doc.status = DocumentStatus.PENDING
-        doc.error_message = None
-        log_audit_event(
-            db,
-            user_id=user.id,
-            knowledge_base_id=doc.knowledge_base_id,
-            action="document.retry",
-            resource_type="document",
-            resource_id=str(doc.id),
-            details={"filename": doc.filename, "previous_status": previous_status},
-        )
-        db.commit()
-        job_id = _queue_document_ingestion_job(
-            db,
-            user_id=user.id,
-            kb_id=doc.knowledge_base_id,
-            document_id=doc.id,
-            reason=IngestionJobReason.RETRY,
+        delete_document_chunks(kb_id=doc.knowledge_base_id, doc_id=doc.id)
+    except Exception as cleanup_err:
+        logger.warning(
+            "Rename pre-cleanup skipped for kb_id=%s document_id=%s: %s",
+            doc.knowledge_base_id,
+            doc.id,
+            cleanup_err,
         )
-        return {
-            "document_id": doc.id,
-            "kb_id": doc.knowledge_base_id,
-            "filename": doc.filename,
-            "status": doc.status,
-            "ingestion_job_id": job_id,
-            "message": "Document retry queued.",
-        }
-    finally:
-        db.close()
-
 
-def delete_document(user: User, document_id: int) -> dict[str, Any]:
-    db = SessionLocal()
-    try:
-        doc = db.query(Document).filter(Document.id == document_id).first()
-        if doc is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
-        require_kb_access(db, user.id, doc.knowledge_base_id, min_role=KnowledgeBaseRole.EDITOR)
-        if doc.status == DocumentStatus.PROCESSING:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Document is currently processing. Delete is blocked until processing finishes.",
-            )
+    job_id = _queue_document_ingestion_job(
+        db,
+        user_id=user.id,
+        kb_id=doc.knowledge_base_id,
+        document_id=doc.id,
+        reason=IngestionJobReason.REINDEX,
+    )
 
-        try:
-            delete_document_chunks(kb_id=doc.knowledge_base_id, doc_id=doc.id)
-        except Exception as cleanup_err:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail=f"Failed to remove document chunks from vector store: {cleanup_err}",
-            ) from cleanup_err
+    return {
+        "document_id": doc.id,
+        "kb_id": doc.knowledge_base_id,
+        "filename": doc.filename,
+        "status": doc.status,
+        "ingestion_job_id": job_id,
+        "message": "Document renamed and re-indexing queued.",
+    }
 
-        delete_file(doc.object_key)
 
-        payload = {"message": "Document deleted.", "document_id": doc.id}
-        log_audit_event(
-            db,
-            user_id=user.id,
-            knowledge_base_id=doc.knowledge_base_id,
-            action="document.delete",
-            resource_type="document",
-            resource_id=str(doc.id),
-            details={"filename": doc.filename},
+def retry_document_ingestion(db: Session, user: User, document_id: int) -> dict[str, Any]:
+    doc = db.query(Document).filter(Document.id == document_id).first()
+    if doc is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    require_kb_access(db, user.id, doc.knowledge_base_id, min_role=KnowledgeBaseRole.EDITOR)
+    if doc.status == DocumentStatus.PROCESSING:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Document is currently processing. Retry is blocked until processing finishes.",
         )
-        db.delete(doc)
-        db.commit()
-        return payload
-    finally:
-        db.close()
+    previous_status = doc.status
+    doc.status = DocumentStatus.PENDING
+    doc.error_message = None
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=doc.knowledge_base_id,
+        action="document.retry",
+        resource_type="document",
+        resource_id=str(doc.id),
+        details={"filename": doc.filename, "previous_status": previous_status},
+    )
+    db.commit()
+    job_id = _queue_document_ingestion_job(
+        db,
+        user_id=user.id,
+        kb_id=doc.knowledge_base_id,
+        document_id=doc.id,
+        reason=IngestionJobReason.RETRY,
+    )
+    return {
+        "document_id": doc.id,
+        "kb_id": doc.knowledge_base_id,
+        "filename": doc.filename,
+        "status": doc.status,
+        "ingestion_job_id": job_id,
+        "message": "Document retry queued.",
+    }
 
 
-def list_chat_sessions(user: User, kb_id: int | None = None) -> list[dict]:
-    db = SessionLocal()
+def delete_document(db: Session, user: User, document_id: int) -> dict[str, Any]:
+    doc = db.query(Document).filter(Document.id == document_id).first()
+    if doc is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    require_kb_access(db, user.id, doc.knowledge_base_id, min_role=KnowledgeBaseRole.EDITOR)
+    if doc.status == DocumentStatus.PROCESSING:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Document is currently processing. Delete is blocked until processing finishes.",
+        )
+
     try:
-        kb_filter = None
-        if kb_id is not None:
-            require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.VIEWER)
-            kb_filter = kb_id
-
-        q = db.query(ChatSession).filter(ChatSession.user_id == user.id)
-        if kb_filter is not None:
-            q = q.filter(ChatSession.knowledge_base_id == kb_filter)
-        sessions = q.order_by(desc(ChatSession.updated_at), desc(ChatSession.created_at)).all()
-
-        out = []
-        for s in sessions:
-            latest = (
-                db.query(ChatMessage)
-                .filter(ChatMessage.session_id == s.id)
-                .order_by(desc(ChatMessage.id))
-                .first()
-            )
-            count = db.query(ChatMessage).filter(ChatMessage.session_id == s.id).count()
-            out.append(
-                {
-                    "session_id": s.id,
-                    "kb_id": s.knowledge_base_id,
-                    "created_at": s.created_at.isoformat(),
-                    "updated_at": s.updated_at.isoformat(),
-                    "message_count": count,
-                    "last_message_preview": (latest.content[:140] + "...") if latest and len(latest.content) > 140 else (latest.content if latest else ""),
-                }
-            )
-        return out
-    finally:
-        db.close()
+        delete_document_chunks(kb_id=doc.knowledge_base_id, doc_id=doc.id)
+    except Exception as cleanup_err:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Failed to remove document chunks from vector store: {cleanup_err}",
+        ) from cleanup_err
 
+    delete_file(doc.object_key)
 
-def get_chat_session(user: User, session_id: str, limit: int = 100) -> dict:
-    db = SessionLocal()
-    try:
-        session = (
-            db.query(ChatSession)
-            .filter(ChatSession.id == session_id, ChatSession.user_id == user.id)
-            .first()
-        )
-        if session is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
-        require_kb_access(db, user.id, session.knowledge_base_id, min_role=KnowledgeBaseRole.VIEWER)
-        rows = (
-            db.query(ChatMessage)
-            .filter(ChatMessage.session_id == session.id)
-            .order_by(desc(ChatMessage.id))
-            .limit(limit)
-            .all()
-        )
-        assistant_ids = [m.id for m in rows if m.role == ChatRole.ASSISTANT]
-        feedback_by_message: dict[int, str] = {}
-        if assistant_ids:
-            feedback_rows = (
-                db.query(ChatFeedback.chat_message_id, ChatFeedback.rating)
-                .filter(
-                    ChatFeedback.user_id == user.id,
-                    ChatFeedback.chat_message_id.in_(assistant_ids),
-                )
-                .all()
-            )
-            feedback_by_message = {int(mid): rating for mid, rating in feedback_rows}
-        messages = [
+    payload = {"message": "Document deleted.", "document_id": doc.id}
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=doc.knowledge_base_id,
+        action="document.delete",
+        resource_type="document",
+        resource_id=str(doc.id),
+        details={"filename": doc.filename},
+    )
+    db.delete(doc)
+    db.commit()
+    return payload
+
+
+def list_chat_sessions(db: Session, user: User, kb_id: int | None = None) -> list[dict]:
+    kb_filter = None
+    if kb_id is not None:
+        require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.VIEWER)
+        kb_filter = kb_id
+
+    session_filters = [ChatSession.user_id == user.id]
+    if kb_filter is not None:
+        session_filters.append(ChatSession.knowledge_base_id == kb_filter)
+
+    # One query: per-session message count and latest message via window functions.
+    ranked = (
+        select(
+            ChatMessage.session_id.label("session_id"),
+            # Only the preview window crosses the wire; one extra char tells us whether to add "...".
+            func.substr(ChatMessage.content, 1, _PREVIEW_CHARS + 1).label("preview"),
+            func.row_number()
+            .over(partition_by=ChatMessage.session_id, order_by=desc(ChatMessage.id))
+            .label("rn"),
+            func.count().over(partition_by=ChatMessage.session_id).label("message_count"),
+        )
+        .join(ChatSession, ChatSession.id == ChatMessage.session_id)
+        .where(*session_filters)
+        .subquery()
+    )
+    rows = db.execute(
+        select(ChatSession, ranked.c.preview, ranked.c.message_count)
+        .outerjoin(ranked, and_(ranked.c.session_id == ChatSession.id, ranked.c.rn == 1))
+        .where(*session_filters)
+        .order_by(desc(ChatSession.updated_at), desc(ChatSession.created_at))
+    ).all()
+
+    out = []
+    for s, preview, count in rows:
+        preview = preview or ""
+        out.append(
             {
-                "id": m.id,
-                "role": m.role,
-                "content": m.content,
-                "created_at": m.created_at.isoformat(),
-                "feedback_rating": feedback_by_message.get(m.id),
+                "session_id": s.id,
+                "kb_id": s.knowledge_base_id,
+                "created_at": s.created_at.isoformat(),
+                "updated_at": s.updated_at.isoformat(),
+                "message_count": int(count or 0),
+                "last_message_preview": (
+                    (preview[:_PREVIEW_CHARS] + "...") if len(preview) > _PREVIEW_CHARS else preview
+                ),
             }
-            for m in reversed(rows)
-        ]
-        return {
-            "session_id": session.id,
-            "kb_id": session.knowledge_base_id,
-            "created_at": session.created_at.isoformat(),
-            "updated_at": session.updated_at.isoformat(),
-            "messages": messages,
+        )
+    return out
+
+
+def get_chat_session(db: Session, user: User, session_id: str, limit: int = 100) -> dict:
+    session = (
+        db.query(ChatSession)
+        .filter(ChatSession.id == session_id, ChatSession.user_id == user.id)
+        .first()
+    )
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+    require_kb_access(db, user.id, session.knowledge_base_id, min_role=KnowledgeBaseRole.VIEWER)
+    rows = db.execute(_SESSION_MESSAGES_STMT, {"session_id": session.id, "user_id": user.id, "limit": limit}).all()
+    messages = [
+        {
+            "id": message_id,
+            "role": role,
+            "content": content,
+            "created_at": created_at.isoformat(),
+            "feedback_rating": rating if role == ChatRole.ASSISTANT else None,
         }
-    finally:
-        db.close()
+        for message_id, role, content, created_at, rating in reversed(rows)
+    ]
+    return {
+        "session_id": session.id,
+        "kb_id": session.knowledge_base_id,
+        "created_at": session.created_at.isoformat(),
+        "updated_at": session.updated_at.isoformat(),
+        "messages": messages,
+    }
 
 
-def delete_chat_session(user: User, session_id: str) -> dict:
-    db = SessionLocal()
-    try:
-        session = (
-            db.query(ChatSession)
-            .filter(ChatSession.id == session_id, ChatSession.user_id == user.id)
-            .first()
-        )
-        if session is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
-        require_kb_access(db, user.id, session.knowledge_base_id, min_role=KnowledgeBaseRole.VIEWER)
-        log_audit_event(
-            db,
-            user_id=user.id,
-            knowledge_base_id=session.knowledge_base_id,
-            action="chat.session.delete",
-            resource_type="chat_session",
-            resource_id=session.id,
-            details=None,
-        )
-        db.delete(session)
-        db.commit()
-        return {"message": "Session deleted."}
-    finally:
-        db.close()
+def delete_chat_session(db: Session, user: User, session_id: str) -> dict:
+    session = (
+        db.query(ChatSession)
+        .filter(ChatSession.id == session_id, ChatSession.user_id == user.id)
+        .first()
+    )
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+    require_kb_access(db, user.id, session.knowledge_base_id, min_role=KnowledgeBaseRole.VIEWER)
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=session.knowledge_base_id,
+        action="chat.session.delete",
+        resource_type="chat_session",
+        resource_id=session.id,
+        details=None,
+    )
+    db.delete(session)
+    db.commit()
+    forget_history_sync(session_id)
+    return {"message": "Session deleted."}
 
 
 def _assert_valid_kb_role(role: str) -> str:
@@ -2452,169 +2602,146 @@ def _assert_valid_kb_role(role: str) -> str:
 
 
 def _count_kb_owners(db, kb_id: int) -> int:
-    return (
-        db.query(KnowledgeBaseMembership)
-        .filter(
-            KnowledgeBaseMembership.knowledge_base_id == kb_id,
-            KnowledgeBaseMembership.role == KnowledgeBaseRole.OWNER,
-        )
-        .count()
-    )
-
-
-def list_kb_members(user: User, kb_id: int) -> list[dict]:
-    db = SessionLocal()
-    try:
-        require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.VIEWER)
-        rows = (
-            db.query(KnowledgeBaseMembership, User)
-            .join(User, User.id == KnowledgeBaseMembership.user_id)
-            .filter(KnowledgeBaseMembership.knowledge_base_id == kb_id)
-            .order_by(KnowledgeBaseMembership.created_at.asc())
-            .all()
-        )
-        return [
-            {
-                "kb_id": kb_id,
-                "user_id": u.id,
-                "email": u.email,
-                "role": m.role,
-                "created_at": m.created_at.isoformat(),
-            }
-            for m, u in rows
-        ]
-    finally:
-        db.close()
+    return db.scalar(_KB_OWNER_COUNT_STMT, {"kb_id": kb_id}) or 0
 
 
-def add_kb_member(user: User, kb_id: int, email: str, role: str) -> dict:
-    db = SessionLocal()
-    try:
-        require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
-        target_role = _assert_valid_kb_role(role)
-        target_user = db.query(User).filter(User.email == email).first()
-        if target_user is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"User '{email}' not found. User must register before being added.",
-            )
-        membership = (
-            db.query(KnowledgeBaseMembership)
-            .filter(
-                KnowledgeBaseMembership.knowledge_base_id == kb_id,
-                KnowledgeBaseMembership.user_id == target_user.id,
-            )
-            .first()
-        )
-        if membership:
-            membership.role = target_role
-        else:
-            membership = KnowledgeBaseMembership(
-                knowledge_base_id=kb_id,
-                user_id=target_user.id,
-                role=target_role,
-            )
-            db.add(membership)
-        log_audit_event(
-            db,
-            user_id=user.id,
-            knowledge_base_id=kb_id,
-            action="kb.member.upsert",
-            resource_type="membership",
-            resource_id=f"{kb_id}:{target_user.id}",
-            details={"email": target_user.email, "role": target_role},
-        )
-        db.commit()
-        return {
+def list_kb_members(db: Session, user: User, kb_id: int) -> list[dict]:
+    require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.VIEWER)
+    rows = (
+        db.query(KnowledgeBaseMembership, User)
+        .join(User, User.id == KnowledgeBaseMembership.user_id)
+        .filter(KnowledgeBaseMembership.knowledge_base_id == kb_id)
+        .order_by(KnowledgeBaseMembership.created_at.asc())
+        .all()
+    )
+    return [
+        {
             "kb_id": kb_id,
-            "user_id": target_user.id,
-            "email": target_user.email,
-            "role": membership.role,
-            "created_at": membership.created_at.isoformat(),
+            "user_id": u.id,
+            "email": u.email,
+            "role": m.role,
+            "created_at": m.created_at.isoformat(),
         }
-    finally:
-        db.close()
+        for m, u in rows
+    ]
 
 
-def update_kb_member_role(user: User, kb_id: int, member_user_id: int, role: str) -> dict:
-    db = SessionLocal()
-    try:
-        require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
-        target_role = _assert_valid_kb_role(role)
-        membership = (
-            db.query(KnowledgeBaseMembership)
-            .filter(
-                KnowledgeBaseMembership.knowledge_base_id == kb_id,
-                KnowledgeBaseMembership.user_id == member_user_id,
-            )
-            .first()
+def add_kb_member(db: Session, user: User, kb_id: int, email: str, role: str) -> dict:
+    require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
+    target_role = _assert_valid_kb_role(role)
+    target_user = db.query(User).filter(User.email == email).first()
+    if target_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User '{email}' not found. User must register before being added.",
         )
-        if membership is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Member not found for this knowledge base.")
-
-        if membership.role == KnowledgeBaseRole.OWNER and target_role != KnowledgeBaseRole.OWNER:
-            if _count_kb_owners(db, kb_id) <= 1:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Cannot change role of the last owner.",
-                )
-        previous_role = membership.role
+    membership = (
+        db.query(KnowledgeBaseMembership)
+        .filter(
+            KnowledgeBaseMembership.knowledge_base_id == kb_id,
+            KnowledgeBaseMembership.user_id == target_user.id,
+        )
+        .first()
+    )
+    if membership:
         membership.role = target_role
-        log_audit_event(
-            db,
-            user_id=user.id,
+    else:
+        membership = KnowledgeBaseMembership(
             knowledge_base_id=kb_id,
-            action="kb.member.role_update",
-            resource_type="membership",
-            resource_id=f"{kb_id}:{member_user_id}",
-            details={"from": previous_role, "to": target_role},
+            user_id=target_user.id,
+            role=target_role,
         )
-        db.commit()
-
-        target_user = db.query(User).filter(User.id == member_user_id).first()
-        return {
-            "kb_id": kb_id,
-            "user_id": member_user_id,
-            "email": target_user.email if target_user else None,
-            "role": membership.role,
-            "created_at": membership.created_at.isoformat(),
-        }
-    finally:
-        db.close()
+        db.add(membership)
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=kb_id,
+        action="kb.member.upsert",
+        resource_type="membership",
+        resource_id=f"{kb_id}:{target_user.id}",
+        details={"email": target_user.email, "role": target_role},
+    )
+    db.commit()
+    return {
+        "kb_id": kb_id,
+        "user_id": target_user.id,
+        "email": target_user.email,
+        "role": membership.role,
+        "created_at": membership.created_at.isoformat(),
+    }
 
 
-def remove_kb_member(user: User, kb_id: int, member_user_id: int) -> dict:
-    db = SessionLocal()
-    try:
-        require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
-        membership = (
-            db.query(KnowledgeBaseMembership)
-            .filter(
-                KnowledgeBaseMembership.knowledge_base_id == kb_id,
-                KnowledgeBaseMembership.user_id == member_user_id,
-            )
-            .first()
+def update_kb_member_role(db: Session, user: User, kb_id: int, member_user_id: int, role: str) -> dict:
+    require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
+    target_role = _assert_valid_kb_role(role)
+    membership = (
+        db.query(KnowledgeBaseMembership)
+        .filter(
+            KnowledgeBaseMembership.knowledge_base_id == kb_id,
+            KnowledgeBaseMembership.user_id == member_user_id,
         )
-        if membership is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Member not found for this knowledge base.")
-        if membership.role == KnowledgeBaseRole.OWNER and _count_kb_owners(db, kb_id) <= 1:
+        .first()
+    )
+    if membership is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Member not found for this knowledge base.")
+
+    if membership.role == KnowledgeBaseRole.OWNER and target_role != KnowledgeBaseRole.OWNER:
+        if _count_kb_owners(db, kb_id) <= 1:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Cannot remove the last owner.",
+                detail="Cannot change role of the last owner.",
             )
-        target_email = membership.user.email if membership.user else None
-        role = membership.role
-        log_audit_event(
-            db,
-            user_id=user.id,
-            knowledge_base_id=kb_id,
-            action="kb.member.remove",
-            resource_type="membership",
-            resource_id=f"{kb_id}:{member_user_id}",
-            details={"email": target_email, "role": role},
+    previous_role = membership.role
+    membership.role = target_role
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=kb_id,
+        action="kb.member.role_update",
+        resource_type="membership",
+        resource_id=f"{kb_id}:{member_user_id}",
+        details={"from": previous_role, "to": target_role},
+    )
+    db.commit()
+
+    target_user = db.query(User).filter(User.id == member_user_id).first()
+    return {
+        "kb_id": kb_id,
+        "user_id": member_user_id,
+        "email": target_user.email if target_user else None,
+        "role": membership.role,
+        "created_at": membership.created_at.isoformat(),
+    }
+
+
+def remove_kb_member(db: Session, user: User, kb_id: int, member_user_id: int) -> dict:
+    require_kb_access(db, user.id, kb_id, min_role=KnowledgeBaseRole.OWNER)
+    membership = (
+        db.query(KnowledgeBaseMembership)
+        .filter(
+            KnowledgeBaseMembership.knowledge_base_id == kb_id,
+            KnowledgeBaseMembership.user_id == member_user_id,
         )
-        db.delete(membership)
-        db.commit()
-        return {"message": "Member removed."}
-    finally:
-        db.close()
+        .first()
+    )
+    if membership is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Member not found for this knowledge base.")
+    if membership.role == KnowledgeBaseRole.OWNER and _count_kb_owners(db, kb_id) <= 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot remove the last owner.",
+        )
+    target_email = membership.user.email if membership.user else None
+    role = membership.role
+    log_audit_event(
+        db,
+        user_id=user.id,
+        knowledge_base_id=kb_id,
+        action="kb.member.remove",
+        resource_type="membership",
+        resource_id=f"{kb_id}:{member_user_id}",
+        details={"email": target_email, "role": role},
+    )
+    db.delete(membership)
+    db.commit()
+    return {"message": "Member removed."}
@@ -1,5 +1,6 @@
 """Ragnetic FastAPI application."""
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from datetime import datetime
 from typing import Optional
 
@@ -8,8 +9,10 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr
 
 from app.api import auth, deps, routes
+from app.api.middleware import CurrentUserMiddleware, DbSessionMiddleware
 from app.core.config import validate_security_settings
 from app.models.init_db import init_db
+from app.services.audit import flush_audit_buffer, run_audit_flusher
 from app.services.rate_limit import enforce_rate_limit
 
 
@@ -90,7 +93,12 @@ class EmbeddingMigrationRequest(BaseModel):
 async def lifespan(app: FastAPI):
     validate_security_settings()
     init_db()
+    audit_flusher = asyncio.create_task(run_audit_flusher())
     yield
+    audit_flusher.cancel()
+    with suppress(asyncio.CancelledError):
+        await audit_flusher
+    await flush_audit_buffer()
 
 
 app = FastAPI(
@@ -100,6 +108,8 @@ app = FastAPI(
     version="0.1.0",
 )
 
+app.add_middleware(DbSessionMiddleware)
+app.add_middleware(CurrentUserMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://frontend:3000"],
@@ -116,40 +126,44 @@ async def root():
     return await routes.root()
 
 
-@app.post("/upload/")
+@app.post("/upload/", response_model=dict)
 async def upload_document(
     request: Request,
     file: UploadFile = File(...),
     kb_id: int = Query(None),
     replace_existing: bool = Query(True),
     user=Depends(deps.get_current_user),
+    db=Depends(deps.get_async_db_session),
 ):
     ip = request.client.host if request and request.client else "unknown"
     enforce_rate_limit("upload", key=f"user:{user.id}:ip:{ip}")
-    return await routes.upload_document(user=user, file=file, kb_id=kb_id, replace_existing=replace_existing)
+    return await routes.upload_document(db, user=user, file=file, kb_id=kb_id, replace_existing=replace_existing)
 
 
-@app.get("/search/")
+@app.get("/search/", response_model=list)
 async def search_documents(
     request: Request,
     query: str,
     kb_id: int = Query(None),
     user=Depends(deps.get_current_user),
+    db=Depends(deps.get_async_db_session),
 ):
     ip = request.client.host if request and request.client else "unknown"
     enforce_rate_limit("search", key=f"user:{user.id}:ip:{ip}")
-    return await routes.search_documents(user=user, query=query, kb_id=kb_id)
+    return await routes.search_documents(db, user=user, query=query, kb_id=kb_id)
 
 
-@app.post("/chat/")
+@app.post("/chat/", response_model=dict)
 async def chat_endpoint(
     body: ChatRequest,
     request: Request,
     user=Depends(deps.get_current_user),
+    db=Depends(deps.get_async_db_session),
 ):
     ip = request.client.host if request and request.client else "unknown"
     enforce_rate_limit("chat", key=f"user:{user.id}:ip:{ip}")
     return await routes.chat_rag(
+        db,
         user=user,
         message=body.message,
         kb_id=body.kb_id,
@@ -162,8 +176,10 @@ async def chat_endpoint(
 def submit_chat_feedback(
     body: ChatFeedbackRequest,
     user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
 ):
     return routes.submit_chat_feedback(
+        db,
         user=user,
         message_id=body.message_id,
         rating=body.rating,
@@ -176,10 +192,12 @@ async def chat_stream_endpoint(
     body: ChatRequest,
     request: Request,
     user=Depends(deps.get_current_user),
+    db=Depends(deps.get_async_db_session),
 ):
     ip = request.client.host if request and request.client else "unknown"
     enforce_rate_limit("chat", key=f"user:{user.id}:ip:{ip}")
     return await routes.chat_rag_stream(
+        db,
         user=user,
         message=body.message,
         kb_id=body.kb_id,
@@ -188,33 +206,39 @@ async def chat_stream_endpoint(
 
 
 @app.get("/kb/", response_model=list)
-def list_kb(user=Depends(deps.get_current_user)):
-    return routes.list_knowledge_bases(user)
+def list_kb(user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    return routes.list_knowledge_bases(db, user)
 
 
 @app.get("/onboarding/status", response_model=dict)
-def onboarding_status(user=Depends(deps.get_current_user)):
-    return routes.get_onboarding_status(user)
+def onboarding_status(user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    return routes.get_onboarding_status(db, user)
 
 
 @app.post("/onboarding/sample-kb", response_model=dict)
-def onboarding_create_sample_kb(user=Depends(deps.get_current_user)):
-    return routes.create_onboarding_sample_kb(user)
+def onboarding_create_sample_kb(user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    return routes.create_onboarding_sample_kb(db, user)
 
 
 @app.get("/orgs/", response_model=list)
-def list_orgs(user=Depends(deps.get_current_user)):
-    return routes.list_organizations(user)
+def list_orgs(user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    return routes.list_organizations(db, user)
 
 
 @app.post("/orgs/", response_model=dict)
-def create_org(body: CreateOrganizationRequest, user=Depends(deps.get_current_user)):
-    return routes.create_organization(user=user, name=body.name, description=body.description)
+def create_org(body: CreateOrganizationRequest, user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    return routes.create_organization(db, user=user, name=body.name, description=body.description)
 
 
 @app.post("/orgs/{org_id}/members", response_model=dict)
-def add_org_member(org_id: int, body: AddOrganizationMemberRequest, user=Depends(deps.get_current_user)):
+def add_org_member(
+    org_id: int,
+    body: AddOrganizationMemberRequest,
+    user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
+):
     return routes.add_organization_member(
+        db,
         user=user,
         org_id=org_id,
         email=body.email,
@@ -223,13 +247,19 @@ def add_org_member(org_id: int, body: AddOrganizationMemberRequest, user=Depends
 
 
 @app.get("/orgs/{org_id}/teams", response_model=list)
-def list_org_teams(org_id: int, user=Depends(deps.get_current_user)):
-    return routes.list_organization_teams(user=user, org_id=org_id)
+def list_org_teams(org_id: int, user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    return routes.list_organization_teams(db, user=user, org_id=org_id)
 
 
 @app.post("/orgs/{org_id}/teams", response_model=dict)
-def create_org_team(org_id: int, body: CreateTeamRequest, user=Depends(deps.get_current_user)):
+def create_org_team(
+    org_id: int,
+    body: CreateTeamRequest,
+    user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
+):
     return routes.create_organization_team(
+        db,
         user=user,
         org_id=org_id,
         name=body.name,
@@ -238,8 +268,14 @@ def create_org_team(org_id: int, body: CreateTeamRequest, user=Depends(deps.get_
 
 
 @app.post("/teams/{team_id}/members", response_model=dict)
-def add_team_member(team_id: int, body: AddTeamMemberRequest, user=Depends(deps.get_current_user)):
+def add_team_member(
+    team_id: int,
+    body: AddTeamMemberRequest,
+    user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
+):
     return routes.add_team_member(
+        db,
         user=user,
         team_id=team_id,
         email=body.email,
@@ -248,8 +284,15 @@ def add_team_member(team_id: int, body: AddTeamMemberRequest, user=Depends(deps.
 
 
 @app.post("/teams/{team_id}/knowledge-bases/{kb_id}", response_model=dict)
-def assign_team_kb(team_id: int, kb_id: int, body: AssignTeamKbAccessRequest, user=Depends(deps.get_current_user)):
+def assign_team_kb(
+    team_id: int,
+    kb_id: int,
+    body: AssignTeamKbAccessRequest,
+    user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
+):
     return routes.assign_team_kb_access(
+        db,
         user=user,
         team_id=team_id,
         kb_id=kb_id,
@@ -258,13 +301,13 @@ def assign_team_kb(team_id: int, kb_id: int, body: AssignTeamKbAccessRequest, us
 
 
 @app.get("/kb/{kb_id}/teams", response_model=list)
-def list_kb_teams(kb_id: int, user=Depends(deps.get_current_user)):
-    return routes.list_kb_team_access(user=user, kb_id=kb_id)
+def list_kb_teams(kb_id: int, user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    return routes.list_kb_team_access(db, user=user, kb_id=kb_id)
 
 
 @app.get("/kb/{kb_id}/embeddings", response_model=dict)
-def get_kb_embedding_registry(kb_id: int, user=Depends(deps.get_current_user)):
-    return routes.get_embedding_registry(user=user, kb_id=kb_id)
+def get_kb_embedding_registry(kb_id: int, user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    return routes.get_embedding_registry(db, user=user, kb_id=kb_id)
 
 
 @app.get("/kb/{kb_id}/analytics", response_model=dict)
@@ -272,8 +315,9 @@ def get_kb_analytics(
     kb_id: int,
     days: Optional[int] = Query(None, ge=1, le=90),
     user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
 ):
-    return routes.get_kb_rag_analytics(user=user, kb_id=kb_id, days=days)
+    return routes.get_kb_rag_analytics(db, user=user, kb_id=kb_id, days=days)
 
 
 @app.post("/kb/{kb_id}/embeddings/migrate", response_model=dict)
@@ -281,8 +325,10 @@ def start_kb_embedding_migration(
     kb_id: int,
     body: EmbeddingMigrationRequest,
     user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
 ):
     return routes.start_embedding_migration_for_kb(
+        db,
         user=user,
         kb_id=kb_id,
         target_version=body.target_version,
@@ -290,13 +336,19 @@ def start_kb_embedding_migration(
 
 
 @app.post("/kb/", response_model=dict)
-def create_kb(body: CreateKnowledgeBaseRequest, user=Depends(deps.get_current_user)):
-    return routes.create_knowledge_base(user=user, name=body.name, description=body.description)
+def create_kb(body: CreateKnowledgeBaseRequest, user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    return routes.create_knowledge_base(db, user=user, name=body.name, description=body.description)
 
 
 @app.patch("/kb/{kb_id}", response_model=dict)
-def update_kb(kb_id: int, body: UpdateKnowledgeBaseRequest, user=Depends(deps.get_current_user)):
+def update_kb(
+    kb_id: int,
+    body: UpdateKnowledgeBaseRequest,
+    user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
+):
     return routes.update_knowledge_base(
+        db,
         user=user,
         kb_id=kb_id,
         name=body.name,
@@ -305,8 +357,8 @@ def update_kb(kb_id: int, body: UpdateKnowledgeBaseRequest, user=Depends(deps.ge
 
 
 @app.delete("/kb/{kb_id}", response_model=dict)
-def delete_kb(kb_id: int, user=Depends(deps.get_current_user)):
-    return routes.delete_knowledge_base(user=user, kb_id=kb_id)
+def delete_kb(kb_id: int, user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    return routes.delete_knowledge_base(db, user=user, kb_id=kb_id)
 
 
 @app.get("/kb/{kb_id}/audit", response_model=list)
@@ -314,22 +366,35 @@ def get_audit_logs(
     kb_id: int,
     limit: int = Query(100, ge=1, le=500),
     action: Optional[str] = Query(None),
+    include_details: bool = Query(True),
     user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
 ):
-    return routes.list_audit_logs(user=user, kb_id=kb_id, limit=limit, action=action)
+    return routes.list_audit_logs(
+        db,
+        user=user,
+        kb_id=kb_id,
+        limit=limit,
+        action=action,
+        include_details=include_details,
+    )
 
 
-@app.get("/documents/{document_id}/status")
-def document_status(document_id: int, user=Depends(deps.get_current_user)):
-    out = routes.get_document_status(user, document_id)
+@app.get("/documents/{document_id}/status", response_model=dict)
+def document_status(document_id: int, user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    out = routes.get_document_status(db, user, document_id)
     if out is None:
         raise HTTPException(status_code=404, detail="Document not found")
     return out
 
 
 @app.get("/documents", response_model=list)
-def list_documents(kb_id: Optional[int] = Query(None), user=Depends(deps.get_current_user)):
-    return routes.list_documents(user=user, kb_id=kb_id)
+def list_documents(
+    kb_id: Optional[int] = Query(None),
+    user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
+):
+    return routes.list_documents(db, user=user, kb_id=kb_id)
 
 
 @app.get("/kb/{kb_id}/ingestion/dead-letter", response_model=list)
@@ -338,13 +403,18 @@ def list_ingestion_dead_letters(
     limit: int = Query(100, ge=1, le=500),
     resolved: bool = Query(False),
     user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
 ):
-    return routes.list_ingestion_dead_letters(user=user, kb_id=kb_id, limit=limit, resolved=resolved)
+    return routes.list_ingestion_dead_letters(db, user=user, kb_id=kb_id, limit=limit, resolved=resolved)
 
 
 @app.post("/ingestion/dead-letter/{dead_letter_id}/retry", response_model=dict)
-def retry_ingestion_dead_letter(dead_letter_id: int, user=Depends(deps.get_current_user)):
-    return routes.retry_ingestion_dead_letter(user=user, dead_letter_id=dead_letter_id)
+def retry_ingestion_dead_letter(
+    dead_letter_id: int,
+    user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
+):
+    return routes.retry_ingestion_dead_letter(db, user=user, dead_letter_id=dead_letter_id)
 
 
 @app.get("/kb/{kb_id}/connectors/sync-state", response_model=dict)
@@ -353,8 +423,10 @@ def get_connector_sync_state(
     source_type: str = Query(...),
     scope_key: str = Query(...),
     user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
 ):
     return routes.get_connector_sync_cursor(
+        db,
         user=user,
         kb_id=kb_id,
         source_type=source_type,
@@ -367,8 +439,10 @@ def upsert_connector_sync_state(
     kb_id: int,
     body: ConnectorSyncStateRequest,
     user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
 ):
     return routes.upsert_connector_sync_cursor(
+        db,
         user=user,
         kb_id=kb_id,
         source_type=body.source_type,
@@ -381,60 +455,85 @@ def upsert_connector_sync_state(
 
 
 @app.patch("/documents/{document_id}", response_model=dict)
-def rename_document(document_id: int, body: RenameDocumentRequest, user=Depends(deps.get_current_user)):
-    return routes.rename_document(user=user, document_id=document_id, filename=body.filename)
+def rename_document(
+    document_id: int,
+    body: RenameDocumentRequest,
+    user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
+):
+    return routes.rename_document(db, user=user, document_id=document_id, filename=body.filename)
 
 
 @app.post("/documents/{document_id}/retry", response_model=dict)
-def retry_document_ingestion(document_id: int, user=Depends(deps.get_current_user)):
-    return routes.retry_document_ingestion(user=user, document_id=document_id)
+def retry_document_ingestion(document_id: int, user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    return routes.retry_document_ingestion(db, user=user, document_id=document_id)
 
 
 @app.delete("/documents/{document_id}", response_model=dict)
-def delete_document(document_id: int, user=Depends(deps.get_current_user)):
-    return routes.delete_document(user=user, document_id=document_id)
+def delete_document(document_id: int, user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    return routes.delete_document(db, user=user, document_id=document_id)
 
 
 @app.get("/kb/{kb_id}/members", response_model=list)
-def list_kb_members(kb_id: int, user=Depends(deps.get_current_user)):
-    return routes.list_kb_members(user, kb_id)
+def list_kb_members(kb_id: int, user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    return routes.list_kb_members(db, user, kb_id)
 
 
-@app.post("/kb/{kb_id}/members")
-def add_kb_member(kb_id: int, body: AddMemberRequest, user=Depends(deps.get_current_user)):
-    return routes.add_kb_member(user, kb_id, body.email, body.role)
+@app.post("/kb/{kb_id}/members", response_model=dict)
+def add_kb_member(
+    kb_id: int,
+    body: AddMemberRequest,
+    user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
+):
+    return routes.add_kb_member(db, user, kb_id, body.email, body.role)
 
 
-@app.patch("/kb/{kb_id}/members/{member_user_id}")
+@app.patch("/kb/{kb_id}/members/{member_user_id}", response_model=dict)
 def update_kb_member_role(
     kb_id: int,
     member_user_id: int,
     body: UpdateMemberRoleRequest,
     user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
 ):
-    return routes.update_kb_member_role(user, kb_id, member_user_id, body.role)
+    return routes.update_kb_member_role(db, user, kb_id, member_user_id, body.role)
 
 
-@app.delete("/kb/{kb_id}/members/{member_user_id}")
-def remove_kb_member(kb_id: int, member_user_id: int, user=Depends(deps.get_current_user)):
-    return routes.remove_kb_member(user, kb_id, member_user_id)
+@app.delete("/kb/{kb_id}/members/{member_user_id}", response_model=dict)
+def remove_kb_member(
+    kb_id: int,
+    member_user_id: int,
+    user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
+):
+    return routes.remove_kb_member(db, user, kb_id, member_user_id)
 
 
 @app.get("/chat/sessions", response_model=list)
-def list_chat_sessions(kb_id: Optional[int] = Query(None), user=Depends(deps.get_current_user)):
-    return routes.list_chat_sessions(user=user, kb_id=kb_id)
+def list_chat_sessions(
+    kb_id: Optional[int] = Query(None),
+    user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
+):
+    return routes.list_chat_sessions(db, user=user, kb_id=kb_id)
 
 
 @app.get("/chat/sessions/{session_id}", response_model=dict)
-def get_chat_session(session_id: str, limit: int = Query(100, ge=1, le=500), user=Depends(deps.get_current_user)):
-    return routes.get_chat_session(user=user, session_id=session_id, limit=limit)
+def get_chat_session(
+    session_id: str,
+    limit: int = Query(100, ge=1, le=500),
+    user=Depends(deps.get_current_user),
+    db=Depends(deps.get_db_session),
+):
+    return routes.get_chat_session(db, user=user, session_id=session_id, limit=limit)
 
 
 @app.delete("/chat/sessions/{session_id}", response_model=dict)
-def delete_chat_session(session_id: str, user=Depends(deps.get_current_user)):
-    return routes.delete_chat_session(user=user, session_id=session_id)
+def delete_chat_session(session_id: str, user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    return routes.delete_chat_session(db, user=user, session_id=session_id)
 
 
 @app.get("/chat/jobs/{job_id}", response_model=dict)
-def get_chat_job(job_id: str, user=Depends(deps.get_current_user)):
-    return routes.get_chat_job(user=user, job_id=job_id)
+def get_chat_job(job_id: str, user=Depends(deps.get_current_user), db=Depends(deps.get_db_session)):
+    return routes.get_chat_job(db, user=user, job_id=job_id)
@@ -2,7 +2,7 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import DateTime, Integer, String, Text
+from sqlalchemy import DateTime, Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.models.base import Base
@@ -10,10 +10,13 @@ from app.models.base import Base
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    # Per-KB audit listing (created_at DESC, id DESC) and analytics windows (created_at >= since) both filter on
+    # knowledge_base_id first; the composite covers those and plain kb filters, replacing the single-column index.
+    __table_args__ = (Index("ix_audit_logs_kb_created_id", "knowledge_base_id", "created_at", "id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
-    knowledge_base_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
+    knowledge_base_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     action: Mapped[str] = mapped_column(String(128), nullable=False, index=True)
     resource_type: Mapped[str] = mapped_column(String(64), nullable=False)
     resource_id: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
@@ -1,16 +1,93 @@
 """SQLAlchemy declarative base and session."""
-from sqlalchemy import create_engine
+import itertools
+import logging
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+
+def _async_database_url(url: str) -> str:
+    """Map the sync Postgres DSN onto the asyncpg driver; other URLs pass through."""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
 engine = create_engine(
     settings.database_url,
-    pool_pre_ping=True,
+    pool_size=settings.database_pool_size,
+    max_overflow=settings.database_max_overflow,
+    pool_recycle=settings.database_pool_recycle_seconds,
+    pool_pre_ping=settings.database_pool_pre_ping,
+    query_cache_size=settings.database_query_cache_size,
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def _log_slow_queries(sync_engine, threshold_ms: int) -> None:
+    if threshold_ms <= 0:
+        return
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _started(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _finished(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - context._query_started) * 1000
+        if elapsed_ms >= threshold_ms:
+            logger.warning("Slow query (%.1f ms): %s", elapsed_ms, statement)
+
+
+_log_slow_queries(engine, settings.database_slow_query_ms)
+
+async_engine = create_async_engine(
+    _async_database_url(settings.database_url),
+    pool_size=settings.database_async_pool_size,
+    max_overflow=settings.database_async_max_overflow,
+    pool_recycle=settings.database_pool_recycle_seconds,
+    # Chat, upload and search run on this pool with no reconnect retry, so a stale connection left by a database
+    # restart or failover would surface as a 500; the ping costs one round trip per checkout.
+    pool_pre_ping=settings.database_async_pool_pre_ping,
+    query_cache_size=settings.database_query_cache_size,
+)
+_log_slow_queries(async_engine.sync_engine, settings.database_slow_query_ms)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def _async_sessionmaker_for(url: str) -> async_sessionmaker:
+    replica_engine = create_async_engine(
+        _async_database_url(url),
+        pool_size=settings.database_async_pool_size,
+        max_overflow=settings.database_async_max_overflow,
+        pool_recycle=settings.database_pool_recycle_seconds,
+        pool_pre_ping=settings.database_async_pool_pre_ping,
+        query_cache_size=settings.database_query_cache_size,
+    )
+    _log_slow_queries(replica_engine.sync_engine, settings.database_slow_query_ms)
+    return async_sessionmaker(replica_engine, autoflush=False, expire_on_commit=False)
+
+
+_replica_sessionmakers = [
+    _async_sessionmaker_for(url.strip()) for url in settings.database_replica_urls.split(",") if url.strip()
+]
+_next_replica = itertools.cycle(_replica_sessionmakers).__next__ if _replica_sessionmakers else None
+
+
+def ReplicaSessionLocal() -> AsyncSession:
+    """Async session on the next read replica (round-robin); falls back to the primary when none are configured."""
+    if _next_replica is None:
+        return AsyncSessionLocal()
+    return _next_replica()()
+
+
 class Base(DeclarativeBase):
     """Declarative base for models."""
     pass
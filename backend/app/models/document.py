@@ -2,7 +2,7 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import DateTime, ForeignKey, Integer, String, Text, UniqueConstraint
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, String, Text, UniqueConstraint, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.models.base import Base
@@ -36,6 +36,18 @@ class KnowledgeBase(Base):
 
 class Document(Base):
     __tablename__ = "documents"
+    # Upload dedup probe: equality on kb + hash, status IN (...); INCLUDE(id) keeps it an index-only scan.
+    __table_args__ = (
+        Index(
+            "ix_documents_kb_hash_status",
+            "knowledge_base_id",
+            "content_hash",
+            "status",
+            postgresql_include=["id"],
+        ),
+        # Document listing: kb equality then ORDER BY created_at DESC, id DESC, read as one backward index scan.
+        Index("ix_documents_kb_created_id", "knowledge_base_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     knowledge_base_id: Mapped[int] = mapped_column(ForeignKey("knowledge_bases.id"), nullable=False)
@@ -49,6 +61,17 @@ class Document(Base):
     knowledge_base: Mapped["KnowledgeBase"] = relationship("KnowledgeBase", back_populates="documents")
 
 
+# Upload name probe: case-insensitive filename match with `id` as the trailing key, so ORDER BY id DESC LIMIT 1
+# is a single backward index step instead of a sort. Declared here because the expression needs the mapped column.
+Index("ix_documents_kb_lower_filename", Document.knowledge_base_id, func.lower(Document.filename), Document.id)
+# "Is anything still processing?" guard before KB deletion; only in-flight rows are indexed, so it stays tiny.
+Index(
+    "ix_documents_kb_processing",
+    Document.knowledge_base_id,
+    postgresql_where=Document.status == DocumentStatus.PROCESSING,
+)
+
+
 class KnowledgeBaseMembership(Base):
     __tablename__ = "knowledge_base_memberships"
     __table_args__ = (UniqueConstraint("knowledge_base_id", "user_id", name="uq_kb_user"),)
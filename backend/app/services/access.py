@@ -1,11 +1,14 @@
 """Knowledge-base scoped access control helpers."""
 from __future__ import annotations
 
+import time
 from dataclasses import dataclass
 
 from fastapi import HTTPException, status
+from sqlalchemy import event, select
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.models.document import KnowledgeBase, KnowledgeBaseMembership, KnowledgeBaseRole
 from app.models.tenant import (
     Organization,
@@ -17,6 +20,7 @@ from app.models.tenant import (
     TeamRole,
 )
 from app.models.user import User
+from app.services.auth_cache import ExpiringCache
 
 ROLE_RANK = {
     KnowledgeBaseRole.API_USER: 1,
@@ -26,7 +30,7 @@ ROLE_RANK = {
 }
 
 
-@dataclass
+@dataclass(frozen=True)
 class AccessGrant:
     knowledge_base_id: int
     user_id: int
@@ -44,7 +48,102 @@ def _max_role(roles: list[str]) -> str | None:
     return max(roles, key=lambda role: ROLE_RANK.get(role, 0))
 
 
+# Per-worker cache of resolved grants and default KBs. Entries are dropped whenever a session commits a change
+# to any model below; the TTL bounds staleness for changes made by other workers.
+_ACCESS_MODELS = (
+    KnowledgeBase,
+    KnowledgeBaseMembership,
+    Organization,
+    OrganizationMembership,
+    Team,
+    TeamMembership,
+    TeamKnowledgeBaseAccess,
+)
+_access_cache = ExpiringCache(max_entries=settings.access_cache_max_entries)
+
+
+def invalidate_access_cache() -> None:
+    _access_cache.clear()
+
+
+def _cached(key: tuple, load):
+    hit = _access_cache.get(key)
+    if hit is not None:
+        # False marks a cached "no access" / "no default KB" result.
+        return hit if hit is not False else None
+    value = load()
+    ttl = settings.access_cache_ttl_seconds
+    if ttl > 0:
+        _access_cache.set(key, value if value is not None else False, expires_at=time.time() + ttl)
+    return value
+
+
+def cached_kb_resolution(user_id: int, kb_id: int | None, min_role: str) -> int | None:
+    """KB id a previous request with the same (user, kb, role) resolved to; never touches the database."""
+    return _access_cache.get(("resolved", user_id, kb_id, min_role))
+
+
+def remember_kb_resolution(user_id: int, kb_id: int | None, min_role: str, resolved: int) -> None:
+    ttl = settings.access_cache_ttl_seconds
+    if ttl > 0:
+        _access_cache.set(("resolved", user_id, kb_id, min_role), resolved, expires_at=time.time() + ttl)
+
+
+def cached_org_role(db: Session, user_id: int, org_id: int) -> str | None:
+    """Caller's organization role, or None when not a member."""
+    return _cached(
+        ("org", user_id, org_id),
+        lambda: db.scalar(
+            select(OrganizationMembership.role).where(
+                OrganizationMembership.organization_id == org_id,
+                OrganizationMembership.user_id == user_id,
+            )
+        ),
+    )
+
+
+def cached_team_role(db: Session, user_id: int, team_id: int) -> str | None:
+    """Caller's team role, or None when not a member."""
+    return _cached(
+        ("team", user_id, team_id),
+        lambda: db.scalar(
+            select(TeamMembership.role).where(TeamMembership.team_id == team_id, TeamMembership.user_id == user_id)
+        ),
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _note_access_changes(session: Session, flush_context) -> None:
+    if any(isinstance(obj, _ACCESS_MODELS) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info["access_changed"] = True
+
+
+_ACCESS_TABLES = frozenset(model.__tablename__ for model in _ACCESS_MODELS)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _note_bulk_access_changes(state) -> None:
+    # Upserts and bulk UPDATE/DELETE statements bypass the unit of work, so after_flush never sees them.
+    if (state.is_insert or state.is_update or state.is_delete) and state.statement.table.name in _ACCESS_TABLES:
+        state.session.info["access_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_cached_access(session: Session) -> None:
+    if session.info.pop("access_changed", False):
+        invalidate_access_cache()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_access_changes(session: Session) -> None:
+    session.info.pop("access_changed", None)
+
+
 def _effective_kb_access(db: Session, user_id: int, kb_id: int) -> AccessGrant | None:
+    return _cached(("grant", user_id, kb_id), lambda: _load_effective_kb_access(db, user_id, kb_id))
+
+
+def _load_effective_kb_access(db: Session, user_id: int, kb_id: int) -> AccessGrant | None:
     direct_roles = [
         role
         for (role,) in (
@@ -79,6 +178,10 @@ def _effective_kb_access(db: Session, user_id: int, kb_id: int) -> AccessGrant |
 
 
 def get_default_accessible_kb_id(db: Session, user_id: int, min_role: str = KnowledgeBaseRole.VIEWER) -> int | None:
+    return _cached(("default", user_id, min_role), lambda: _load_default_accessible_kb_id(db, user_id, min_role))
+
+
+def _load_default_accessible_kb_id(db: Session, user_id: int, min_role: str) -> int | None:
     direct_ids = [
         kb_id
         for (kb_id,) in (
@@ -0,0 +1,158 @@
+"""Redis cache of grounded chat answers, matched on question similarity rather than exact text.
+
+Only first-turn questions are cached: once a session has history the answer depends on it. Question embeddings are
+bucketed with random-hyperplane LSH into `_TABLES` tables of `_BITS` sign bits, so a lookup reads a handful of
+bucket fields instead of scanning every cached question; candidates found that way are then verified with an exact
+cosine check against `chat_answer_cache_min_similarity`.
+
+Each knowledge base keeps one Redis hash, scoped per user inside it, so dropping a KB's answers after its index
+changes is a single DEL. Entries are keyed by their first-table bucket, which bounds a user's entries per KB to
+`2**_BITS`. The hash expires `chat_answer_cache_ttl_seconds` after the last write. Every helper is best-effort:
+Redis errors are logged and treated as a miss.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+import logging
+import math
+from operator import mul
+import random
+from typing import Any, Sequence
+
+import orjson
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_KEY_PREFIX = "ragnetic:answers:"
+_TABLES = 6
+_BITS = 10
+# Fixed so every API process buckets the same question identically.
+_HYPERPLANE_SEED = 0x5A6E7E71C
+
+_async_client = None
+_sync_client = None
+
+
+def enabled() -> bool:
+    return settings.chat_answer_cache_ttl_seconds > 0
+
+
+def _key(kb_id: int) -> str:
+    return f"{_KEY_PREFIX}{kb_id}"
+
+
+@lru_cache(maxsize=4)
+def _hyperplanes(dim: int) -> tuple[tuple[float, ...], ...]:
+    rng = random.Random(_HYPERPLANE_SEED + dim)
+    return tuple(tuple(rng.gauss(0.0, 1.0) for _ in range(dim)) for _ in range(_TABLES * _BITS))
+
+
+def signatures(vector: Sequence[float]) -> list[int]:
+    """One `_BITS`-bit LSH signature per table; vectors at a small angle usually share at least one."""
+    planes = _hyperplanes(len(vector))
+    out: list[int] = []
+    for table in range(_TABLES):
+        sig = 0
+        for plane in planes[table * _BITS : (table + 1) * _BITS]:
+            sig = (sig << 1) | (sum(map(mul, plane, vector)) >= 0.0)
+        out.append(sig)
+    return out
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    norms = math.sqrt(sum(map(mul, a, a))) * math.sqrt(sum(map(mul, b, b)))
+    if norms == 0.0 or len(a) != len(b):
+        return 0.0
+    return sum(map(mul, a, b)) / norms
+
+
+def _bucket_fields(user_id: int, sigs: list[int]) -> list[str]:
+    return [f"b:{user_id}:{table}:{sig}" for table, sig in enumerate(sigs)]
+
+
+def _client_options() -> dict:
+    return {"socket_connect_timeout": 0.5, "socket_timeout": 0.5}
+
+
+def _get_async_client():
+    global _async_client
+    if not enabled():
+        return None
+    if _async_client is None:
+        try:
+            from redis.asyncio import Redis
+
+            _async_client = Redis.from_url(settings.redis_url, **_client_options())
+        except Exception as exc:
+            logger.warning("Answer cache disabled: %s", exc)
+            return None
+    return _async_client
+
+
+def _get_sync_client():
+    global _sync_client
+    if not enabled():
+        return None
+    if _sync_client is None:
+        try:
+            from redis import Redis
+
+            _sync_client = Redis.from_url(settings.redis_url, **_client_options())
+        except Exception as exc:
+            logger.warning("Answer cache disabled: %s", exc)
+            return None
+    return _sync_client
+
+
+async def cached_answer(kb_id: int, user_id: int, vector: Sequence[float]) -> dict[str, Any] | None:
+    """The stored payload of the most similar cached question above the threshold, or None."""
+    client = _get_async_client()
+    if client is None:
+        return None
+    key = _key(kb_id)
+    try:
+        entry_ids = {raw for raw in await client.hmget(key, _bucket_fields(user_id, signatures(vector))) if raw}
+        if not entry_ids:
+            return None
+        entries = [raw for raw in await client.hmget(key, list(entry_ids)) if raw]
+    except Exception as exc:
+        logger.debug("Answer cache read failed for kb_id=%s: %s", kb_id, exc)
+        return None
+    best: dict[str, Any] | None = None
+    best_similarity = settings.chat_answer_cache_min_similarity
+    for raw in entries:
+        entry = orjson.loads(raw)
+        similarity = _cosine(vector, entry["vector"])
+        if similarity >= best_similarity:
+            best, best_similarity = entry["payload"], similarity
+    return best
+
+
+async def store_answer(kb_id: int, user_id: int, vector: Sequence[float], payload: dict[str, Any]) -> None:
+    client = _get_async_client()
+    if client is None:
+        return
+    key = _key(kb_id)
+    fields = _bucket_fields(user_id, signatures(vector))
+    entry_id = f"e:{fields[0][2:]}"
+    entry = orjson.dumps({"vector": list(vector), "payload": payload}, option=orjson.OPT_SERIALIZE_NUMPY)
+    try:
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping={entry_id: entry, **dict.fromkeys(fields, entry_id)})
+            pipe.expire(key, settings.chat_answer_cache_ttl_seconds)
+            await pipe.execute()
+    except Exception as exc:
+        logger.debug("Answer cache write failed for kb_id=%s: %s", kb_id, exc)
+
+
+def invalidate_kb(kb_id: int) -> None:
+    """Forget every cached answer for a KB; call wherever `retrieval_cache.invalidate_kb` is called."""
+    client = _get_sync_client()
+    if client is None:
+        return
+    try:
+        client.delete(_key(kb_id))
+    except Exception as exc:
+        logger.warning("Answer cache invalidation failed for kb_id=%s: %s", kb_id, exc)
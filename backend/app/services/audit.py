@@ -1,36 +1,46 @@
 """Audit logging helpers."""
 from __future__ import annotations
 
-import json
+import asyncio
+from collections import deque
+from datetime import datetime
 import logging
 from typing import Any
 
+import orjson
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.models.audit import AuditLog
+from app.models.base import AsyncSessionLocal
 
 logger = logging.getLogger(__name__)
 
+_FLUSH_BATCH_ROWS = 500
+# Rows from `buffer_audit_event`, appended from the event loop and threadpool routes alike (deque ops are atomic).
+_buffer: deque[dict[str, Any]] = deque()
+
 
 def _serialize_details(details: dict[str, Any] | None) -> str | None:
     if details is None:
         return None
     try:
-        return json.dumps(details, ensure_ascii=True)
+        return orjson.dumps(details).decode()
     except Exception as exc:  # pragma: no cover - defensive serialization fallback
         logger.warning("Failed to serialize audit details: %s", exc)
-        return json.dumps({"raw": str(details)}, ensure_ascii=True)
+        return orjson.dumps({"raw": str(details)}).decode()
 
 
 def parse_details(details_json: str | None) -> dict[str, Any] | None:
     if not details_json:
         return None
     try:
-        parsed = json.loads(details_json)
+        parsed = orjson.loads(details_json)
         if isinstance(parsed, dict):
             return parsed
         return {"value": parsed}
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         return {"raw": details_json}
 
 
@@ -56,3 +66,60 @@ def log_audit_event(
             details_json=_serialize_details(details),
         )
     )
+
+
+def buffer_audit_event(
+    *,
+    user_id: int | None,
+    knowledge_base_id: int | None,
+    action: str,
+    resource_type: str,
+    resource_id: str | None = None,
+    details: dict[str, Any] | None = None,
+) -> None:
+    """Queue an audit row for `run_audit_flusher` instead of writing it in the caller's transaction.
+
+    Only for events that are a request's sole write, such as search analytics: the row is not atomic with
+    anything else and is lost if the process dies before the next flush.
+    """
+    if not action or not resource_type:
+        return
+    if len(_buffer) >= settings.audit_buffer_max_rows:
+        logger.warning("Audit buffer full; dropping %s event", action)
+        return
+    _buffer.append(
+        {
+            "user_id": user_id,
+            "knowledge_base_id": knowledge_base_id,
+            "action": action,
+            "resource_type": resource_type,
+            "resource_id": resource_id,
+            "details_json": _serialize_details(details),
+            "created_at": datetime.utcnow(),
+        }
+    )
+
+
+async def flush_audit_buffer() -> int:
+    """Write buffered rows in multi-row INSERTs; on failure the batch is put back for the next flush."""
+    written = 0
+    while _buffer:
+        batch = [_buffer.popleft() for _ in range(min(len(_buffer), _FLUSH_BATCH_ROWS))]
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(AuditLog), batch)
+                await db.commit()
+        except Exception as exc:
+            logger.warning("Failed to write %s buffered audit rows: %s", len(batch), exc)
+            _buffer.extendleft(reversed(batch))
+            break
+        written += len(batch)
+    return written
+
+
+async def run_audit_flusher() -> None:
+    """Flush the audit buffer every `audit_flush_interval_seconds` until cancelled."""
+    interval = max(0.1, settings.audit_flush_interval_seconds)
+    while True:
+        await asyncio.sleep(interval)
+        await flush_audit_buffer()
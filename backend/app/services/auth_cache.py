@@ -0,0 +1,65 @@
+"""In-process caches for the authentication hot path."""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """Detached snapshot of the authenticated user; safe to share across sessions and threads."""
+
+    id: int
+    email: str
+
+
+def token_cache_key(token: str) -> bytes:
+    """Fixed-size cache key so long bearer tokens do not inflate memory."""
+    return hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+
+
+class ExpiringCache:
+    """Bounded LRU cache whose entries carry their own absolute expiry (epoch seconds)."""
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max(1, int(max_entries))
+        self._entries: OrderedDict[Any, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Any | None:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Any, value: Any, expires_at: float) -> None:
+        if expires_at <= time.time():
+            return
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Any) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,133 @@
+"""Redis cache of the recent-history lines fed into chat prompts.
+
+Each session keeps its last `HISTORY_LINES` formatted lines in a Redis list. Writers append with RPUSHX, so a
+session that is not cached is never partially populated; readers fall back to the database on a miss and store the
+full window. Every helper is best-effort: Redis errors are logged and treated as a miss.
+"""
+from __future__ import annotations
+
+import logging
+
+from app.core.config import settings
+from app.models.chat import ChatRole
+
+logger = logging.getLogger(__name__)
+
+HISTORY_LINES = 10
+_KEY_PREFIX = "ragnetic:chat-history:"
+
+_async_client = None
+_sync_client = None
+
+
+def history_line(role: str, content: str) -> str:
+    speaker = "User" if role == ChatRole.USER else "Assistant"
+    return f"{speaker}: {content}"
+
+
+def _key(session_id: str) -> str:
+    return f"{_KEY_PREFIX}{session_id}"
+
+
+def _client_options() -> dict:
+    return {"decode_responses": True, "socket_connect_timeout": 0.5, "socket_timeout": 0.5}
+
+
+def _get_async_client():
+    global _async_client
+    if settings.chat_history_cache_ttl_seconds <= 0:
+        return None
+    if _async_client is None:
+        try:
+            from redis.asyncio import Redis
+
+            _async_client = Redis.from_url(settings.redis_url, **_client_options())
+        except Exception as exc:
+            logger.warning("Chat history cache disabled: %s", exc)
+            return None
+    return _async_client
+
+
+def _get_sync_client():
+    global _sync_client
+    if settings.chat_history_cache_ttl_seconds <= 0:
+        return None
+    if _sync_client is None:
+        try:
+            from redis import Redis
+
+            _sync_client = Redis.from_url(settings.redis_url, **_client_options())
+        except Exception as exc:
+            logger.warning("Chat history cache disabled: %s", exc)
+            return None
+    return _sync_client
+
+
+async def cached_history(session_id: str) -> list[str] | None:
+    """Cached history lines, oldest first, or None on a miss."""
+    client = _get_async_client()
+    if client is None:
+        return None
+    try:
+        lines = await client.lrange(_key(session_id), 0, -1)
+    except Exception as exc:
+        logger.debug("Chat history cache read failed for session_id=%s: %s", session_id, exc)
+        return None
+    return lines or None
+
+
+async def store_history(session_id: str, lines: list[str]) -> None:
+    """Replace the cached window with `lines` loaded from the database."""
+    client = _get_async_client()
+    if client is None or not lines:
+        return
+    key = _key(session_id)
+    try:
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.rpush(key, *lines[-HISTORY_LINES:])
+            pipe.expire(key, settings.chat_history_cache_ttl_seconds)
+            await pipe.execute()
+    except Exception as exc:
+        logger.debug("Chat history cache write failed for session_id=%s: %s", session_id, exc)
+
+
+async def append_history(session_id: str, *lines: str) -> None:
+    client = _get_async_client()
+    if client is None or not lines:
+        return
+    key = _key(session_id)
+    try:
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.rpushx(key, *lines)
+            pipe.ltrim(key, -HISTORY_LINES, -1)
+            pipe.expire(key, settings.chat_history_cache_ttl_seconds)
+            await pipe.execute()
+    except Exception as exc:
+        logger.debug("Chat history cache append failed for session_id=%s: %s", session_id, exc)
+
+
+def append_history_sync(session_id: str, *lines: str) -> None:
+    client = _get_sync_client()
+    if client is None or not lines:
+        return
+    key = _key(session_id)
+    try:
+        with client.pipeline(transaction=True) as pipe:
+            pipe.rpushx(key, *lines)
+            pipe.ltrim(key, -HISTORY_LINES, -1)
+            pipe.expire(key, settings.chat_history_cache_ttl_seconds)
+            pipe.execute()
+    except Exception as exc:
+        logger.debug("Chat history cache append failed for session_id=%s: %s", session_id, exc)
+
+
+def forget_history_sync(*session_ids: str) -> None:
+    """Drop cached history for deleted sessions so a reused session id starts empty."""
+    client = _get_sync_client()
+    if client is None or not session_ids:
+        return
+    try:
+        client.delete(*(_key(session_id) for session_id in session_ids))
+    except Exception as exc:
+        logger.warning("Chat history cache invalidation failed: %s", exc)
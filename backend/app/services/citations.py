@@ -20,16 +20,10 @@ def has_citation(answer: str) -> bool:
 
 
 def citation_indices(answer: str, sources: list[dict[str, Any]]) -> list[int]:
-    max_idx = len(sources) - 1
-    indices: set[int] = set()
-    for match in CITATION_RE.finditer(answer or ""):
-        try:
-            idx = int(match.group(1)) - 1
-        except (TypeError, ValueError):
-            continue
-        if 0 <= idx <= max_idx:
-            indices.add(idx)
-    return sorted(indices)
+    count = len(sources)
+    # The pattern only captures digits, so every group parses; findall skips the per-match objects.
+    indices = {int(number) - 1 for number in CITATION_RE.findall(answer or "")}
+    return sorted(idx for idx in indices if 0 <= idx < count)
 
 
 def enforce_citation_format(answer: str, sources: list[dict[str, Any]], enabled: bool = True) -> str:
@@ -53,14 +47,15 @@ def append_citation_legend(
     if not normalized or not sources:
         return normalized
 
-    header_line = f"{legend_header}:"
-    if header_line.lower() in normalized.lower():
-        return normalized
-
+    # Answers without citations return before the full-text lowercase copy the header check needs.
     used = citation_indices(normalized, sources)
     if not used:
         return normalized
 
+    header_line = f"{legend_header}:"
+    if header_line.lower() in normalized.lower():
+        return normalized
+
     grouped: dict[str, list[int]] = {}
     order: list[str] = []
     max_groups = max(1, max_items)
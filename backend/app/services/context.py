@@ -10,6 +10,21 @@ from app.core.config import settings
 TOKEN_RE = re.compile(r"[A-Za-z0-9_]+")
 SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
 
+CHAT_SYSTEM_PROMPT = (
+    "You are a grounded assistant for this RAG system. "
+    "Use only the provided context blocks for factual claims; never invent details. "
+    "Use conversation history only for continuity. "
+    "Answer the user directly from available evidence, regardless of document type "
+    "(for example PRDs, runbooks, policies, specs, tickets, or notes). "
+    "If partial evidence exists, provide what is known and mark missing parts as "
+    "\"Not specified in provided context.\" "
+    "Do not ask for more context unless zero relevant evidence exists. "
+    "Do not say \"I couldn't find\" when at least one relevant fact is available. "
+    "When the question asks for lists (features, phases, requirements, steps, risks), "
+    "respond in a concise structured list. "
+    "For every factual bullet/sentence, append citations in the form [Source N]."
+)
+
 
 @dataclass
 class ContextAssembly:
@@ -216,11 +231,12 @@ def assemble_context(
         used_tokens = snippet_tokens
         compressed_sources = int(snippet != fallback_source.get("snippet", ""))
 
-    context_blocks = "\n\n---\n\n".join(
-        f"[Source {idx + 1}]\n{(item.get('snippet') or '').strip()}"
-        for idx, item in enumerate(chosen)
-        if (item.get("snippet") or "").strip()
-    )
+    blocks: list[str] = []
+    for idx, item in enumerate(chosen, 1):
+        snippet = (item.get("snippet") or "").strip()
+        if snippet:
+            blocks.append(f"[Source {idx}]\n{snippet}")
+    context_blocks = "\n\n---\n\n".join(blocks)
 
     return ContextAssembly(
         sources=chosen,
@@ -229,3 +245,45 @@ def assemble_context(
         token_used=used_tokens,
         compressed_sources=compressed_sources,
     )
+
+
+def _source_identity(metadata: dict[str, Any], index: int) -> tuple[str, Any]:
+    # Tuple keys hash without formatting doc ids or indices into strings.
+    doc_id = metadata.get("doc_id")
+    if doc_id is not None:
+        return ("doc", doc_id)
+    name = metadata.get("source") or metadata.get("filename") or metadata.get("title")
+    if isinstance(name, str):
+        name = name.strip()
+        if name:
+            return ("name", name.lower())
+    return ("idx", index)
+
+
+def select_chat_sources(hits: list[dict[str, Any]], limit: int) -> list[dict[str, Any]]:
+    """Retrieval hits -> chat sources ({snippet, metadata, score}), at most one per document when
+    `chat_unique_sources_per_document` is set.
+
+    Dedup and mapping share one pass, so only the kept hits are copied.
+    """
+    unique = settings.chat_unique_sources_per_document
+    selected: list[dict[str, Any]] = []
+    seen: set[tuple[str, Any]] = set()
+    for idx, hit in enumerate(hits):
+        if len(selected) >= limit:
+            break
+        metadata = hit.get("metadata") or {}
+        if unique:
+            key = _source_identity(metadata, idx)
+            if key in seen:
+                continue
+            seen.add(key)
+        selected.append({"snippet": hit.get("snippet", ""), "metadata": metadata, "score": hit.get("score", 0.0)})
+    return selected
+
+
+def build_user_prompt(question: str, history: str, context_blocks: str) -> str:
+    """User turn of a grounded chat prompt; history is only included when the session has some."""
+    if history:
+        return f"Conversation history:\n{history}\n\nContext:\n\n{context_blocks}\n\nQuestion: {question}"
+    return f"Context:\n\n{context_blocks}\n\nQuestion: {question}"
@@ -5,7 +5,7 @@ from datetime import datetime
 import re
 from typing import Any
 
-from sqlalchemy import desc
+from sqlalchemy import bindparam, desc, select
 from sqlalchemy.orm import Session
 
 from app.ingestion.embedding import get_embedding_dim
@@ -93,15 +93,23 @@ def get_active_embedding_version(db: Session, kb_id: int) -> str:
     return namespace.active_version
 
 
+_ACTIVE_VERSION_STMT = select(KBEmbeddingNamespace.active_version).where(
+    KBEmbeddingNamespace.knowledge_base_id == bindparam("kb_id")
+)
+
+
 def get_active_embedding_version_for_kb(kb_id: int) -> str:
-    db = SessionLocal()
+    """Active version for callers without a session, e.g. every retrieval cache miss.
+
+    Once a KB's namespace exists this is a single read; the get-or-create write path only runs the first time.
+    """
     try:
-        return get_active_embedding_version(db, kb_id)
+        with SessionLocal() as db:
+            active = db.scalar(_ACTIVE_VERSION_STMT, {"kb_id": kb_id})
+            return active or get_active_embedding_version(db, kb_id)
     except Exception:
         # Keep retrieval/indexing paths usable in degraded test/dev environments.
         return "v1"
-    finally:
-        db.close()
 
 
 def start_embedding_migration(
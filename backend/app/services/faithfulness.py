@@ -7,6 +7,7 @@ from typing import Any
 TOKEN_RE = re.compile(r"[A-Za-z0-9_]+")
 SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
 CITATION_RE = re.compile(r"\[Source\s+\d+(?:\s*,\s*\d+)*\]", re.IGNORECASE)
+SOURCE_REFERENCES_RE = re.compile(r"\n\s*source references\s*:\s*", re.IGNORECASE)
 STOPWORDS = {
     "a",
     "an",
@@ -37,7 +38,7 @@ def _clean_answer(answer: str) -> str:
     normalized = (answer or "").strip()
     if not normalized:
         return ""
-    marker = re.search(r"\n\s*source references\s*:\s*", normalized, flags=re.IGNORECASE)
+    marker = SOURCE_REFERENCES_RE.search(normalized)
     if marker:
         normalized = normalized[: marker.start()].strip()
     return normalized
@@ -52,11 +53,8 @@ def _split_claims(answer: str) -> list[str]:
 
 
 def _claim_tokens(claim: str) -> list[str]:
-    return [
-        token.lower()
-        for token in TOKEN_RE.findall(claim or "")
-        if len(token) > 2 and token.lower() not in STOPWORDS
-    ]
+    # Lowercase the claim once instead of every token twice.
+    return [token for token in TOKEN_RE.findall((claim or "").lower()) if len(token) > 2 and token not in STOPWORDS]
 
 
 def _source_text(sources: list[dict[str, Any]]) -> str:
@@ -78,7 +76,7 @@ def _claim_is_supported(claim: str, source_corpus: str, source_tokens: set[str])
     tokens = _claim_tokens(compact_claim)
     if not tokens:
         return False
-    overlap = sum(1 for token in tokens if token in source_tokens)
+    overlap = sum(map(source_tokens.__contains__, tokens))
     ratio = overlap / max(1, len(tokens))
     return ratio >= 0.45
 
@@ -90,7 +88,8 @@ def faithfulness_score(answer: str, sources: list[dict[str, Any]]) -> float:
         return 0.0
 
     source_corpus = _source_text(sources)
-    source_tokens = {token.lower() for token in TOKEN_RE.findall(source_corpus)}
+    # The corpus is already lowercased, so its tokens can go straight into the set.
+    source_tokens = set(TOKEN_RE.findall(source_corpus))
     if not source_tokens:
         return 0.0
 
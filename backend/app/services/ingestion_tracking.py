@@ -4,7 +4,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Any
 
-from sqlalchemy import desc
+from sqlalchemy import case, desc, update
 from sqlalchemy.orm import Session
 
 from app.models.ingestion import (
@@ -66,13 +66,17 @@ def create_ingestion_job(
 
 
 def mark_ingestion_job_queued(db: Session, *, job_id: int, celery_task_id: str | None) -> None:
-    job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
-    if job is None:
-        return
-    job.status = IngestionJobStatus.QUEUED
-    job.progress = max(0, job.progress)
-    job.celery_task_id = celery_task_id
-    job.error_message = None
+    # Single UPDATE; a missing job matches no rows, as the old load-then-mutate version silently returned.
+    db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id == job_id)
+        .values(
+            status=IngestionJobStatus.QUEUED,
+            progress=case((IngestionJob.progress < 0, 0), else_=IngestionJob.progress),
+            celery_task_id=celery_task_id,
+            error_message=None,
+        )
+    )
     db.commit()
 
 
@@ -1,19 +1,22 @@
 """LLM adapter: Ollama (local) and optional OpenAI fallback."""
 from __future__ import annotations
 
-import json
 import logging
 
 import httpx
+import orjson
 
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Request bodies are encoded with orjson rather than httpx's stdlib `json=` path.
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
 
 def _ollama_error_detail(response: httpx.Response) -> str:
     try:
-        data = response.json()
+        data = orjson.loads(response.content)
         if isinstance(data, dict):
             if isinstance(data.get("error"), str) and data["error"].strip():
                 return data["error"].strip()
@@ -29,6 +32,23 @@ def _ollama_error_detail(response: httpx.Response) -> str:
         return response.reason_phrase or "unknown error"
 
 
+def _ollama_payload(prompt: str, system: str | None, *, stream: bool, num_predict: int) -> dict:
+    # The system prompt leads every request, so Ollama can reuse the KV cache it kept for that prefix from the
+    # previous request and only prefill the retrieved context and question. keep_alive keeps that cache resident.
+    payload = {
+        "model": settings.ollama_model,
+        "prompt": f"{system}\n\n{prompt}" if system else prompt,
+        "stream": stream,
+        "options": {
+            "num_predict": num_predict,
+            "temperature": float(settings.ollama_temperature),
+        },
+    }
+    if settings.ollama_keep_alive:
+        payload["keep_alive"] = settings.ollama_keep_alive
+    return payload
+
+
 async def generate(prompt: str, system: str | None = None) -> str:
     """Generate completion. Returns full string."""
     if settings.openai_api_key:
@@ -51,22 +71,10 @@ async def generate_stream(prompt: str, system: str | None = None):
 
 
 async def _generate_ollama(prompt: str, system: str | None = None) -> str:
-    full_prompt = prompt
-    if system:
-        full_prompt = f"{system}\n\n{prompt}"
     url = f"{settings.ollama_url.rstrip('/')}/api/generate"
     tags_url = f"{settings.ollama_url.rstrip('/')}/api/tags"
     num_predict = int(settings.ollama_num_predict)
-    temperature = float(settings.ollama_temperature)
-    payload = {
-        "model": settings.ollama_model,
-        "prompt": full_prompt,
-        "stream": False,
-        "options": {
-            "num_predict": num_predict,
-            "temperature": temperature,
-        },
-    }
+    payload = _ollama_payload(prompt, system, stream=False, num_predict=num_predict)
     timeout = httpx.Timeout(
         timeout=float(settings.llm_timeout_seconds),
         connect=float(settings.llm_connect_timeout_seconds),
@@ -80,7 +88,7 @@ async def _generate_ollama(prompt: str, system: str | None = None) -> str:
         try:
             tags_resp = await client.get(tags_url, timeout=model_check_timeout)
             if tags_resp.status_code == 200:
-                data = tags_resp.json()
+                data = orjson.loads(tags_resp.content)
                 models = data.get("models") or []
                 names = {
                     (m.get("name") or "").split(":")[0]
@@ -99,7 +107,7 @@ async def _generate_ollama(prompt: str, system: str | None = None) -> str:
             pass
 
         try:
-            resp = await client.post(url, json=payload)
+            resp = await client.post(url, content=orjson.dumps(payload), headers=_JSON_HEADERS)
             resp.raise_for_status()
         except httpx.ReadTimeout as exc:
             retry_predict = max(64, num_predict // 2)
@@ -123,7 +131,7 @@ async def _generate_ollama(prompt: str, system: str | None = None) -> str:
                 retry_predict,
             )
             try:
-                resp = await client.post(url, json=retry_payload)
+                resp = await client.post(url, content=orjson.dumps(retry_payload), headers=_JSON_HEADERS)
                 resp.raise_for_status()
             except httpx.ReadTimeout as retry_exc:
                 raise RuntimeError(
@@ -143,27 +151,16 @@ async def _generate_ollama(prompt: str, system: str | None = None) -> str:
             raise RuntimeError(f"Ollama request failed: {exc.__class__.__name__}") from exc
 
         try:
-            data = resp.json()
+            data = orjson.loads(resp.content)
         except ValueError as exc:
             raise RuntimeError("Ollama returned invalid JSON response.") from exc
         return data.get("response", "")
 
 
 async def _generate_ollama_stream(prompt: str, system: str | None = None):
-    full_prompt = prompt
-    if system:
-        full_prompt = f"{system}\n\n{prompt}"
     url = f"{settings.ollama_url.rstrip('/')}/api/generate"
     tags_url = f"{settings.ollama_url.rstrip('/')}/api/tags"
-    payload = {
-        "model": settings.ollama_model,
-        "prompt": full_prompt,
-        "stream": True,
-        "options": {
-            "num_predict": int(settings.ollama_num_predict),
-            "temperature": float(settings.ollama_temperature),
-        },
-    }
+    payload = _ollama_payload(prompt, system, stream=True, num_predict=int(settings.ollama_num_predict))
     timeout = httpx.Timeout(
         timeout=float(settings.llm_timeout_seconds),
         connect=float(settings.llm_connect_timeout_seconds),
@@ -176,7 +173,7 @@ async def _generate_ollama_stream(prompt: str, system: str | None = None):
         try:
             tags_resp = await client.get(tags_url, timeout=model_check_timeout)
             if tags_resp.status_code == 200:
-                data = tags_resp.json()
+                data = orjson.loads(tags_resp.content)
                 models = data.get("models") or []
                 names = {
                     (m.get("name") or "").split(":")[0]
@@ -194,7 +191,7 @@ async def _generate_ollama_stream(prompt: str, system: str | None = None):
             pass
 
         try:
-            async with client.stream("POST", url, json=payload) as resp:
+            async with client.stream("POST", url, content=orjson.dumps(payload), headers=_JSON_HEADERS) as resp:
                 if resp.status_code >= 400:
                     detail = _ollama_error_detail(resp)
                     raise RuntimeError(f"Ollama returned {resp.status_code}: {detail}")
@@ -202,8 +199,8 @@ async def _generate_ollama_stream(prompt: str, system: str | None = None):
                     if not line:
                         continue
                     try:
-                        item = json.loads(line)
-                    except json.JSONDecodeError:
+                        item = orjson.loads(line)
+                    except orjson.JSONDecodeError:
                         continue
                     if not isinstance(item, dict):
                         continue
@@ -1,9 +1,19 @@
-"""Qdrant client and collection helpers."""
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, FieldCondition, Filter, MatchValue, PointStruct, VectorParams
+"""Qdrant client and collection helpers.
+
+The qdrant-client SDK is imported on first use: it is by far the slowest import in the API process, and workers
+that only serve auth, upload, or listing traffic never need it.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
 
 from app.core.config import settings
 from app.ingestion.embedding import get_embedding_dim
+from app.services import answer_cache, retrieval_cache
+
+if TYPE_CHECKING:
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import PointStruct
 
 _client: QdrantClient | None = None
 COLLECTION_PREFIX = "ragnetic"
@@ -13,6 +23,8 @@ DEFAULT_EMBEDDING_VERSION = "v1"
 def get_qdrant() -> QdrantClient:
     global _client
     if _client is None:
+        from qdrant_client import QdrantClient
+
         _client = QdrantClient(url=settings.qdrant_url)
     return _client
 
@@ -22,6 +34,8 @@ def collection_name(kb_id: int, embedding_version: str = DEFAULT_EMBEDDING_VERSI
 
 
 def ensure_collection(kb_id: int, embedding_version: str = DEFAULT_EMBEDDING_VERSION) -> str:
+    from qdrant_client.models import Distance, VectorParams
+
     name = collection_name(kb_id, embedding_version)
     dim = get_embedding_dim()
     client = get_qdrant()
@@ -61,6 +75,8 @@ def delete_all_collections_for_kb(kb_id: int) -> int:
     names = list_collections_for_kb(kb_id)
     for name in names:
         get_qdrant().delete_collection(collection_name=name)
+    retrieval_cache.invalidate_kb(kb_id)
+    answer_cache.invalidate_kb(kb_id)
     return len(names)
 
 
@@ -70,6 +86,8 @@ def upsert_chunks(collection: str, points: list[PointStruct]):
 
 def delete_document_chunks(kb_id: int, doc_id: int, embedding_version: str = DEFAULT_EMBEDDING_VERSION) -> None:
     """Delete all points for a document from a KB collection."""
+    from qdrant_client.models import FieldCondition, Filter, MatchValue
+
     if not collection_exists(kb_id, embedding_version):
         return
     coll = collection_name(kb_id, embedding_version)
@@ -82,6 +100,41 @@ def delete_document_chunks(kb_id: int, doc_id: int, embedding_version: str = DEF
         ]
     )
     get_qdrant().delete(collection_name=coll, points_selector=query_filter, wait=True)
+    retrieval_cache.invalidate_kb(kb_id)
+    answer_cache.invalidate_kb(kb_id)
+
+
+def document_chunk_vectors(
+    kb_id: int,
+    doc_id: int,
+    embedding_version: str = DEFAULT_EMBEDDING_VERSION,
+    batch_size: int = 256,
+) -> dict[str, list[float]]:
+    """Map chunk text -> stored vector for a document's existing points (empty if none)."""
+    from qdrant_client.models import FieldCondition, Filter, MatchValue
+
+    if not collection_exists(kb_id, embedding_version):
+        return {}
+    coll = collection_name(kb_id, embedding_version)
+    query_filter = Filter(must=[FieldCondition(key="doc_id", match=MatchValue(value=doc_id))])
+    client = get_qdrant()
+    vectors: dict[str, list[float]] = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=coll,
+            scroll_filter=query_filter,
+            limit=batch_size,
+            offset=offset,
+            with_payload=["text"],
+            with_vectors=True,
+        )
+        for point in points:
+            text = (point.payload or {}).get("text")
+            if isinstance(text, str) and isinstance(point.vector, list):
+                vectors[text] = point.vector
+        if offset is None:
+            return vectors
 
 
 def search_collection(collection: str, vector: list[float], limit: int = 5):
@@ -98,3 +151,18 @@ def search_collection(collection: str, vector: list[float], limit: int = 5):
         with_payload=True,
     )
     return getattr(response, "points", response)
+
+
+def search_collection_batch(collection: str, vectors: list[list[float]], limit: int = 5) -> list[list]:
+    """One round trip for several query vectors; returns one hit list per vector, in order."""
+    client = get_qdrant()
+    if hasattr(client, "search_batch"):
+        from qdrant_client.models import SearchRequest
+
+        requests = [SearchRequest(vector=vector, limit=limit, with_payload=True) for vector in vectors]
+        return client.search_batch(collection_name=collection, requests=requests)
+    from qdrant_client.models import QueryRequest
+
+    requests = [QueryRequest(query=vector, limit=limit, with_payload=True) for vector in vectors]
+    responses = client.query_batch_points(collection_name=collection, requests=requests)
+    return [getattr(response, "points", response) for response in responses]
@@ -76,7 +76,8 @@ def _semantic_variant(query: str) -> str:
     )
 
 
-async def _hyde_variant(query: str, history: str | None = None) -> str | None:
+async def hyde_variant(query: str, history: str | None = None) -> str | None:
+    """LLM-written hypothetical answer passage for the query, or None when HyDE is disabled or fails."""
     if not settings.retrieval_enable_hyde:
         return None
     normalized = (query or "").strip()
@@ -108,14 +109,7 @@ async def _hyde_variant(query: str, history: str | None = None) -> str | None:
     return cleaned[: max(120, int(settings.retrieval_hyde_max_chars))]
 
 
-async def build_query_variants(query: str, history: str | None = None) -> list[str]:
-    """Return expanded query variants used by hybrid retrieval."""
-    normalized = (query or "").strip()
-    if not normalized:
-        return [""]
-    if not settings.retrieval_enable_query_expansion:
-        return [normalized]
-
+def _lexical_candidates(normalized: str) -> list[str]:
     candidates: list[str] = [normalized]
     keyword = _keyword_variant(normalized)
     if keyword:
@@ -123,13 +117,40 @@ async def build_query_variants(query: str, history: str | None = None) -> list[s
     semantic = _semantic_variant(normalized)
     if semantic:
         candidates.append(semantic)
+    return candidates
+
 
-    hyde = await _hyde_variant(normalized, history=history)
+def _max_variants() -> int:
+    return max(1, int(settings.retrieval_query_expansion_max_variants))
+
+
+def lexical_query_variants(query: str) -> list[str]:
+    """Variants that need no LLM call; `build_query_variants` without the HyDE passage."""
+    normalized = (query or "").strip()
+    if not normalized:
+        return [""]
+    if not settings.retrieval_enable_query_expansion:
+        return [normalized]
+    return _dedupe_variants(_lexical_candidates(normalized), max_items=_max_variants())
+
+
+def with_hyde_variant(query: str, hyde: str | None) -> list[str]:
+    """The variants `build_query_variants` returns once the HyDE passage for `query` is known."""
+    normalized = (query or "").strip()
+    if not normalized or not settings.retrieval_enable_query_expansion:
+        return lexical_query_variants(query)
+    candidates = _lexical_candidates(normalized)
     if hyde:
         candidates.append(hyde)
+    return _dedupe_variants(candidates, max_items=_max_variants())
+
 
-    max_variants = max(1, int(settings.retrieval_query_expansion_max_variants))
-    return _dedupe_variants(candidates, max_items=max_variants)
+async def build_query_variants(query: str, history: str | None = None) -> list[str]:
+    """Return expanded query variants used by hybrid retrieval."""
+    normalized = (query or "").strip()
+    if not normalized or not settings.retrieval_enable_query_expansion:
+        return lexical_query_variants(query)
+    return with_hyde_variant(normalized, await hyde_variant(normalized, history=history))
 
 
 def build_query_variants_sync(query: str, history: str | None = None) -> list[str]:
@@ -137,17 +158,6 @@ def build_query_variants_sync(query: str, history: str | None = None) -> list[st
     try:
         asyncio.get_running_loop()
         # Already in an event loop; avoid nested loop usage and use lexical expansion only.
-        normalized = (query or "").strip()
-        if not settings.retrieval_enable_query_expansion or not normalized:
-            return [normalized]
-        candidates = [normalized]
-        keyword = _keyword_variant(normalized)
-        semantic = _semantic_variant(normalized)
-        if keyword:
-            candidates.append(keyword)
-        if semantic:
-            candidates.append(semantic)
-        max_variants = max(1, int(settings.retrieval_query_expansion_max_variants))
-        return _dedupe_variants(candidates, max_items=max_variants)
+        return lexical_query_variants(query)
     except RuntimeError:
         return asyncio.run(build_query_variants(query=query, history=history))
@@ -1,16 +1,18 @@
 """Hybrid retrieval and optional reranking for RAG queries."""
 from __future__ import annotations
 
-from functools import lru_cache
+from collections import OrderedDict
 import math
 import re
+import threading
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, TypedDict
 
 from app.core.config import settings
 from app.ingestion.embedding import embed_texts
 from app.services.embedding_versions import get_active_embedding_version_for_kb
-from app.services.qdrant_client import ensure_collection, get_qdrant, search_collection
+from app.services import retrieval_cache
+from app.services.qdrant_client import ensure_collection, get_qdrant, search_collection_batch
 
 TOKEN_RE = re.compile(r"[A-Za-z0-9_]+")
 RRF_K = 60.0
@@ -30,6 +32,17 @@ class Candidate:
     final_score: float = 0.0
 
 
+class HybridHit(TypedDict):
+    """Fused retrieval result, already ranked and sliced to `top_k`."""
+
+    snippet: str
+    score: float
+    metadata: dict[str, Any]
+    doc_id: int | None
+    dense_score: float
+    sparse_score: float
+
+
 def _tokenize(text: str) -> list[str]:
     return [t.lower() for t in TOKEN_RE.findall(text)]
 
@@ -125,28 +138,51 @@ def _optional_cross_encoder_score(query: str, docs: list[str]) -> list[float] |
         return None
 
 
-@lru_cache(maxsize=2048)
-def _query_embedding(query: str) -> tuple[float, ...]:
-    return tuple(embed_texts([query])[0])
+_QUERY_EMBEDDING_CACHE_SIZE = 2048
+_query_vectors: OrderedDict[str, tuple[float, ...]] = OrderedDict()
+_query_vectors_lock = threading.Lock()
 
 
-def _dense_search(kb_id: int, query: str, limit: int, embedding_version: str) -> list[Candidate]:
+def query_embeddings(queries: list[str]) -> list[tuple[float, ...]]:
+    """Embeddings of stripped queries, memoized; the uncached ones are encoded together in one model call."""
+    unique = list(dict.fromkeys(queries))
+    with _query_vectors_lock:
+        found = {query: _query_vectors[query] for query in unique if query in _query_vectors}
+        for query in found:
+            _query_vectors.move_to_end(query)
+    missing = [query for query in unique if query not in found]
+    if missing:
+        fresh = {query: tuple(vector) for query, vector in zip(missing, embed_texts(missing))}
+        with _query_vectors_lock:
+            _query_vectors.update(fresh)
+            while len(_query_vectors) > _QUERY_EMBEDDING_CACHE_SIZE:
+                _query_vectors.popitem(last=False)
+        found.update(fresh)
+    return [found[query] for query in queries]
+
+
+def query_embedding(query: str) -> tuple[float, ...]:
+    """Embedding of a stripped query, memoized so callers that embed ahead of retrieval do not pay twice."""
+    return query_embeddings([query])[0]
+
+
+def _dense_search(kb_id: int, queries: list[str], limit: int, embedding_version: str) -> list[list[Candidate]]:
+    """Dense hits for each query, from one batched embedding call and one batched Qdrant search."""
     coll = ensure_collection(kb_id, embedding_version=embedding_version)
-    vector = list(_query_embedding(query.strip()))
-    hits = search_collection(collection=coll, vector=vector, limit=limit)
-    out: list[Candidate] = []
-    for h in hits:
-        payload = h.payload or {}
-        out.append(
+    vectors = [list(vector) for vector in query_embeddings([query.strip() for query in queries])]
+    return [
+        [
             Candidate(
                 point_id=str(h.id),
-                text=(payload.get("text") or ""),
-                metadata=(payload.get("metadata") or {}),
-                doc_id=payload.get("doc_id"),
+                text=((h.payload or {}).get("text") or ""),
+                metadata=((h.payload or {}).get("metadata") or {}),
+                doc_id=(h.payload or {}).get("doc_id"),
                 dense_score=float(h.score or 0.0),
             )
-        )
-    return out
+            for h in hits
+        ]
+        for hits in search_collection_batch(collection=coll, vectors=vectors, limit=limit)
+    ]
 
 
 def _scroll_candidates(kb_id: int, embedding_version: str, max_points: int = 800) -> list[Candidate]:
@@ -193,19 +229,47 @@ def hybrid_retrieve(
     rerank_top_n: int | None = None,
     query_variants: list[str] | None = None,
     embedding_version: str | None = None,
-) -> list[dict[str, Any]]:
-    """Hybrid retrieve with dense + BM25 sparse + RRF and optional reranking."""
+    snippet_chars: int | None = None,
+) -> list[HybridHit]:
+    """Hybrid retrieve with dense + BM25 sparse + RRF and optional reranking.
+
+    `snippet_chars` truncates each snippet so callers can return the hits as-is. Results are cached per exact
+    request (see `retrieval_cache`); a hit skips the embedding, Qdrant, BM25 and rerank work entirely.
+    """
     top_k = top_k or settings.retrieval_top_k
     dense_limit = dense_limit or settings.retrieval_dense_limit
     sparse_pool = sparse_pool if sparse_pool is not None else settings.retrieval_sparse_pool
     rerank_top_n = rerank_top_n or settings.retrieval_rerank_top_n
     variants = _normalize_query_variants(query, query_variants=query_variants)
+    digest = retrieval_cache.request_digest(
+        query, variants, top_k, dense_limit, sparse_pool, rerank_top_n, embedding_version, snippet_chars
+    )
+    cached, entry_key = retrieval_cache.cached_hits(kb_id, digest)
+    if cached is not None:
+        return cached
+    hits = _hybrid_retrieve(
+        kb_id, query, variants, top_k, dense_limit, sparse_pool, rerank_top_n, embedding_version, snippet_chars
+    )
+    retrieval_cache.store_hits(entry_key, hits)
+    return hits
+
+
+def _hybrid_retrieve(
+    kb_id: int,
+    query: str,
+    variants: list[str],
+    top_k: int,
+    dense_limit: int,
+    sparse_pool: int,
+    rerank_top_n: int,
+    embedding_version: str | None,
+    snippet_chars: int | None,
+) -> list[HybridHit]:
     resolved_version = (embedding_version or "").strip() or get_active_embedding_version_for_kb(kb_id)
 
     dense_rrf_rank: dict[str, float] = {}
     dense_best: dict[str, Candidate] = {}
-    for variant in variants:
-        dense_hits = _dense_search(kb_id, variant, dense_limit, resolved_version)
+    for dense_hits in _dense_search(kb_id, variants, dense_limit, resolved_version):
         ranked_dense = sorted(dense_hits, key=lambda x: x.dense_score, reverse=True)
         for rank, candidate in enumerate(ranked_dense, start=1):
             dense_rrf_rank[candidate.point_id] = dense_rrf_rank.get(candidate.point_id, 0.0) + (1.0 / (RRF_K + rank))
@@ -263,12 +327,13 @@ def hybrid_retrieve(
     out = pre_rerank[:top_k]
     return [
         {
-            "snippet": c.text,
-            "score": c.final_score,
+            "snippet": c.text[:snippet_chars] if snippet_chars else c.text,
+            # Plain floats: cross-encoder scores may be numpy scalars.
+            "score": float(c.final_score),
             "metadata": c.metadata,
             "doc_id": c.doc_id,
-            "dense_score": c.dense_score,
-            "sparse_score": c.sparse_score,
+            "dense_score": float(c.dense_score),
+            "sparse_score": float(c.sparse_score),
         }
         for c in out
     ]
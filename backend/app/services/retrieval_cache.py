@@ -0,0 +1,94 @@
+"""Redis cache of hybrid retrieval results, keyed by the exact request.
+
+Every result is its own Redis key written with `SET ... EX retrieval_cache_ttl_seconds`, so the TTL bounds how
+long any one entry can be served even if an invalidation is missed. Entry keys embed a per-KB generation counter;
+`invalidate_kb` bumps it with a single INCR, which orphans the KB's old entries until they expire on their own.
+Every helper is best-effort: Redis errors are logged and treated as a miss.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+from typing import Any
+
+import orjson
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_KEY_PREFIX = "ragnetic:retrieval:"
+
+_client = None
+
+
+def _generation_key(kb_id: int) -> str:
+    return f"{_KEY_PREFIX}{kb_id}:generation"
+
+
+def _entry_key(kb_id: int, generation: int, digest: str) -> str:
+    return f"{_KEY_PREFIX}{kb_id}:g{generation}:{digest}"
+
+
+def request_digest(*parts: Any) -> str:
+    """Stable key suffix for one retrieval request; `parts` must be JSON-serializable."""
+    return hashlib.blake2b(orjson.dumps(parts), digest_size=16).hexdigest()
+
+
+def _get_client():
+    global _client
+    if settings.retrieval_cache_ttl_seconds <= 0:
+        return None
+    if _client is None:
+        try:
+            from redis import Redis
+
+            _client = Redis.from_url(settings.redis_url, socket_connect_timeout=0.5, socket_timeout=0.5)
+        except Exception as exc:
+            logger.warning("Retrieval cache disabled: %s", exc)
+            return None
+    return _client
+
+
+def cached_hits(kb_id: int, digest: str) -> tuple[list[dict[str, Any]] | None, str | None]:
+    """Return `(hits, entry_key)`; pass `entry_key` to `store_hits` on a miss.
+
+    The key is resolved against the KB's generation at lookup time, so results computed across an invalidation
+    are written under the old generation and never served. `entry_key` is None when the cache is unavailable.
+    """
+    client = _get_client()
+    if client is None:
+        return None, None
+    try:
+        generation = int(client.get(_generation_key(kb_id)) or 0)
+        key = _entry_key(kb_id, generation, digest)
+        raw = client.get(key)
+    except Exception as exc:
+        logger.debug("Retrieval cache read failed for kb_id=%s: %s", kb_id, exc)
+        return None, None
+    return (orjson.loads(raw) if raw else None), key
+
+
+def store_hits(entry_key: str | None, hits: list[dict[str, Any]]) -> None:
+    client = _get_client()
+    if client is None or entry_key is None:
+        return
+    try:
+        client.set(
+            entry_key,
+            orjson.dumps(hits, option=orjson.OPT_SERIALIZE_NUMPY),
+            ex=settings.retrieval_cache_ttl_seconds,
+        )
+    except Exception as exc:
+        logger.debug("Retrieval cache write failed for %s: %s", entry_key, exc)
+
+
+def invalidate_kb(kb_id: int) -> None:
+    """Forget every cached result for a KB; call after its indexed content or active embedding version changes."""
+    client = _get_client()
+    if client is None:
+        return
+    try:
+        client.incr(_generation_key(kb_id))
+    except Exception as exc:
+        logger.warning("Retrieval cache invalidation failed for kb_id=%s: %s", kb_id, exc)
@@ -6,6 +6,8 @@ from app.core.config import settings
 
 # Optional MinIO; fallback to in-memory / filesystem if not available
 _client = None
+_MIB = 1024 * 1024
+_MAX_MULTIPART_PARTS = 10000
 
 
 def _get_client():
@@ -39,13 +41,29 @@ def ensure_bucket():
         pass
 
 
+def _part_size_for(size: int) -> int:
+    """Fixed multipart part size, or 0 to let the client size parts when the object needs more parts than allowed."""
+    part_size = max(5, settings.storage_upload_part_size_mb) * _MIB
+    return part_size if size <= part_size * _MAX_MULTIPART_PARTS else 0
+
+
 def upload_file(object_key: str, data: BinaryIO, size: int, content_type: str = "application/octet-stream") -> str:
-    """Upload file to object store. Returns object_key."""
+    """Upload file to object store. Returns object_key.
+
+    `data` is streamed in multipart parts, so memory stays at one part per upload regardless of file size.
+    """
     c = _get_client()
     if c is None:
         raise RuntimeError("MinIO not configured or unavailable")
     ensure_bucket()
-    c.put_object(settings.minio_bucket, object_key, data, size, content_type=content_type)
+    c.put_object(
+        settings.minio_bucket,
+        object_key,
+        data,
+        size,
+        content_type=content_type,
+        part_size=_part_size_for(size),
+    )
     return object_key
 
 
@@ -67,6 +85,21 @@ def get_stream(object_key: str) -> BinaryIO:
     return io.BytesIO(data)
 
 
+def delete_files(object_keys: list[str]) -> None:
+    """Delete several objects with one batched request; best-effort like `delete_file`."""
+    c = _get_client()
+    if c is None or not object_keys:
+        return
+    try:
+        from minio.deleteobjects import DeleteObject
+
+        # remove_objects is lazy: the request is sent, in batches of 1000, only while the errors are iterated.
+        for _error in c.remove_objects(settings.minio_bucket, [DeleteObject(key) for key in object_keys]):
+            pass
+    except Exception:
+        pass
+
+
 def delete_file(object_key: str) -> None:
     """Delete file from object store; ignore missing objects."""
     c = _get_client()
@@ -0,0 +1,125 @@
+"""Bearer-token decoder specialized at startup for the single configured JWT algorithm."""
+from __future__ import annotations
+
+import binascii
+import hmac
+import time
+from typing import Any, Callable
+
+import jwt
+import orjson
+from jwt.algorithms import HMACAlgorithm
+from jwt.exceptions import (
+    DecodeError,
+    ExpiredSignatureError,
+    ImmatureSignatureError,
+    InvalidAlgorithmError,
+    InvalidAudienceError,
+    InvalidIssuedAtError,
+    InvalidSignatureError,
+    InvalidSubjectError,
+    InvalidTokenError,
+    MissingRequiredClaimError,
+)
+
+_URLSAFE_TO_STANDARD = bytes.maketrans(b"-_", b"+/")
+_PADDING = (b"", None, b"==", b"=")
+
+
+def _split_token(token: str) -> tuple[bytes, bytes, bytes, bytes]:
+    """Return (signing_input, header, payload, signature) with the base64 segments still encoded.
+
+    The URL-safe alphabet is translated for the whole token in one pass so each segment
+    can go straight to `binascii.a2b_base64`.
+    """
+    raw = token.encode("ascii")
+    first = raw.index(b".")
+    second = raw.index(b".", first + 1)
+    if raw.find(b".", second + 1) != -1:
+        raise ValueError("Too many token segments")
+    standard = raw.translate(_URLSAFE_TO_STANDARD)
+    return raw[:second], standard[:first], standard[first + 1 : second], standard[second + 1 :]
+
+
+def _b64decode(segment: bytes) -> bytes:
+    padding = _PADDING[len(segment) % 4]
+    if padding is None:
+        raise binascii.Error("Invalid base64 segment length")
+    return binascii.a2b_base64(segment + padding, strict_mode=True)
+
+
+def _numeric_date(payload: dict[str, Any], claim: str) -> float | None:
+    value = payload.get(claim)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise DecodeError(f"{claim} claim must be a number")
+    return float(value)
+
+
+def build_token_decoder(
+    algorithm: str, key: Any, required: tuple[str, ...] = ("exp", "sub")
+) -> Callable[[str], dict[str, Any]]:
+    """Return `decode(token) -> payload` with the algorithm, key and required claims fixed.
+
+    Equivalent to `jwt.decode(token, key, algorithms=[algorithm], options={"require": required})`
+    for compact three-part tokens, without per-call option merging or algorithm dispatch: the same
+    exp/nbf/iat checks, and any `aud` claim is rejected since no audience is configured.
+    Claims are checked before the signature so expired tokens skip the signature work.
+    """
+    algorithm_impl = jwt.get_algorithm_by_name(algorithm)
+    if isinstance(algorithm_impl, HMACAlgorithm):
+        digestmod = algorithm_impl.hash_alg
+
+        def verify_signature(signing_input: bytes, signature: bytes) -> bool:
+            return hmac.compare_digest(hmac.digest(key, signing_input, digestmod), signature)
+
+    else:
+
+        def verify_signature(signing_input: bytes, signature: bytes) -> bool:
+            return algorithm_impl.verify(signing_input, key, signature)
+
+    def decode(token: str) -> dict[str, Any]:
+        try:
+            signing_input, header_b64, payload_b64, signature_b64 = _split_token(token)
+            header = orjson.loads(_b64decode(header_b64))
+            payload = orjson.loads(_b64decode(payload_b64))
+        except (ValueError, binascii.Error) as exc:
+            raise DecodeError("Invalid token encoding") from exc
+        if not isinstance(header, dict) or header.get("alg") != algorithm:
+            raise InvalidAlgorithmError("Unexpected token algorithm")
+        if "crit" in header:
+            raise InvalidTokenError("Unsupported critical header parameters")
+        if not isinstance(payload, dict):
+            raise DecodeError("Invalid payload")
+        for claim in required:
+            if payload.get(claim) is None:
+                raise MissingRequiredClaimError(claim)
+        if "sub" in payload and not isinstance(payload["sub"], str):
+            raise InvalidSubjectError("Subject must be a string")
+        now = time.time()
+        exp = _numeric_date(payload, "exp")
+        if exp is not None and exp <= now:
+            raise ExpiredSignatureError("Signature has expired")
+        nbf = _numeric_date(payload, "nbf")
+        if nbf is not None and nbf > now:
+            raise ImmatureSignatureError("The token is not yet valid (nbf)")
+        if "iat" in payload:
+            try:
+                iat = int(payload["iat"])
+            except (ValueError, TypeError, OverflowError):
+                raise InvalidIssuedAtError("Issued At claim (iat) must be an integer.") from None
+            if iat > now:
+                raise ImmatureSignatureError("The token is not yet valid (iat)")
+        # No audience is configured, so a token scoped to any audience was minted for another service.
+        if "aud" in payload:
+            raise InvalidAudienceError("Invalid audience")
+        try:
+            signature = _b64decode(signature_b64)
+        except (ValueError, binascii.Error) as exc:
+            raise DecodeError("Invalid token encoding") from exc
+        if not verify_signature(signing_input, signature):
+            raise InvalidSignatureError("Signature verification failed")
+        return payload
+
+    return decode
@@ -3,16 +3,20 @@ from __future__ import annotations
 
 import asyncio
 from datetime import datetime
-import json
 import logging
 import time
 
+import orjson
+from sqlalchemy import bindparam, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
 from app.core.celery_app import celery_app
 from app.core.config import settings
 from app.models.base import SessionLocal
 from app.models.chat import ChatJob, ChatJobStatus, ChatMessage, ChatRole, ChatSession
 from app.services.audit import log_audit_event
-from app.services.context import assemble_context
+from app.services.chat_history import append_history_sync, history_line
+from app.services.context import CHAT_SYSTEM_PROMPT, assemble_context, build_user_prompt, select_chat_sources
 from app.services.citations import append_citation_legend, enforce_citation_format
 from app.services.faithfulness import faithfulness_signals as compute_faithfulness_signals
 from app.services.llm import generate as llm_generate
@@ -22,32 +26,27 @@ from app.services.retrieval import hybrid_retrieve
 logger = logging.getLogger(__name__)
 
 
+_RECENT_MESSAGES_STMT = (
+    select(ChatMessage.role, ChatMessage.content)
+    .where(ChatMessage.session_id == bindparam("session_id"))
+    .order_by(ChatMessage.id.desc())
+    .limit(bindparam("limit"))
+)
+
+
 def _history_for_prompt(db, session_id: str, max_messages: int = 10) -> str:
-    rows = (
-        db.query(ChatMessage)
-        .filter(ChatMessage.session_id == session_id)
-        .order_by(ChatMessage.id.desc())
-        .limit(max_messages)
-        .all()
+    rows = db.execute(_RECENT_MESSAGES_STMT, {"session_id": session_id, "limit": max_messages}).all()
+    return "\n".join(history_line(role, content) for role, content in rows[::-1])
+
+
+def _touch_chat_session(db, user_id: int, kb_id: int, session_id: str) -> None:
+    """Create the session if the API never committed it, or bump `updated_at`, in one upsert."""
+    now = datetime.utcnow()
+    db.execute(
+        pg_insert(ChatSession)
+        .values(id=session_id, user_id=user_id, knowledge_base_id=kb_id, created_at=now, updated_at=now)
+        .on_conflict_do_update(index_elements=[ChatSession.id], set_={"updated_at": now})
     )
-    if not rows:
-        return ""
-    ordered = list(reversed(rows))
-    lines = []
-    for msg in ordered:
-        speaker = "User" if msg.role == ChatRole.USER else "Assistant"
-        lines.append(f"{speaker}: {msg.content}")
-    return "\n".join(lines)
-
-
-def _get_or_create_chat_session(db, user_id: int, kb_id: int, session_id: str) -> ChatSession:
-    session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
-    if session is not None:
-        return session
-    session = ChatSession(id=session_id, user_id=user_id, knowledge_base_id=kb_id)
-    db.add(session)
-    db.flush()
-    return session
 
 
 def _retrieve_for_chat(
@@ -63,49 +62,20 @@ def _retrieve_for_chat(
         top_k=retrieval_limit,
         query_variants=query_variants,
     )
-    mapped = [{"snippet": r.get("snippet", ""), "metadata": r.get("metadata", {}), "score": r.get("score", 0.0)} for r in rows]
-    return _dedupe_sources_for_chat(mapped, limit=limit)
-
-
-def _source_identity(source: dict, index: int) -> str:
-    metadata = source.get("metadata") or {}
-    doc_id = metadata.get("doc_id")
-    if doc_id is not None:
-        return f"doc:{doc_id}"
-    name = metadata.get("source") or metadata.get("filename") or metadata.get("title")
-    if isinstance(name, str) and name.strip():
-        return f"name:{name.strip().lower()}"
-    return f"idx:{index}"
-
-
-def _dedupe_sources_for_chat(sources: list[dict], limit: int) -> list[dict]:
-    if not settings.chat_unique_sources_per_document:
-        return sources[:limit]
-    deduped: list[dict] = []
-    seen: set[str] = set()
-    for idx, source in enumerate(sources):
-        key = _source_identity(source, idx)
-        if key in seen:
-            continue
-        seen.add(key)
-        deduped.append(source)
-        if len(deduped) >= limit:
-            break
-    return deduped
+    return select_chat_sources(rows, limit)
 
 
 def _fallback_answer_from_sources(sources: list[dict], detail: str) -> str:
-    snippets = [
-        (s.get("snippet") or "").replace("\n", " ").strip()
-        for s in sources
-        if (s.get("snippet") or "").strip()
-    ]
-    if not snippets:
+    preview_lines: list[str] = []
+    for s in sources:
+        snippet = (s.get("snippet") or "").replace("\n", " ").strip()
+        if not snippet:
+            continue
+        preview_lines.append(f"- {snippet[:220]}..." if len(snippet) > 220 else f"- {snippet}")
+        if len(preview_lines) == 3:
+            break
+    if not preview_lines:
         return f"LLM unavailable ({detail}). No retrieved content is available yet."
-    preview_lines = []
-    for snippet in snippets[:3]:
-        cut = snippet[:220] + ("..." if len(snippet) > 220 else "")
-        preview_lines.append(f"- {cut}")
     return (
         f"LLM unavailable ({detail}). I could not generate a model answer. "
         "Top retrieved excerpts:\n" + "\n".join(preview_lines)
@@ -166,12 +136,6 @@ def process_chat_job(self, job_id: str) -> dict:
         job.started_at = datetime.utcnow()
         db.commit()
 
-        session = _get_or_create_chat_session(
-            db=db,
-            user_id=job.user_id,
-            kb_id=job.knowledge_base_id,
-            session_id=job.session_id,
-        )
         history = _history_for_prompt(db, job.session_id, max_messages=10)
 
         source_limit = max(1, settings.chat_context_max_sources)
@@ -197,24 +161,9 @@ def process_chat_job(self, job_id: str) -> dict:
         if not context_blocks:
             answer = "No relevant documents found in the selected knowledge base yet. Upload documents and try again."
         else:
-            system = (
-                "You are a grounded assistant for this RAG system. "
-                "Use only the provided context blocks for factual claims; never invent details. "
-                "Use conversation history only for continuity. "
-                "Answer the user directly from available evidence, regardless of document type "
-                "(for example PRDs, runbooks, policies, specs, tickets, or notes). "
-                "If partial evidence exists, provide what is known and mark missing parts as "
-                "\"Not specified in provided context.\" "
-                "Do not ask for more context unless zero relevant evidence exists. "
-                "Do not say \"I couldn't find\" when at least one relevant fact is available. "
-                "When the question asks for lists (features, phases, requirements, steps, risks), "
-                "respond in a concise structured list. "
-                "For every factual bullet/sentence, append citations in the form [Source N]."
-            )
-            history_block = f"Conversation history:\n{history}\n\n" if history else ""
-            user_prompt = f"{history_block}Context:\n\n{context_blocks}\n\nQuestion: {job.question}"
+            user_prompt = build_user_prompt(job.question, history, context_blocks)
             try:
-                answer = asyncio.run(llm_generate(user_prompt, system=system))
+                answer = asyncio.run(llm_generate(user_prompt, system=CHAT_SYSTEM_PROMPT))
             except Exception as exc:
                 detail = str(exc).strip() or exc.__class__.__name__
                 logger.warning("Async chat LLM failed for job_id=%s: %s", job_id, detail)
@@ -230,10 +179,11 @@ def process_chat_job(self, job_id: str) -> dict:
             enabled=settings.chat_enable_faithfulness_scoring,
         )
 
+        # Runs before the message is staged so the session row exists when the flush inserts it.
+        _touch_chat_session(db, job.user_id, job.knowledge_base_id, job.session_id)
         db.add(ChatMessage(session_id=job.session_id, role=ChatRole.ASSISTANT, content=answer))
-        session.updated_at = datetime.utcnow()
         job.answer = answer
-        job.sources_json = json.dumps(sources)
+        job.sources_json = orjson.dumps(sources).decode()
         job.status = ChatJobStatus.COMPLETED
         job.finished_at = datetime.utcnow()
         log_audit_event(
@@ -254,7 +204,9 @@ def process_chat_job(self, job_id: str) -> dict:
                 "low_faithfulness": faithfulness["low_faithfulness"],
             },
         )
+        session_id = job.session_id
         db.commit()
+        append_history_sync(session_id, history_line(ChatRole.ASSISTANT, answer))
         return {"job_id": job_id, "status": "completed"}
     except Exception as exc:
         db.rollback()
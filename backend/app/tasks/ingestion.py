@@ -1,4 +1,5 @@
 """Document ingestion Celery task: parse, chunk, embed, index."""
+import logging
 import uuid
 from app.core.celery_app import celery_app
 from app.ingestion.chunking import chunk_text
@@ -23,9 +24,11 @@ from app.services.ingestion_tracking import (
     update_ingestion_job_progress,
 )
 from app.services.embedding_versions import get_active_embedding_version
-from app.services.qdrant_client import delete_document_chunks, ensure_collection, upsert_chunks
+from app.services import answer_cache, retrieval_cache
+from app.services.qdrant_client import delete_document_chunks, document_chunk_vectors, ensure_collection, upsert_chunks
 from app.services.storage import get_stream
-from qdrant_client.models import PointStruct
+
+logger = logging.getLogger(__name__)
 
 
 def _update_doc_status(doc_id: int, status: str, error_message: str | None = None):
@@ -43,6 +46,26 @@ def _update_doc_status(doc_id: int, status: str, error_message: str | None = Non
         db.close()
 
 
+def _embed_reusing(texts: list[str], previous: dict[str, list[float]]) -> tuple[list[list[float]], int]:
+    """Embed only texts without a stored vector; returns (vectors in input order, reused count)."""
+    missing = [i for i, text in enumerate(texts) if text not in previous]
+    fresh = embed_texts([texts[i] for i in missing]) if missing else []
+    vectors = [previous.get(text) for text in texts]
+    for i, vec in zip(missing, fresh):
+        vectors[i] = vec
+    return vectors, len(texts) - len(missing)
+
+
+def _previous_chunk_vectors(kb_id: int, document_id: int, embedding_version: str) -> dict[str, list[float]]:
+    if not settings.ingestion_reuse_chunk_embeddings:
+        return {}
+    try:
+        return document_chunk_vectors(kb_id=kb_id, doc_id=document_id, embedding_version=embedding_version)
+    except Exception as exc:
+        logger.warning("Could not load previous vectors for document_id=%s: %s", document_id, exc)
+        return {}
+
+
 @celery_app.task(bind=True)
 def ingest_document(
     self,
@@ -51,6 +74,8 @@ def ingest_document(
     embedding_version: str | None = None,
 ) -> dict:
     """Parse, chunk, embed, and index a document."""
+    from qdrant_client.models import PointStruct
+
     def _job_running(progress: int | None = None) -> None:
         if ingestion_job_id is None:
             return
@@ -142,15 +167,6 @@ def ingest_document(
             _resolve_dlq()
             return {"document_id": document_id, "status": "indexed", "chunks": 0}
 
-        stage = "embed"
-        self.update_state(state="PROCESSING", meta={"progress": 50})
-        _job_progress(50)
-        texts = [c.text for c in chunks]
-        vectors = embed_texts(texts)
-        stage = "index"
-        self.update_state(state="PROCESSING", meta={"progress": 70})
-        _job_progress(70)
-
         db2 = SessionLocal()
         try:
             doc_ref = db2.query(Document).filter(Document.id == document_id).first()
@@ -159,6 +175,19 @@ def ingest_document(
         finally:
             db2.close()
 
+        stage = "embed"
+        self.update_state(state="PROCESSING", meta={"progress": 50})
+        _job_progress(50)
+        texts = [c.text for c in chunks]
+        # Re-uploads of an edited document keep most chunks; only new or changed text is embedded.
+        previous = _previous_chunk_vectors(kb_id, document_id, resolved_embedding_version)
+        vectors, reused = _embed_reusing(texts, previous)
+        if reused:
+            logger.info("Reused %s/%s chunk embeddings for document_id=%s", reused, len(texts), document_id)
+        stage = "index"
+        self.update_state(state="PROCESSING", meta={"progress": 70})
+        _job_progress(70)
+
         coll = ensure_collection(kb_id, embedding_version=resolved_embedding_version)
         # Ensure re-indexing a document does not leave stale chunks behind.
         delete_document_chunks(
@@ -175,6 +204,8 @@ def ingest_document(
             for c, vec in zip(chunks, vectors)
         ]
         upsert_chunks(coll, points)
+        retrieval_cache.invalidate_kb(kb_id)
+        answer_cache.invalidate_kb(kb_id)
         self.update_state(state="PROCESSING", meta={"progress": 100})
         _job_progress(100)
         _update_doc_status(document_id, DocumentStatus.INDEXED)
@@ -190,6 +221,8 @@ def ingest_document(
 @celery_app.task(bind=True)
 def migrate_kb_embedding_namespace(self, kb_id: int, target_version: str) -> dict:
     """Re-index all documents in a KB into target embedding namespace."""
+    from qdrant_client.models import PointStruct
+
     version = normalize_embedding_version(target_version)
     db = SessionLocal()
     try:
@@ -285,6 +318,9 @@ def migrate_kb_embedding_namespace(self, kb_id: int, target_version: str) -> dic
         )
     finally:
         dbc.close()
+    # Retrieval now reads the new embedding namespace.
+    retrieval_cache.invalidate_kb(kb_id)
+    answer_cache.invalidate_kb(kb_id)
     return {
         "kb_id": kb_id,
         "target_version": version,
@@ -1,7 +1,37 @@
 import sys
 from pathlib import Path
 
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+
 
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
+
+import app.models.init_db  # noqa: E402,F401 - registers every model on Base.metadata
+from app.models.base import Base  # noqa: E402
+
+
+class SqliteSessions:
+    """Session factory over a private in-memory SQLite database holding the full schema."""
+
+    def __init__(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self._factory = sessionmaker(bind=self.engine)
+
+    def __call__(self) -> Session:
+        return self._factory()
+
+    def record_statements(self) -> list[str]:
+        """The SQL sent from now on, appended as each statement executes."""
+        statements: list[str] = []
+        event.listen(self.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        return statements
+
+
+@pytest.fixture
+def sqlite_session() -> SqliteSessions:
+    return SqliteSessions()
@@ -24,3 +24,28 @@ def test_normalize_session_id_accepts_valid():
 def test_normalize_session_id_rejects_invalid():
     with pytest.raises(HTTPException):
         _normalize_session_id("bad id with spaces")
+
+
+def test_normalize_session_id_enforces_length_and_ascii():
+    assert _normalize_session_id("a" * 128) == "a" * 128
+    for bad in ("a" * 129, "sessión", "id/with/slash"):
+        with pytest.raises(HTTPException):
+            _normalize_session_id(bad)
+
+
+def test_require_org_membership_reads_only_the_role(sqlite_session):
+    from app.api import routes
+    from app.models.tenant import Organization, OrganizationMembership, OrganizationRole
+    from app.models.user import User
+
+    with sqlite_session() as db:
+        db.add_all([User(id=1, email="a@example.com", password_hash="x"), Organization(id=1, name="Org")])
+        db.add(OrganizationMembership(organization_id=1, user_id=1, role=OrganizationRole.MEMBER))
+        db.commit()
+        statements = sqlite_session.record_statements()
+        assert routes._require_org_membership(db, 1, 1) == OrganizationRole.MEMBER
+        assert statements[0].startswith("SELECT organization_memberships.role \nFROM")
+        with pytest.raises(HTTPException):
+            routes._require_org_membership(db, 1, 1, min_role=OrganizationRole.ADMIN)
+        with pytest.raises(HTTPException):
+            routes._require_org_membership(db, 2, 1)
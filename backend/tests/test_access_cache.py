@@ -0,0 +1,75 @@
+from app.models.document import KnowledgeBase, KnowledgeBaseMembership, KnowledgeBaseRole
+from app.models.user import User
+from app.services import access
+
+
+def _seeded_session(Session):
+    with Session() as db:
+        db.add_all([User(id=1, email="a@example.com", password_hash="x"), KnowledgeBase(id=1, name="KB")])
+        db.add(KnowledgeBaseMembership(knowledge_base_id=1, user_id=1, role=KnowledgeBaseRole.VIEWER))
+        db.commit()
+    return Session, Session.record_statements()
+
+
+def test_repeated_access_checks_hit_the_cache(sqlite_session):
+    access.invalidate_access_cache()
+    Session, statements = _seeded_session(sqlite_session)
+    with Session() as db:
+        assert access.get_default_accessible_kb_id(db, 1) == 1
+        assert access.require_kb_access(db, 1, 1).role == KnowledgeBaseRole.VIEWER
+        issued = len(statements)
+        assert access.get_default_accessible_kb_id(db, 1) == 1
+        assert access.require_kb_access(db, 1, 1).role == KnowledgeBaseRole.VIEWER
+    assert len(statements) == issued
+
+
+def test_committed_membership_change_invalidates_cached_grant(sqlite_session):
+    access.invalidate_access_cache()
+    Session, _ = _seeded_session(sqlite_session)
+    with Session() as db:
+        assert access.require_kb_access(db, 1, 1).role == KnowledgeBaseRole.VIEWER
+        membership = db.query(KnowledgeBaseMembership).one()
+        membership.role = KnowledgeBaseRole.EDITOR
+        db.commit()
+        assert access.require_kb_access(db, 1, 1, min_role=KnowledgeBaseRole.EDITOR).role == KnowledgeBaseRole.EDITOR
+
+
+def test_repeat_kb_resolution_skips_the_session():
+    import asyncio
+
+    from app.api import routes
+
+    access.invalidate_access_cache()
+    calls = []
+
+    class _Db:
+        async def run_sync(self, fn, *args):
+            calls.append(args)
+            return 7
+
+    user = User(id=1, email="a@example.com")
+    for _ in range(3):
+        assert asyncio.run(routes._resolve_kb_for_user(_Db(), user, None, KnowledgeBaseRole.VIEWER)) == 7
+    assert calls == [(1, None, KnowledgeBaseRole.VIEWER)]
+    access.invalidate_access_cache()
+    asyncio.run(routes._resolve_kb_for_user(_Db(), user, None, KnowledgeBaseRole.VIEWER))
+    assert len(calls) == 2
+
+
+def test_org_role_is_cached_until_membership_changes(sqlite_session):
+    from app.models.tenant import Organization, OrganizationMembership, OrganizationRole
+
+    access.invalidate_access_cache()
+    Session, statements = _seeded_session(sqlite_session)
+    with Session() as db:
+        db.add(Organization(id=1, name="Org"))
+        db.add(OrganizationMembership(organization_id=1, user_id=1, role=OrganizationRole.MEMBER))
+        db.commit()
+        assert access.cached_org_role(db, 1, 1) == OrganizationRole.MEMBER
+        issued = len(statements)
+        assert access.cached_org_role(db, 1, 1) == OrganizationRole.MEMBER
+        assert len(statements) == issued
+
+        db.query(OrganizationMembership).one().role = OrganizationRole.ADMIN
+        db.commit()
+        assert access.cached_org_role(db, 1, 1) == OrganizationRole.ADMIN
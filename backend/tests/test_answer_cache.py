@@ -0,0 +1,91 @@
+import asyncio
+import random
+
+from app.services import answer_cache
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+
+    async def hmget(self, key, fields):
+        stored = self.hashes.get(key, {})
+        return [stored.get(field) for field in fields]
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def hset(self, key, mapping):
+        self.redis.hashes.setdefault(key, {}).update(mapping)
+
+    def expire(self, key, seconds):
+        pass
+
+    async def execute(self):
+        return []
+
+
+def _vector(seed, dim=64):
+    rng = random.Random(seed)
+    return [rng.gauss(0.0, 1.0) for _ in range(dim)]
+
+
+def _nudged(vector, scale, seed):
+    rng = random.Random(seed)
+    return [x + rng.gauss(0.0, scale) for x in vector]
+
+
+def _use_fake(monkeypatch):
+    fake = _FakeRedis()
+    monkeypatch.setattr(answer_cache.settings, "chat_answer_cache_ttl_seconds", 60)
+    monkeypatch.setattr(answer_cache, "_async_client", fake)
+    monkeypatch.setattr(answer_cache, "_sync_client", fake)
+    return fake
+
+
+def test_signatures_are_deterministic_and_scale_invariant():
+    vector = _vector(1)
+    assert answer_cache.signatures(vector) == answer_cache.signatures(list(vector))
+    assert answer_cache.signatures(vector) == answer_cache.signatures([3.0 * x for x in vector])
+    assert answer_cache.signatures(vector) != answer_cache.signatures(_vector(2))
+
+
+def test_near_duplicate_question_reuses_answer_for_same_user_only(monkeypatch):
+    _use_fake(monkeypatch)
+    question = _vector(1)
+    asyncio.run(answer_cache.store_answer(1, 7, question, {"answer": "PTO is 20 days [Source 1]"}))
+
+    assert asyncio.run(answer_cache.cached_answer(1, 7, _nudged(question, 0.05, seed=3))) == {
+        "answer": "PTO is 20 days [Source 1]"
+    }
+    assert asyncio.run(answer_cache.cached_answer(1, 8, question)) is None
+    assert asyncio.run(answer_cache.cached_answer(2, 7, question)) is None
+    assert asyncio.run(answer_cache.cached_answer(1, 7, _vector(2))) is None
+
+
+def test_invalidate_kb_drops_cached_answers(monkeypatch):
+    _use_fake(monkeypatch)
+    question = _vector(1)
+    asyncio.run(answer_cache.store_answer(1, 7, question, {"answer": "cached"}))
+    answer_cache.invalidate_kb(1)
+    assert asyncio.run(answer_cache.cached_answer(1, 7, question)) is None
+
+
+def test_disabled_cache_never_touches_redis(monkeypatch):
+    monkeypatch.setattr(answer_cache.settings, "chat_answer_cache_ttl_seconds", 0)
+    monkeypatch.setattr(answer_cache, "_async_client", object())
+    assert asyncio.run(answer_cache.cached_answer(1, 7, _vector(1))) is None
@@ -0,0 +1,67 @@
+import asyncio
+
+from app.services import audit
+
+
+class _FakeSession:
+    def __init__(self, calls, fail=False):
+        self.calls = calls
+        self.fail = fail
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, rows):
+        if self.fail:
+            raise RuntimeError("db down")
+        self.calls.append((str(statement).split()[0:3], list(rows)))
+
+    async def commit(self):
+        pass
+
+
+def _buffer_search_event(n):
+    audit.buffer_audit_event(
+        user_id=1,
+        knowledge_base_id=2,
+        action="search.query",
+        resource_type="knowledge_base",
+        resource_id="2",
+        details={"n": n},
+    )
+
+
+def test_buffered_events_are_written_in_batches(monkeypatch):
+    calls = []
+    monkeypatch.setattr(audit, "_buffer", audit.deque())
+    monkeypatch.setattr(audit, "_FLUSH_BATCH_ROWS", 2)
+    monkeypatch.setattr(audit, "AsyncSessionLocal", lambda: _FakeSession(calls))
+    for n in range(3):
+        _buffer_search_event(n)
+
+    assert asyncio.run(audit.flush_audit_buffer()) == 3
+    assert [len(rows) for _, rows in calls] == [2, 1]
+    assert calls[0][0] == ["INSERT", "INTO", "audit_logs"]
+    assert calls[1][1][0]["details_json"] == '{"n":2}'
+    assert calls[0][1][0]["created_at"] is not None
+
+
+def test_failed_flush_keeps_rows_for_next_attempt(monkeypatch):
+    monkeypatch.setattr(audit, "_buffer", audit.deque())
+    monkeypatch.setattr(audit, "AsyncSessionLocal", lambda: _FakeSession([], fail=True))
+    _buffer_search_event(0)
+    _buffer_search_event(1)
+
+    assert asyncio.run(audit.flush_audit_buffer()) == 0
+    assert [row["details_json"] for row in audit._buffer] == ['{"n":0}', '{"n":1}']
+
+
+def test_full_buffer_drops_new_events(monkeypatch):
+    monkeypatch.setattr(audit, "_buffer", audit.deque())
+    monkeypatch.setattr(audit.settings, "audit_buffer_max_rows", 1)
+    _buffer_search_event(0)
+    _buffer_search_event(1)
+    assert len(audit._buffer) == 1
@@ -0,0 +1,49 @@
+from app.api import routes
+from app.models.audit import AuditLog
+from app.models.user import User
+
+
+def _seeded_session(Session):
+    with Session() as db:
+        db.add(User(id=1, email="a@example.com", password_hash="x"))
+        db.add_all(
+            [
+                AuditLog(
+                    id=1,
+                    user_id=1,
+                    knowledge_base_id=1,
+                    action="kb.update",
+                    resource_type="knowledge_base",
+                    details_json='{"name": "KB"}',
+                ),
+                AuditLog(id=2, user_id=None, knowledge_base_id=1, action="chat.query", resource_type="chat"),
+                AuditLog(id=3, user_id=1, knowledge_base_id=2, action="kb.update", resource_type="knowledge_base"),
+            ]
+        )
+        db.commit()
+    return Session, Session.record_statements()
+
+
+def test_audit_listing_joins_actor_email_in_one_query(monkeypatch, sqlite_session):
+    monkeypatch.setattr(routes, "require_kb_access", lambda *args, **kwargs: None)
+    Session, statements = _seeded_session(sqlite_session)
+    with Session() as db:
+        rows = routes.list_audit_logs(db, user=User(id=1, email="a@example.com"), kb_id=1)
+
+    assert len(statements) == 1
+    assert sorted((row["id"], row["user_email"], row["details"]) for row in rows) == [
+        (1, "a@example.com", {"name": "KB"}),
+        (2, None, None),
+    ]
+
+
+def test_audit_listing_can_skip_details(monkeypatch, sqlite_session):
+    monkeypatch.setattr(routes, "require_kb_access", lambda *args, **kwargs: None)
+    Session, statements = _seeded_session(sqlite_session)
+    with Session() as db:
+        rows = routes.list_audit_logs(
+            db, user=User(id=1, email="a@example.com"), kb_id=1, action="kb.update", include_details=False
+        )
+
+    assert [(row["id"], row["details"]) for row in rows] == [(1, None)]
+    assert "audit_logs.details_json" not in statements[0]
@@ -0,0 +1,326 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+from jwt import InvalidTokenError
+
+from app.api import deps
+from app.services import token_decoder
+from app.services.auth_cache import ExpiringCache
+
+
+def test_expiring_cache_drops_expired_entries():
+    cache = ExpiringCache(max_entries=4)
+    cache.set("live", 1, expires_at=time.time() + 60)
+    cache.set("stale", 2, expires_at=time.time() - 1)
+    assert cache.get("live") == 1
+    assert cache.get("stale") is None
+
+
+def test_expiring_cache_evicts_least_recently_used():
+    cache = ExpiringCache(max_entries=2)
+    expires = time.time() + 60
+    cache.set("a", 1, expires_at=expires)
+    cache.set("b", 2, expires_at=expires)
+    assert cache.get("a") == 1
+    cache.set("c", 3, expires_at=expires)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_decode_token_reuses_verified_payload(monkeypatch):
+    token = jwt.encode(
+        {"sub": "user@example.com", "exp": int(time.time()) + 300},
+        deps.settings.jwt_secret,
+        algorithm=deps.settings.jwt_algorithm,
+    )
+    calls = []
+    real_verify = deps._verify_token
+
+    def _counting_verify(*args, **kwargs):
+        calls.append(1)
+        return real_verify(*args, **kwargs)
+
+    monkeypatch.setattr(deps, "_verify_token", _counting_verify)
+    assert deps._decode_token(token)["sub"] == "user@example.com"
+    assert deps._decode_token(token)["sub"] == "user@example.com"
+    assert len(calls) == 1
+
+
+def test_decode_token_does_not_cache_invalid_tokens():
+    with pytest.raises(InvalidTokenError):
+        deps._decode_token("not-a-jwt")
+    with pytest.raises(InvalidTokenError):
+        deps._decode_token("not-a-jwt")
+
+
+class _FakeDb:
+    def __init__(self, row):
+        self.calls = []
+        self.get_calls = []
+        self._row = row
+
+    async def scalar(self, statement):
+        self.calls.append(statement)
+        return self._row
+
+    async def get(self, model, ident, options=None):
+        self.get_calls.append(ident)
+        return self._row
+
+
+def test_user_lookup_is_cached_as_detached_snapshot():
+    deps._users_by_subject.clear()
+    row = type("Row", (), {"id": 42, "email": "cached@example.com"})()
+    db = _FakeDb(row)
+    first = asyncio.run(deps._get_user_cached(db, "42"))
+    second = asyncio.run(deps._get_user_cached(db, "42"))
+    assert first == second
+    assert (second.id, second.email) == (42, "cached@example.com")
+    assert db.get_calls == [42]
+    assert db.calls == []
+
+
+def test_legacy_email_subject_still_resolves():
+    deps._users_by_subject.clear()
+    row = type("Row", (), {"id": 7, "email": "legacy@example.com"})()
+    db = _FakeDb(row)
+    assert asyncio.run(deps._get_user_cached(db, "legacy@example.com")).id == 7
+    assert len(db.calls) == 1
+    assert db.get_calls == []
+
+
+def test_out_of_range_digit_subjects_find_no_user():
+    deps._users_by_subject.clear()
+    db = _FakeDb(None)
+    assert asyncio.run(deps._get_user_cached(db, "9" * 30)) is None
+    assert asyncio.run(deps._get_user_cached(db, "\u00b2")) is None
+    assert db.get_calls == []
+
+
+def test_decode_token_rejects_expired_without_verifying_signature(monkeypatch):
+    token = jwt.encode(
+        {"sub": "1", "exp": int(time.time()) - 30},
+        deps.settings.jwt_secret,
+        algorithm=deps.settings.jwt_algorithm,
+    )
+
+    def _unexpected_digest(*args, **kwargs):
+        raise AssertionError("signature verification should be skipped")
+
+    monkeypatch.setattr(token_decoder.hmac, "digest", _unexpected_digest)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        deps._decode_token(token)
+
+
+def test_get_current_user_is_memoized_per_request():
+    from types import SimpleNamespace
+
+    user = deps.CachedUser(id=3, email="state@example.com")
+    request = SimpleNamespace(state=SimpleNamespace(current_user=user))
+    assert asyncio.run(deps.get_current_user(request, credentials=None)) is user
+
+
+def test_decode_token_rejects_malformed_before_decoding(monkeypatch):
+    def _unexpected(*args, **kwargs):
+        raise AssertionError("malformed tokens should not be decoded")
+
+    monkeypatch.setattr(deps, "_verify_token", _unexpected)
+    for token in ("", "abc", "a.b", "a.b.c.d", "a.b.c d", "a..c"):
+        with pytest.raises(InvalidTokenError):
+            deps._decode_token(token)
+
+
+def test_not_yet_valid_token_is_accepted_once_nbf_passes():
+    deps._rejected_tokens.clear()
+    now = int(time.time())
+    token = jwt.encode(
+        {"sub": "1", "exp": now + 300, "nbf": now + 60},
+        deps.settings.jwt_secret,
+        algorithm=deps.settings.jwt_algorithm,
+    )
+    with pytest.raises(jwt.ImmatureSignatureError):
+        deps._decode_token(token)
+    assert deps._rejected_tokens.get(deps.token_cache_key(token)) is None
+
+
+def test_rejected_token_skips_verification_on_replay(monkeypatch):
+    deps._rejected_tokens.clear()
+    token = jwt.encode(
+        {"sub": "1", "exp": int(time.time()) + 300},
+        "some-other-secret-that-is-long-enough",
+        algorithm=deps.settings.jwt_algorithm,
+    )
+    with pytest.raises(InvalidTokenError):
+        deps._decode_token(token)
+
+    def _unexpected(*args, **kwargs):
+        raise AssertionError("replayed bad token should not be re-verified")
+
+    monkeypatch.setattr(deps, "_verify_token", _unexpected)
+    with pytest.raises(InvalidTokenError):
+        deps._decode_token(token)
+
+
+def test_middleware_stores_resolved_user_on_scope(monkeypatch):
+    from app.api import middleware
+
+    user = deps.CachedUser(id=5, email="mw@example.com")
+
+    async def _resolve(token):
+        assert token == "a.b.c"
+        return user
+
+    seen = {}
+
+    async def _app(scope, receive, send):
+        seen["user"] = scope["state"].get("current_user")
+
+    monkeypatch.setattr(middleware, "resolve_user_from_token", _resolve)
+    scope = {"type": "http", "headers": [(b"authorization", b"Bearer a.b.c")]}
+    asyncio.run(middleware.CurrentUserMiddleware(_app)(scope, None, None))
+    assert seen["user"] is user
+
+
+def test_email_subject_lookup_selects_only_auth_columns():
+    deps._users_by_subject.clear()
+    row = type("Row", (), {"id": 8, "email": "narrow@example.com"})()
+    db = _FakeDb(row)
+    asyncio.run(deps._get_user_cached(db, "narrow@example.com"))
+    sql = str(db.calls[0])
+    assert "password_hash" not in sql
+    assert "created_at" not in sql
+
+
+def test_eddsa_verification_key_is_public_half_of_private_pem():
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+    private_pem = Ed25519PrivateKey.generate().private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    key = deps._load_verification_key("EdDSA", private_pem)
+    token = jwt.encode({"sub": "1", "exp": int(time.time()) + 60}, private_pem, algorithm="EdDSA")
+    assert jwt.decode(token, key, algorithms=["EdDSA"])["sub"] == "1"
+    assert not hasattr(key, "sign")
+
+
+def test_db_session_middleware_closes_lazily_created_session():
+    import threading
+    from types import SimpleNamespace
+
+    from app.api import middleware
+
+    closed = []
+    session = SimpleNamespace(close=lambda: closed.append(threading.current_thread() is not threading.main_thread()))
+
+    async def _app(scope, receive, send):
+        scope.setdefault("state", {})["db"] = session
+
+    asyncio.run(middleware.DbSessionMiddleware(_app)({"type": "http"}, None, None))
+    assert closed == [True]
+
+    async def _untouched(scope, receive, send):
+        pass
+
+    asyncio.run(middleware.DbSessionMiddleware(_untouched)({"type": "http"}, None, None))
+    assert closed == [True]
+
+
+def test_db_session_middleware_closes_async_session():
+    from app.api import middleware
+
+    closed = []
+
+    class _AsyncSession:
+        async def close(self):
+            closed.append(True)
+
+    async def _app(scope, receive, send):
+        scope.setdefault("state", {})["async_db"] = _AsyncSession()
+
+    asyncio.run(middleware.DbSessionMiddleware(_app)({"type": "http"}, None, None))
+    assert closed == [True]
+
+
+def test_specialized_decoder_matches_pyjwt_on_valid_and_invalid_tokens():
+    secret = "a-test-secret-that-is-at-least-32-bytes"
+    decode = token_decoder.build_token_decoder("HS256", secret.encode())
+    now = int(time.time())
+    good = jwt.encode({"sub": "9", "exp": now + 60}, secret, algorithm="HS256")
+    assert decode(good) == jwt.decode(good, secret, algorithms=["HS256"])
+    bad_tokens = [
+        jwt.encode({"sub": "9", "exp": now + 60}, secret + "x", algorithm="HS256"),
+        jwt.encode({"sub": "9", "exp": now + 60}, secret, algorithm="HS384"),
+        jwt.encode({"sub": "9"}, secret, algorithm="HS256"),
+        jwt.encode({"sub": 9, "exp": now + 60}, secret, algorithm="HS256"),
+        jwt.encode({"sub": "9", "exp": now + 60, "nbf": now + 60}, secret, algorithm="HS256"),
+        jwt.encode({"sub": "9", "exp": now + 60, "aud": "other-service"}, secret, algorithm="HS256"),
+        jwt.encode({"sub": "9", "exp": now + 60, "iat": "yesterday"}, secret, algorithm="HS256"),
+        jwt.encode({"sub": "9", "exp": now + 60, "iat": now + 60}, secret, algorithm="HS256"),
+        good[:-2] + ("AA" if not good.endswith("AA") else "BB"),
+        good + ".extra",
+        good.replace(".", ".A", 1),
+        "\u00e9" + good,
+    ]
+    for token in bad_tokens:
+        with pytest.raises(InvalidTokenError):
+            jwt.decode(token, secret, algorithms=["HS256"], options={"require": ["exp", "sub"]})
+        with pytest.raises(InvalidTokenError):
+            decode(token)
+
+
+def test_resolve_user_retries_once_on_invalidated_connection(monkeypatch):
+    from sqlalchemy.exc import DBAPIError
+
+    deps._users_by_subject.clear()
+    row = type("Row", (), {"id": 11, "email": "retry@example.com"})()
+    attempts = []
+
+    class _Session:
+        async def __aenter__(self):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise DBAPIError("SELECT", {}, Exception("closed"), connection_invalidated=True)
+            return _FakeDb(row)
+
+        async def __aexit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(deps, "_decode_token", lambda token: {"sub": "11"})
+    monkeypatch.setattr(deps, "ReplicaSessionLocal", _Session)
+    user = asyncio.run(deps.resolve_user_from_token("a.b.c"))
+    assert user.id == 11
+    assert len(attempts) == 2
+
+
+def test_trusted_gateway_header_skips_token_verification(monkeypatch):
+    from app.api import middleware
+
+    user = deps.CachedUser(id=12, email="gw@example.com")
+    subjects = []
+
+    async def _resolve_subject(sub):
+        subjects.append(sub)
+        return user
+
+    async def _unexpected(token):
+        raise AssertionError("token should not be verified behind the gateway")
+
+    seen = {}
+
+    async def _app(scope, receive, send):
+        seen["user"] = scope["state"].get("current_user")
+
+    monkeypatch.setattr(deps.settings, "auth_trusted_subject_header", "X-JWT-Claim-Sub")
+    monkeypatch.setattr(middleware, "resolve_user_from_subject", _resolve_subject)
+    monkeypatch.setattr(middleware, "resolve_user_from_token", _unexpected)
+    scope = {
+        "type": "http",
+        "headers": [(b"authorization", b"Bearer a.b.c"), (b"x-jwt-claim-sub", b"12")],
+    }
+    asyncio.run(middleware.CurrentUserMiddleware(_app)(scope, None, None))
+    assert seen["user"] is user
+    assert subjects == ["12"]
@@ -12,3 +12,50 @@ def test_should_queue_async_for_detailed_hint():
 
 def test_should_not_queue_async_for_short_prompt():
     assert routes._should_queue_async("What is our PTO policy?") is False
+
+
+def test_async_hint_requires_whole_word():
+    assert routes._should_queue_async("Which team does this belong to?") is False
+    assert routes._should_queue_async("A LONG answer please") is True
+    assert routes._should_queue_async("Walk me through it step by step") is True
+
+
+def test_should_queue_async_ignores_edge_whitespace_in_length():
+    assert routes._should_queue_async(" " * 300 + "What is our PTO policy?") is False
+    assert routes._should_queue_async("  " + "x" * 260) is True
+
+
+def test_queue_async_chat_job_writes_everything_in_one_commit(monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+
+    from app.models.audit import AuditLog
+    from app.models.chat import ChatJob, ChatMessage, ChatSession
+
+    class _Db:
+        def __init__(self):
+            self.added = []
+            self.commits = 0
+
+        async def scalar(self, statement, execution_options=None):
+            return ChatSession(id="s-1", user_id=1, knowledge_base_id=2)
+
+        def add(self, obj):
+            self.added.append(obj)
+
+        def add_all(self, objs):
+            self.added.extend(objs)
+
+        async def commit(self):
+            self.commits += 1
+
+    async def _append_history(*args):
+        pass
+
+    monkeypatch.setattr(routes, "append_history", _append_history)
+    monkeypatch.setattr(routes, "process_chat_job", SimpleNamespace(delay=lambda job_id: None))
+    db = _Db()
+    out = asyncio.run(routes._queue_async_chat_job(db, SimpleNamespace(id=1), 2, "s-1", "Summarize everything"))
+    assert out["mode"] == "async"
+    assert db.commits == 1
+    assert [type(obj) for obj in db.added] == [ChatMessage, ChatJob, AuditLog]
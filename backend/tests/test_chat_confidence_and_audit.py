@@ -11,6 +11,15 @@ def test_chat_quality_signals_empty_sources_low_confidence():
     assert quality["low_confidence"] is True
 
 
+def test_confidence_score_uses_top_three_scores(monkeypatch):
+    monkeypatch.setattr(routes.settings, "chat_context_max_sources", 4)
+    sources = [{"score": 0.2}, {"score": 0.9}, {"score": 0.5}, {"score": 0.7}]
+    top_norm = 0.9 / 0.95
+    avg_top = (0.9 + 0.7 + 0.5) / 3
+    expected = 0.65 * top_norm + 0.25 * (avg_top / (avg_top + 0.05)) + 0.10
+    assert routes._compute_confidence_score(sources) == round(expected, 3)
+
+
 def test_faithfulness_signals_empty_sources_low():
     out = routes._faithfulness_signals("Any answer", [])
     assert out["faithfulness_score"] == 0.0
@@ -38,3 +47,20 @@ def test_normalize_kb_name_rejects_empty():
 def test_parse_details_handles_invalid_json():
     assert parse_details('{"a":1}') == {"a": 1}
     assert parse_details("not-json") == {"raw": "not-json"}
+
+
+def test_audit_details_round_trip_non_ascii():
+    from app.services.audit import _serialize_details
+
+    details = {"query_text": "café ☕", "source_count": 2}
+    assert parse_details(_serialize_details(details)) == details
+
+
+def test_query_audit_fields_strip_message_once():
+    assert routes._query_audit_fields("  What is\nthe PTO policy?\n") == {
+        "message_length": 23,
+        "query_text": "What is the PTO policy?",
+    }
+    fields = routes._query_audit_fields("x" * 300)
+    assert fields["message_length"] == 300
+    assert fields["query_text"] == "x" * 237 + "..."
@@ -32,3 +32,9 @@ def test_fallback_general_question_returns_compact_bullets():
     assert "LLM unavailable (ReadTimeout)" in out
     assert "Top retrieved excerpts:" in out
     assert "- Line one about product work. Line two about backend APIs." in out
+
+
+def test_fallback_keeps_first_three_non_empty_snippets():
+    sources = [{"snippet": "  "}, {"snippet": "a" * 230}, {"snippet": "b"}, {}, {"snippet": "c"}, {"snippet": "d"}]
+    out = routes._fallback_answer_from_sources("q", sources, "ReadTimeout")
+    assert out.endswith("Top retrieved excerpts:\n- " + "a" * 220 + "...\n- b\n- c")
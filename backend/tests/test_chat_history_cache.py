@@ -0,0 +1,88 @@
+import asyncio
+
+from app.api import routes
+from app.services import chat_history
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.lists = {}
+
+    async def lrange(self, key, start, end):
+        return list(self.lists.get(key, []))
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def delete(self, key):
+        self.redis.lists.pop(key, None)
+
+    def rpush(self, key, *values):
+        self.redis.lists.setdefault(key, []).extend(values)
+
+    def rpushx(self, key, *values):
+        if key in self.redis.lists:
+            self.redis.lists[key].extend(values)
+
+    def ltrim(self, key, start, end):
+        if key in self.redis.lists:
+            self.redis.lists[key] = self.redis.lists[key][start:]
+
+    def expire(self, key, seconds):
+        pass
+
+    async def execute(self):
+        return []
+
+
+class _Db:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+    async def execute(self, statement, params):
+        self.queries += 1
+        rows = self.rows
+
+        class _Result:
+            def all(self):
+                return rows
+
+        return _Result()
+
+
+def test_history_miss_populates_cache_and_appends_extend_it(monkeypatch):
+    fake = _FakeRedis()
+    monkeypatch.setattr(chat_history, "_async_client", fake)
+    db = _Db([("assistant", "hi"), ("user", "hello")])
+    assert asyncio.run(routes._history_for_prompt(db, "s-1")) == "User: hello\nAssistant: hi"
+    asyncio.run(chat_history.append_history("s-1", "User: next"))
+    assert asyncio.run(routes._history_for_prompt(db, "s-1")) == "User: hello\nAssistant: hi\nUser: next"
+    assert db.queries == 1
+
+
+def test_append_does_not_create_partial_history(monkeypatch):
+    fake = _FakeRedis()
+    monkeypatch.setattr(chat_history, "_async_client", fake)
+    asyncio.run(chat_history.append_history("s-2", "User: orphan"))
+    assert fake.lists == {}
+
+
+def test_cache_window_is_trimmed(monkeypatch):
+    fake = _FakeRedis()
+    monkeypatch.setattr(chat_history, "_async_client", fake)
+    asyncio.run(chat_history.store_history("s-3", [f"User: {i}" for i in range(12)]))
+    asyncio.run(chat_history.append_history("s-3", "User: 12"))
+    cached = asyncio.run(chat_history.cached_history("s-3"))
+    assert cached == [f"User: {i}" for i in range(3, 13)]
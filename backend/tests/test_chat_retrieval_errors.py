@@ -1,3 +1,7 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
 import pytest
 from fastapi import HTTPException
 
@@ -38,3 +42,82 @@ def test_retrieve_for_chat_raises_http_503_when_backend_fails(monkeypatch):
         routes._retrieve_for_chat(kb_id=1, query="hello")
     assert exc.value.status_code == 503
     assert "Retrieval backend unavailable" in str(exc.value.detail)
+
+
+def test_hyde_pass_is_skipped_when_first_pass_is_confident(monkeypatch):
+    calls = []
+    monkeypatch.setattr(routes.settings, "chat_low_confidence_threshold", 0.5)
+    monkeypatch.setattr(
+        routes,
+        "_retrieve_for_chat",
+        lambda kb_id, query, limit=5, query_variants=None: calls.append(query_variants) or [{"score": 0.9}],
+    )
+
+    async def _run():
+        hyde_called = asyncio.Event()
+
+        async def _hyde():
+            hyde_called.set()
+            await asyncio.sleep(60)
+
+        hyde_task = asyncio.create_task(_hyde())
+        sources = await routes._retrieve_chat_sources(7, "pto policy", 3)
+        sources = await routes._refine_chat_sources(7, "pto policy", 3, sources, hyde_task)
+        await asyncio.sleep(0)
+        return sources, hyde_task.cancelled()
+
+    sources, cancelled = asyncio.run(_run())
+    assert sources == [{"score": 0.9}]
+    assert cancelled
+    assert len(calls) == 1
+
+
+def test_hyde_pass_retrieves_again_when_first_pass_is_weak(monkeypatch):
+    calls = []
+    monkeypatch.setattr(routes.settings, "chat_low_confidence_threshold", 0.5)
+    monkeypatch.setattr(routes.settings, "retrieval_enable_query_expansion", True)
+    monkeypatch.setattr(
+        routes,
+        "_retrieve_for_chat",
+        lambda kb_id, query, limit=5, query_variants=None: calls.append(query_variants) or [{"score": 0.01}],
+    )
+
+    async def _hyde():
+        return "Employees accrue paid leave monthly."
+
+    async def _run():
+        return await routes._refine_chat_sources(7, "pto policy", 3, [], asyncio.create_task(_hyde()))
+
+    asyncio.run(_run())
+    assert calls[0][-1] == "Employees accrue paid leave monthly."
+
+
+def test_search_documents_retrieves_off_the_event_loop(monkeypatch):
+    threads = []
+
+    async def _resolve(db, user, kb_id, min_role):
+        return 7
+
+    async def _noop(*args, **kwargs):
+        return None
+
+    async def _variants(query):
+        return [query]
+
+    def _fake_hybrid_retrieve(**kwargs):
+        threads.append(threading.get_ident())
+        return [{"snippet": "PTO policy text"}]
+
+    monkeypatch.setattr(routes, "_resolve_kb_for_user", _resolve)
+    monkeypatch.setattr(routes, "_release_connection", _noop)
+    monkeypatch.setattr(routes, "build_query_variants", _variants)
+    monkeypatch.setattr(routes, "hybrid_retrieve", _fake_hybrid_retrieve)
+    monkeypatch.setattr(routes, "buffer_audit_event", lambda **kwargs: None)
+
+    async def _run():
+        results = await routes.search_documents(None, SimpleNamespace(id=1), "pto policy", kb_id=7)
+        return results, threading.get_ident()
+
+    results, loop_thread = asyncio.run(_run())
+    assert results == [{"snippet": "PTO policy text"}]
+    assert threads and threads[0] != loop_thread
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+
+from app.api import routes
+from app.models.chat import ChatSession
+
+
+class _FakeAsyncDb:
+    def __init__(self, row):
+        self.row = row
+        self.statements = []
+
+    async def scalar(self, statement, execution_options=None):
+        self.statements.append(statement)
+        return self.row
+
+
+def test_get_or_create_chat_session_upserts_in_one_statement():
+    db = _FakeAsyncDb(ChatSession(id="s-1", user_id=1, knowledge_base_id=2))
+    session = asyncio.run(routes._get_or_create_chat_session(db, user_id=1, kb_id=2, session_id="s-1"))
+    assert (session.id, session.user_id, session.knowledge_base_id) == ("s-1", 1, 2)
+    assert len(db.statements) == 1
+    sql = str(db.statements[0].compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (id) DO UPDATE SET updated_at" in sql
+    assert "RETURNING" in sql
+    assert "timezone(%(timezone_1)s, now())" in sql
+
+
+def test_get_or_create_chat_session_rejects_other_users_session():
+    db = _FakeAsyncDb(ChatSession(id="s-1", user_id=9, knowledge_base_id=2))
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(routes._get_or_create_chat_session(db, user_id=1, kb_id=2, session_id="s-1"))
+    assert exc.value.status_code == 404
+
+
+def test_worker_touches_chat_session_with_one_upsert():
+    from app.tasks import chat as chat_tasks
+
+    db = _FakeAsyncDb(None)
+    db.execute = db.statements.append
+    chat_tasks._touch_chat_session(db, user_id=1, kb_id=2, session_id="s-1")
+    assert len(db.statements) == 1
+    sql = str(db.statements[0].compile(dialect=postgresql.dialect()))
+    assert sql.startswith("INSERT INTO chat_sessions")
+    assert "ON CONFLICT (id) DO UPDATE SET updated_at" in sql
@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+
+from app.api import routes
+from app.models.chat import ChatMessage, ChatRole, ChatSession
+from app.models.document import KnowledgeBase
+from app.models.user import User
+
+
+def test_list_chat_sessions_uses_single_query(sqlite_session):
+    Session = sqlite_session
+    now = datetime.utcnow()
+    with Session() as db:
+        db.add_all([User(id=1, email="a@example.com", password_hash="x"), KnowledgeBase(id=1, name="KB")])
+        db.add_all(
+            [
+                ChatSession(id="old", user_id=1, knowledge_base_id=1, created_at=now, updated_at=now),
+                ChatSession(id="new", user_id=1, knowledge_base_id=1, created_at=now, updated_at=now + timedelta(1)),
+                ChatSession(id="empty", user_id=1, knowledge_base_id=1, created_at=now, updated_at=now - timedelta(1)),
+            ]
+        )
+        db.add_all(
+            [
+                ChatMessage(session_id="old", role=ChatRole.USER, content="first"),
+                ChatMessage(session_id="old", role=ChatRole.ASSISTANT, content="x" * 200),
+                ChatMessage(session_id="new", role=ChatRole.USER, content="hello"),
+            ]
+        )
+        db.commit()
+
+    statements = Session.record_statements()
+    with Session() as db:
+        out = routes.list_chat_sessions(db, user=User(id=1, email="a@example.com"))
+
+    assert len(statements) == 1
+    assert "substr(chat_messages.content" in statements[0]
+    assert [row["session_id"] for row in out] == ["new", "old", "empty"]
+    assert [row["message_count"] for row in out] == [1, 2, 0]
+    assert out[0]["last_message_preview"] == "hello"
+    assert out[1]["last_message_preview"] == "x" * 140 + "..."
+    assert out[2]["last_message_preview"] == ""
+
+
+def test_prebuilt_statements_bind_per_call(sqlite_session):
+    from app.models.document import KnowledgeBaseMembership, KnowledgeBaseRole
+    from app.tasks import chat as chat_tasks
+
+    Session = sqlite_session
+    with Session() as db:
+        db.add_all([User(id=1, email="a@example.com", password_hash="x"), KnowledgeBase(id=1, name="KB")])
+        db.add(KnowledgeBaseMembership(knowledge_base_id=1, user_id=1, role=KnowledgeBaseRole.OWNER))
+        db.add(ChatSession(id="s", user_id=1, knowledge_base_id=1))
+        db.add_all([ChatMessage(session_id="s", role=ChatRole.USER, content=f"m{i}") for i in range(4)])
+        db.commit()
+
+        assert routes._count_kb_owners(db, 1) == 1
+        assert routes._count_kb_owners(db, 2) == 0
+        assert chat_tasks._history_for_prompt(db, "s", max_messages=2) == "User: m2\nUser: m3"
+
+
+def test_get_chat_job_reads_job_message_and_feedback_in_one_query(monkeypatch, sqlite_session):
+    from app.models.analytics import ChatFeedback
+    from app.models.chat import ChatJob, ChatJobStatus
+
+    Session = sqlite_session
+    with Session() as db:
+        db.add_all([User(id=1, email="a@example.com", password_hash="x"), KnowledgeBase(id=1, name="KB")])
+        db.add(ChatSession(id="s", user_id=1, knowledge_base_id=1))
+        db.add_all(
+            [
+                ChatMessage(id=1, session_id="s", role=ChatRole.ASSISTANT, content="older"),
+                ChatMessage(id=2, session_id="s", role=ChatRole.ASSISTANT, content="answer"),
+                ChatMessage(id=3, session_id="s", role=ChatRole.USER, content="follow-up"),
+            ]
+        )
+        db.add(ChatFeedback(user_id=1, knowledge_base_id=1, session_id="s", chat_message_id=2, rating="up"))
+        db.add_all(
+            [
+                ChatJob(
+                    id="done",
+                    user_id=1,
+                    knowledge_base_id=1,
+                    session_id="s",
+                    question="q",
+                    answer="answer",
+                    status=ChatJobStatus.COMPLETED,
+                ),
+                ChatJob(id="queued", user_id=1, knowledge_base_id=1, session_id="s", question="q"),
+            ]
+        )
+        db.commit()
+
+    monkeypatch.setattr(routes, "require_kb_access", lambda *args, **kwargs: None)
+    statements = Session.record_statements()
+    user = User(id=1, email="a@example.com")
+    with Session() as db:
+        done = routes.get_chat_job(db, user=user, job_id="done")
+        queued = routes.get_chat_job(db, user=user, job_id="queued")
+
+    assert len(statements) == 2
+    assert (done["assistant_message_id"], done["feedback_rating"]) == (2, "up")
+    assert (queued["assistant_message_id"], queued["feedback_rating"]) == (None, None)
+
+
+def test_get_chat_session_returns_messages_with_feedback_in_one_query(monkeypatch, sqlite_session):
+    from app.models.analytics import ChatFeedback
+
+    Session = sqlite_session
+    with Session() as db:
+        db.add_all(
+            [
+                User(id=1, email="a@example.com", password_hash="x"),
+                User(id=2, email="b@example.com", password_hash="x"),
+                KnowledgeBase(id=1, name="KB"),
+            ]
+        )
+        db.add(ChatSession(id="s", user_id=1, knowledge_base_id=1))
+        db.add_all(
+            [
+                ChatMessage(id=1, session_id="s", role=ChatRole.USER, content="q1"),
+                ChatMessage(id=2, session_id="s", role=ChatRole.ASSISTANT, content="a1"),
+                ChatMessage(id=3, session_id="s", role=ChatRole.USER, content="q2"),
+                ChatMessage(id=4, session_id="s", role=ChatRole.ASSISTANT, content="a2"),
+            ]
+        )
+        db.add_all(
+            [
+                ChatFeedback(user_id=1, knowledge_base_id=1, session_id="s", chat_message_id=2, rating="up"),
+                ChatFeedback(user_id=2, knowledge_base_id=1, session_id="s", chat_message_id=4, rating="down"),
+            ]
+        )
+        db.commit()
+
+    monkeypatch.setattr(routes, "require_kb_access", lambda *args, **kwargs: None)
+    statements = Session.record_statements()
+    with Session() as db:
+        out = routes.get_chat_session(db, user=User(id=1, email="a@example.com"), session_id="s", limit=3)
+
+    assert len(statements) == 2
+    assert [(m["id"], m["feedback_rating"]) for m in out["messages"]] == [(2, "up"), (3, None), (4, None)]
@@ -1,24 +1,39 @@
-from app.api import routes
+from app.services import context
 
 
 def test_dedupe_sources_for_chat_keeps_unique_documents(monkeypatch):
-    monkeypatch.setattr(routes.settings, "chat_unique_sources_per_document", True)
+    monkeypatch.setattr(context.settings, "chat_unique_sources_per_document", True)
     sources = [
         {"snippet": "A1", "metadata": {"doc_id": 10}, "score": 0.9},
         {"snippet": "A2", "metadata": {"doc_id": 10}, "score": 0.8},
         {"snippet": "B1", "metadata": {"doc_id": 11}, "score": 0.7},
     ]
-    out = routes._dedupe_sources_for_chat(sources, limit=5)
+    out = context.select_chat_sources(sources, limit=5)
     assert len(out) == 2
     assert out[0]["metadata"]["doc_id"] == 10
     assert out[1]["metadata"]["doc_id"] == 11
 
 
 def test_dedupe_sources_for_chat_can_be_disabled(monkeypatch):
-    monkeypatch.setattr(routes.settings, "chat_unique_sources_per_document", False)
+    monkeypatch.setattr(context.settings, "chat_unique_sources_per_document", False)
     sources = [
         {"snippet": "A1", "metadata": {"doc_id": 10}, "score": 0.9},
         {"snippet": "A2", "metadata": {"doc_id": 10}, "score": 0.8},
     ]
-    out = routes._dedupe_sources_for_chat(sources, limit=5)
+    out = context.select_chat_sources(sources, limit=5)
     assert len(out) == 2
+
+
+def test_select_chat_sources_maps_only_kept_hits(monkeypatch):
+    monkeypatch.setattr(context.settings, "chat_unique_sources_per_document", True)
+    hits = [
+        {"snippet": "A1", "metadata": {"doc_id": 10}, "score": 0.9, "doc_id": 10, "dense_score": 0.5},
+        {"snippet": "A2", "metadata": {"doc_id": 10}, "score": 0.8},
+        {"snippet": "B1", "metadata": {"source": "b.md"}, "score": 0.7},
+        {"snippet": "C1", "metadata": {"doc_id": 12}, "score": 0.6},
+    ]
+    out = context.select_chat_sources(hits, limit=2)
+    assert out == [
+        {"snippet": "A1", "metadata": {"doc_id": 10}, "score": 0.9},
+        {"snippet": "B1", "metadata": {"source": "b.md"}, "score": 0.7},
+    ]
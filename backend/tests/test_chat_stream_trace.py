@@ -1,8 +1,16 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
 from app.api import routes
 
 
 def test_reasoning_event_payload_shape():
-    payload = routes._reasoning_event("draft", "Drafting answer.", 1234)
+    frame = routes._reasoning_frame("draft", "Drafting answer.", 1234)
+    assert frame.startswith(b"event: reasoning\n")
+    payload = json.loads(frame.split(b"data: ", 1)[1])
     assert payload["step"] == "draft"
     assert payload["detail"] == "Drafting answer."
     assert payload["elapsed_ms"] == 1234
@@ -26,3 +34,133 @@ def test_source_previews_compact_and_bounded():
     assert previews[0]["name"] == "policy.pdf"
     assert previews[0]["score"] == 0.91
     assert previews[0]["snippet_preview"].startswith("Policy details")
+
+
+class _StreamDb:
+    def __init__(self):
+        self.added = []
+        self.commits = 0
+
+    async def get(self, model, key):
+        return None
+
+    def add_all(self, objs):
+        self.added.extend(objs)
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        pass
+
+
+async def _noop(*args, **kwargs):
+    return None
+
+
+def _stub_stream(monkeypatch, tokens, actions=None):
+    """Stub everything around the LLM so `chat_rag_stream` streams `tokens`, an async generator function."""
+
+    async def _resolve_kb(*args, **kwargs):
+        return 1
+
+    async def _history(*args, **kwargs):
+        return ""
+
+    source = {"snippet": "Policy text.", "score": 0.9, "metadata": {"source": "p.md"}}
+    stats = {"token_budget": 100, "token_used": 10, "compressed_sources": 0}
+    actions = [] if actions is None else actions
+    monkeypatch.setattr(routes, "_resolve_kb_for_user", _resolve_kb)
+    monkeypatch.setattr(routes, "_get_or_create_chat_session", _noop)
+    monkeypatch.setattr(routes, "_history_for_prompt", _history)
+    monkeypatch.setattr(routes, "_release_connection", _noop)
+    monkeypatch.setattr(routes, "append_history", _noop)
+    monkeypatch.setattr(routes, "log_audit_event", lambda *args, **kwargs: actions.append(kwargs["action"]))
+    monkeypatch.setattr(routes, "_retrieve_for_chat", lambda *args, **kwargs: [source])
+    monkeypatch.setattr(routes, "_build_chat_prompt", lambda **kwargs: ("s", "u", "[Source 1]", [source], stats))
+    monkeypatch.setattr(routes, "llm_generate_stream", tokens)
+
+
+def _token_deltas(frames):
+    return [json.loads(f.split(b"data: ", 1)[1])["delta"] for f in frames if f.startswith(b"event: token")]
+
+
+def test_stream_coalesces_tokens_into_fewer_frames(monkeypatch):
+    async def _tokens(prompt, system=None):
+        for token in ["a"] * 100:
+            yield token
+
+    _stub_stream(monkeypatch, _tokens)
+    monkeypatch.setattr(routes.settings, "chat_stream_coalesce_chars", 10)
+    monkeypatch.setattr(routes.settings, "chat_stream_coalesce_ms", 60_000)
+
+    async def _collect():
+        response = await routes.chat_rag_stream(_StreamDb(), SimpleNamespace(id=1), "q", kb_id=1, session_id="s-1")
+        return [frame async for frame in response.body_iterator]
+
+    deltas = _token_deltas(asyncio.run(_collect()))
+    assert len(deltas) == 10
+    assert "".join(deltas) == "a" * 100
+
+
+def test_stream_flushes_pending_text_before_a_heartbeat(monkeypatch):
+    async def _tokens(prompt, system=None):
+        yield "Hi"
+        await asyncio.sleep(0.05)
+        yield " there"
+
+    _stub_stream(monkeypatch, _tokens)
+    monkeypatch.setattr(routes, "_HEARTBEAT_SECONDS", 0.01)
+    monkeypatch.setattr(routes.settings, "chat_stream_coalesce_chars", 64)
+    monkeypatch.setattr(routes.settings, "chat_stream_coalesce_ms", 60_000)
+
+    async def _collect():
+        response = await routes.chat_rag_stream(_StreamDb(), SimpleNamespace(id=1), "q", kb_id=1, session_id="s-1")
+        return [frame async for frame in response.body_iterator]
+
+    frames = asyncio.run(_collect())
+    first_heartbeat = next(i for i, f in enumerate(frames) if f.startswith(b"event: heartbeat"))
+    assert _token_deltas(frames[:first_heartbeat]) == ["Hi"]
+    assert _token_deltas(frames) == ["Hi", " there"]
+
+
+def test_stream_stores_question_and_answer_in_one_commit(monkeypatch):
+    async def _tokens(prompt, system=None):
+        yield "Answer [Source 1]"
+
+    actions = []
+    _stub_stream(monkeypatch, _tokens, actions)
+    db = _StreamDb()
+
+    async def _collect():
+        response = await routes.chat_rag_stream(db, SimpleNamespace(id=1), "q", kb_id=1, session_id="s-1")
+        assert db.commits == 0
+        return [frame async for frame in response.body_iterator]
+
+    asyncio.run(_collect())
+    assert db.commits == 1
+    assert [m.role for m in db.added] == [routes.ChatRole.USER, routes.ChatRole.ASSISTANT]
+    assert actions == ["chat.query.stream.completed"]
+
+
+def test_disconnect_while_caching_history_does_not_store_the_question_twice(monkeypatch):
+    async def _tokens(prompt, system=None):
+        yield "Answer [Source 1]"
+
+    async def _disconnected(*args, **kwargs):
+        raise asyncio.CancelledError
+
+    actions = []
+    _stub_stream(monkeypatch, _tokens, actions)
+    monkeypatch.setattr(routes, "append_history", _disconnected)
+    db = _StreamDb()
+
+    async def _collect():
+        response = await routes.chat_rag_stream(db, SimpleNamespace(id=1), "q", kb_id=1, session_id="s-1")
+        return [frame async for frame in response.body_iterator]
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(_collect())
+    assert db.commits == 1
+    assert [m.role for m in db.added] == [routes.ChatRole.USER, routes.ChatRole.ASSISTANT]
+    assert actions == ["chat.query.stream.completed"]
@@ -0,0 +1,6 @@
+from app.services.context import build_user_prompt
+
+
+def test_build_user_prompt_includes_history_only_when_present():
+    assert build_user_prompt("Q?", "", "[Source 1] x") == "Context:\n\n[Source 1] x\n\nQuestion: Q?"
+    assert build_user_prompt("Q?", "User: hi", "ctx").startswith("Conversation history:\nUser: hi\n\nContext:\n\nctx")
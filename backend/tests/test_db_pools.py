@@ -0,0 +1,7 @@
+from app.models import base
+
+
+def test_async_pool_pings_before_checkout_by_default():
+    # Async paths have no reconnect retry, so a stale connection after a failover must be caught by the ping.
+    assert base.async_engine.pool._pre_ping is True
+    assert base.engine.pool._pre_ping is False
@@ -20,3 +20,183 @@ def test_normalize_document_filename_rejects_too_long():
 
 def test_document_filename_key_is_case_insensitive():
     assert routes._document_filename_key(" Report.PDF ") == "report.pdf"
+
+
+def test_digest_upload_streams_and_rewinds():
+    import hashlib
+    import tempfile
+
+    payload = b"ragnetic" * 300_000
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as spooled:
+        spooled.write(payload)
+        content_hash, size = routes._digest_upload(spooled)
+        assert content_hash == hashlib.sha256(payload).hexdigest()
+        assert size == len(payload)
+        assert spooled.tell() == 0
+
+
+def test_async_ingestion_queue_publishes_off_event_loop_thread(monkeypatch):
+    import asyncio
+    import threading
+    from types import SimpleNamespace
+
+    publish_threads = []
+    marked = []
+
+    class _RunSyncDb:
+        async def run_sync(self, fn, *args, **kwargs):
+            return fn(None, *args, **kwargs)
+
+    def _delay(document_id, job_id):
+        publish_threads.append(threading.current_thread())
+        return SimpleNamespace(id="task-1")
+
+    monkeypatch.setattr(routes, "_create_document_ingestion_job", lambda db, **kwargs: 9)
+    monkeypatch.setattr(routes, "mark_ingestion_job_queued", lambda db, **kwargs: marked.append(kwargs))
+    monkeypatch.setattr(routes, "ingest_document", SimpleNamespace(delay=_delay))
+    job_id = asyncio.run(
+        routes._queue_document_ingestion_job_async(_RunSyncDb(), user_id=1, kb_id=2, document_id=3, reason="upload")
+    )
+    assert job_id == 9
+    assert marked == [{"job_id": 9, "celery_task_id": "task-1"}]
+    assert publish_threads[0] is not threading.main_thread()
+
+
+def test_dedup_index_covers_hash_probe():
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.schema import CreateIndex
+
+    from app.models.document import Document
+
+    index = next(ix for ix in Document.__table__.indexes if ix.name == "ix_documents_kb_hash_status")
+    ddl = str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+    assert "(knowledge_base_id, content_hash, status) INCLUDE (id)" in ddl
+
+
+def test_name_probe_index_matches_lowered_filename():
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.schema import CreateIndex
+
+    from app.models.document import Document
+
+    index = next(ix for ix in Document.__table__.indexes if ix.name == "ix_documents_kb_lower_filename")
+    ddl = str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+    assert "(knowledge_base_id, lower(filename), id)" in ddl
+
+
+def test_upload_matches_returns_name_and_hash_hits_in_one_statement(sqlite_session):
+    from app.models.document import Document, KnowledgeBase
+
+    with sqlite_session() as db:
+        db.add(KnowledgeBase(id=1, name="KB"))
+        db.add_all(
+            [
+                Document(knowledge_base_id=1, filename="Report.pdf", object_key="a", content_hash="h1"),
+                Document(knowledge_base_id=1, filename="other.pdf", object_key="b", content_hash="h2"),
+            ]
+        )
+        db.commit()
+        statements = sqlite_session.record_statements()
+        rows = db.execute(routes._upload_matches_stmt(1, "report.pdf", "h2")).all()
+        matches = {row.match: (row.id, row.content_hash) for row in rows}
+        assert matches == {"name": (1, "h1"), "hash": (2, "h2")}
+        assert len(statements) == 1
+        assert db.execute(routes._upload_matches_stmt(1, "missing.pdf", "h9")).all() == []
+
+
+def test_queueing_ingestion_skips_refresh_and_reload(monkeypatch, sqlite_session):
+    from types import SimpleNamespace
+
+    from app.models.document import Document, KnowledgeBase
+    from app.models.ingestion import IngestionJob
+
+    Session = sqlite_session
+    with Session() as db:
+        db.add(KnowledgeBase(id=1, name="KB"))
+        db.add(Document(id=5, knowledge_base_id=1, filename="a.md", object_key="k", content_hash="h"))
+        db.commit()
+
+    statements = Session.record_statements()
+    monkeypatch.setattr(routes, "ingest_document", SimpleNamespace(delay=lambda *args: SimpleNamespace(id="task-9")))
+    with Session() as db:
+        job_id = routes._queue_document_ingestion_job(db, user_id=None, kb_id=1, document_id=5, reason="upload")
+    # Latest-attempt lookup, job insert, then one UPDATE for the task id: no refresh or reload SELECTs.
+    assert [sql.split()[0] for sql in statements] == ["SELECT", "INSERT", "UPDATE"]
+    with Session() as db:
+        assert db.get(IngestionJob, job_id).celery_task_id == "task-9"
+
+
+def test_duplicate_content_upload_never_touches_object_store(monkeypatch):
+    import asyncio
+    import io
+    from types import SimpleNamespace
+
+    from fastapi import UploadFile
+
+    from app.models.document import DocumentStatus
+
+    class _Db:
+        def add(self, obj):
+            pass
+
+        async def commit(self):
+            pass
+
+        async def execute(self, statement):
+            row = SimpleNamespace(match="hash", id=4, content_hash="h", status=DocumentStatus.INDEXED, object_key=None)
+            return SimpleNamespace(all=lambda: [row])
+
+    async def _resolve_kb(*args, **kwargs):
+        return 1
+
+    def _upload(*args, **kwargs):
+        raise AssertionError("duplicate content must not be uploaded")
+
+    monkeypatch.setattr(routes, "_resolve_kb_for_user", _resolve_kb)
+    monkeypatch.setattr(routes, "upload_file", _upload)
+    upload = UploadFile(io.BytesIO(b"same bytes"), filename="copy.md")
+    out = asyncio.run(routes.upload_document(_Db(), user=SimpleNamespace(id=1), file=upload, kb_id=1))
+    assert out["deduplicated"] is True
+    assert out["document_id"] == 4
+
+
+def test_new_upload_commits_document_with_its_ingestion_job(monkeypatch):
+    import asyncio
+    import io
+    from types import SimpleNamespace
+
+    from fastapi import UploadFile
+
+    events = []
+
+    class _Db:
+        def add(self, obj):
+            self.doc = obj
+
+        async def flush(self):
+            self.doc.id = 11
+
+        async def commit(self):
+            events.append("commit")
+
+        async def refresh(self, obj):
+            raise AssertionError("flush already assigned the document id")
+
+        async def execute(self, statement):
+            return SimpleNamespace(all=lambda: [])
+
+    async def _resolve_kb(*args, **kwargs):
+        return 1
+
+    async def _queue(db, **kwargs):
+        events.append(("queue", kwargs["document_id"]))
+        return 21
+
+    monkeypatch.setattr(routes, "_resolve_kb_for_user", _resolve_kb)
+    monkeypatch.setattr(routes, "upload_file", lambda *args: events.append("upload"))
+    monkeypatch.setattr(routes, "_queue_document_ingestion_job_async", _queue)
+    upload = UploadFile(io.BytesIO(b"fresh bytes"), filename="new.md")
+    out = asyncio.run(routes.upload_document(_Db(), user=SimpleNamespace(id=1), file=upload, kb_id=1))
+    assert out == {"filename": "new.md", "status": "queued", "document_id": 11, "ingestion_job_id": 21}
+    # The only commit before queueing releases the connection for the object-store PUT.
+    assert events == ["commit", "upload", ("queue", 11)]
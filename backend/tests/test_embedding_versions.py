@@ -0,0 +1,21 @@
+from app.models.document import KnowledgeBase
+from app.models.embedding import KBEmbeddingNamespace
+from app.services import embedding_versions
+
+
+def test_active_version_lookup_is_one_read_once_namespace_exists(monkeypatch, sqlite_session):
+    Session = sqlite_session
+    with Session() as db:
+        db.add_all([KnowledgeBase(id=1, name="KB"), KnowledgeBase(id=2, name="New KB")])
+        db.add(KBEmbeddingNamespace(knowledge_base_id=1, active_version="v2"))
+        db.commit()
+    monkeypatch.setattr(embedding_versions, "SessionLocal", Session)
+    monkeypatch.setattr(embedding_versions, "get_embedding_dim", lambda: 8)
+    statements = Session.record_statements()
+
+    assert embedding_versions.get_active_embedding_version_for_kb(1) == "v2"
+    assert len(statements) == 1
+
+    assert embedding_versions.get_active_embedding_version_for_kb(2) == "v1"
+    with Session() as db:
+        assert db.query(KBEmbeddingNamespace).filter_by(knowledge_base_id=2).one().active_version == "v1"
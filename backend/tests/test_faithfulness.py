@@ -0,0 +1,23 @@
+from app.services.faithfulness import faithfulness_score, faithfulness_signals
+
+
+def test_supported_cited_claims_score_higher_than_unsupported_ones():
+    sources = [{"snippet": "Employees receive twenty paid leave days every calendar year."}]
+    grounded = "Employees receive twenty paid leave days each year [Source 1]."
+    ungrounded = "The cafeteria serves breakfast until eleven on weekdays."
+    assert faithfulness_score(grounded, sources) > faithfulness_score(ungrounded, sources)
+
+
+def test_source_reference_legend_and_case_do_not_affect_score():
+    sources = [{"snippet": "Backups run nightly and are retained for thirty days."}]
+    answer = "BACKUPS run NIGHTLY and are retained for thirty days [Source 1]."
+    legend = answer + "\n\nSource references:\n[Source 1] backups.md"
+    assert faithfulness_score(answer, sources) == faithfulness_score(legend, sources)
+    assert faithfulness_score(answer, sources) == 0.925
+
+
+def test_disabled_scoring_reports_no_score():
+    assert faithfulness_signals("Anything at all.", [], threshold=0.5, enabled=False) == {
+        "faithfulness_score": None,
+        "low_faithfulness": False,
+    }
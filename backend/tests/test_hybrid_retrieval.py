@@ -0,0 +1,97 @@
+from app.services import retrieval, retrieval_cache
+from app.services.retrieval import Candidate
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+        self.ttls[key] = ex
+
+    def incr(self, key):
+        self.values[key] = int(self.values.get(key) or 0) + 1
+        return self.values[key]
+
+
+def test_hybrid_retrieve_returns_fused_truncated_hits(monkeypatch):
+    monkeypatch.setattr(retrieval.settings, "retrieval_cache_ttl_seconds", 0)
+    corpus = [
+        Candidate(point_id="a", text="pto policy " * 50, metadata={"source": "a.md"}, doc_id=1, dense_score=0.9),
+        Candidate(point_id="b", text="expense report", metadata={"source": "b.md"}, doc_id=2, dense_score=0.4),
+    ]
+    monkeypatch.setattr(retrieval, "_dense_search", lambda kb_id, queries, *args: [[corpus[0], corpus[1]] for _ in queries])
+    monkeypatch.setattr(retrieval, "_scroll_candidates", lambda *args, **kwargs: list(corpus))
+    monkeypatch.setattr(retrieval, "get_active_embedding_version_for_kb", lambda kb_id: "v1")
+
+    hits = retrieval.hybrid_retrieve(kb_id=1, query="pto policy", top_k=1, snippet_chars=20)
+
+    assert len(hits) == 1
+    assert hits[0]["doc_id"] == 1
+    assert hits[0]["snippet"] == ("pto policy " * 50)[:20]
+    assert type(hits[0]["score"]) is float
+    assert hits[0]["sparse_score"] > 0
+
+
+def test_hybrid_retrieve_serves_repeat_requests_from_cache_until_invalidated(monkeypatch):
+    fake = _FakeRedis()
+    monkeypatch.setattr(retrieval_cache, "_client", fake)
+    calls = []
+    corpus = [Candidate(point_id="a", text="pto policy", metadata={"source": "a.md"}, doc_id=1, dense_score=0.9)]
+
+    def _dense(kb_id, queries, *args):
+        calls.append(queries)
+        return [list(corpus) for _ in queries]
+
+    monkeypatch.setattr(retrieval, "_dense_search", _dense)
+    monkeypatch.setattr(retrieval, "_scroll_candidates", lambda *args, **kwargs: list(corpus))
+    monkeypatch.setattr(retrieval, "get_active_embedding_version_for_kb", lambda kb_id: "v1")
+
+    first = retrieval.hybrid_retrieve(kb_id=3, query="pto", top_k=1)
+    assert retrieval.hybrid_retrieve(kb_id=3, query="pto", top_k=1) == first
+    assert len(calls) == 1
+    retrieval.hybrid_retrieve(kb_id=3, query="pto", top_k=2)
+    assert len(calls) == 2
+    entries = [key for key in fake.values if not key.endswith(":generation")]
+    assert len(entries) == 2
+    assert all(fake.ttls[key] == retrieval.settings.retrieval_cache_ttl_seconds for key in entries)
+    retrieval_cache.invalidate_kb(3)
+    retrieval.hybrid_retrieve(kb_id=3, query="pto", top_k=1)
+    assert len(calls) == 3
+    assert retrieval.hybrid_retrieve(kb_id=3, query="pto", top_k=1) == first
+    assert len(calls) == 3
+
+
+def test_results_computed_across_an_invalidation_are_not_served(monkeypatch):
+    fake = _FakeRedis()
+    monkeypatch.setattr(retrieval_cache, "_client", fake)
+    digest = retrieval_cache.request_digest("pto")
+
+    hits, entry_key = retrieval_cache.cached_hits(9, digest)
+    assert hits is None
+    retrieval_cache.invalidate_kb(9)
+    retrieval_cache.store_hits(entry_key, [{"text": "stale"}])
+
+    assert retrieval_cache.cached_hits(9, digest)[0] is None
+
+
+def test_query_embeddings_encode_only_uncached_queries_in_one_call(monkeypatch):
+    batches = []
+
+    def _embed(texts):
+        batches.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    monkeypatch.setattr(retrieval, "embed_texts", _embed)
+    monkeypatch.setattr(retrieval, "_query_vectors", retrieval.OrderedDict())
+
+    assert retrieval.query_embedding("pto") == (3.0, 1.0)
+    vectors = retrieval.query_embeddings(["pto", "leave policy", "pto days", "leave policy"])
+
+    assert vectors == [(3.0, 1.0), (12.0, 1.0), (8.0, 1.0), (12.0, 1.0)]
+    assert batches == [["pto"], ["leave policy", "pto days"]]
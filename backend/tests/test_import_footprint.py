@@ -0,0 +1,14 @@
+import subprocess
+import sys
+
+
+def test_app_imports_in_a_fresh_interpreter():
+    # Catches import-order bugs (e.g. mapper configuration at import time) that the test session's own imports mask.
+    result = subprocess.run([sys.executable, "-c", "import app.main"], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_api_import_defers_qdrant_sdk():
+    code = "import sys, app.main; print('qdrant_client' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
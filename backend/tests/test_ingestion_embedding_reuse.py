@@ -0,0 +1,27 @@
+from app.tasks import ingestion
+
+
+def test_embed_reusing_only_embeds_changed_chunks(monkeypatch):
+    embedded = []
+
+    def _fake_embed(texts):
+        embedded.extend(texts)
+        return [[float(len(t))] for t in texts]
+
+    monkeypatch.setattr(ingestion, "embed_texts", _fake_embed)
+    previous = {"unchanged intro": [0.5], "unchanged outro": [0.25]}
+    vectors, reused = ingestion._embed_reusing(["unchanged intro", "edited middle", "unchanged outro"], previous)
+    assert embedded == ["edited middle"]
+    assert vectors == [[0.5], [13.0], [0.25]]
+    assert reused == 2
+
+
+def test_previous_chunk_vectors_is_best_effort(monkeypatch):
+    def _boom(**kwargs):
+        raise RuntimeError("qdrant down")
+
+    monkeypatch.setattr(ingestion, "document_chunk_vectors", _boom)
+    assert ingestion._previous_chunk_vectors(1, 2, "v1") == {}
+    monkeypatch.setattr(ingestion.settings, "ingestion_reuse_chunk_embeddings", False)
+    monkeypatch.setattr(ingestion, "document_chunk_vectors", lambda **kwargs: {"a": [1.0]})
+    assert ingestion._previous_chunk_vectors(1, 2, "v1") == {}
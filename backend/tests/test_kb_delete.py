@@ -0,0 +1,75 @@
+import pytest
+from fastapi import HTTPException
+
+from app.api import routes
+from app.models.audit import AuditLog
+from app.models.chat import ChatMessage, ChatRole, ChatSession
+from app.models.document import Document, DocumentStatus, KnowledgeBase, KnowledgeBaseMembership, KnowledgeBaseRole
+from app.models.user import User
+from app.services.audit import parse_details
+
+
+def test_delete_knowledge_base_cleans_up_in_batches(monkeypatch, sqlite_session):
+    Session = sqlite_session
+    with Session() as db:
+        db.add_all([User(id=1, email="a@example.com", password_hash="x"), KnowledgeBase(id=1, name="KB")])
+        db.add(KnowledgeBaseMembership(knowledge_base_id=1, user_id=1, role=KnowledgeBaseRole.OWNER))
+        db.add_all(
+            [
+                Document(
+                    knowledge_base_id=1, filename=f"{i}.md", object_key=f"uploads/{i}.md", status=DocumentStatus.INDEXED
+                )
+                for i in range(5)
+            ]
+        )
+        db.add(ChatSession(id="s", user_id=1, knowledge_base_id=1))
+        db.add(ChatMessage(session_id="s", role=ChatRole.USER, content="hi"))
+        db.commit()
+
+    collection_drops, removed_keys, forgotten = [], [], []
+    monkeypatch.setattr(routes, "require_kb_access", lambda *args, **kwargs: None)
+    monkeypatch.setattr(routes, "delete_all_collections_for_kb", lambda kb_id: collection_drops.append(kb_id))
+    monkeypatch.setattr(routes, "delete_files", lambda keys: removed_keys.append(sorted(keys)))
+    monkeypatch.setattr(routes, "forget_history_sync", lambda *session_ids: forgotten.extend(session_ids))
+    statements = Session.record_statements()
+
+    with Session() as db:
+        routes.delete_knowledge_base(db, user=User(id=1, email="a@example.com"), kb_id=1)
+
+    assert collection_drops == [1]
+    assert removed_keys == [[f"uploads/{i}.md" for i in range(5)]]
+    assert sum(sql.startswith("DELETE FROM documents") for sql in statements) == 1
+    assert forgotten == ["s"]
+    assert not any(sql.startswith("SELECT chat_sessions.id") for sql in statements)
+    with Session() as db:
+        assert db.query(Document).count() == 0
+        assert db.get(KnowledgeBase, 1) is None
+        assert db.query(ChatSession).count() == db.query(ChatMessage).count() == 0
+        audit = db.query(AuditLog).one()
+        assert audit.action == "kb.delete"
+        assert parse_details(audit.details_json)["documents_deleted"] == 5
+
+
+def test_processing_guard_uses_partial_index():
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.schema import CreateIndex
+
+    index = next(ix for ix in Document.__table__.indexes if ix.name == "ix_documents_kb_processing")
+    ddl = str(CreateIndex(index).compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    assert ddl.endswith("(knowledge_base_id) WHERE status = 'processing'")
+
+
+def test_delete_knowledge_base_refuses_while_documents_process(monkeypatch, sqlite_session):
+    Session = sqlite_session
+    with Session() as db:
+        db.add(KnowledgeBase(id=1, name="KB"))
+        db.add(Document(knowledge_base_id=1, filename="a.md", object_key="a", status=DocumentStatus.PROCESSING))
+        db.commit()
+    monkeypatch.setattr(routes, "require_kb_access", lambda *args, **kwargs: None)
+    statements = Session.record_statements()
+
+    with Session() as db, pytest.raises(HTTPException) as exc:
+        routes.delete_knowledge_base(db, user=User(id=1, email="a@example.com"), kb_id=1)
+
+    assert exc.value.status_code == 409
+    assert statements[-1].startswith("SELECT EXISTS")
@@ -0,0 +1,17 @@
+from app.services import llm
+
+
+def test_ollama_payload_leads_with_system_prompt_and_keeps_model_loaded(monkeypatch):
+    monkeypatch.setattr(llm.settings, "ollama_keep_alive", "30m")
+    payload = llm._ollama_payload("Question: q", "Be grounded.", stream=True, num_predict=64)
+    assert payload["prompt"] == "Be grounded.\n\nQuestion: q"
+    assert payload["stream"] is True
+    assert payload["options"]["num_predict"] == 64
+    assert payload["keep_alive"] == "30m"
+
+
+def test_ollama_payload_omits_keep_alive_when_unset(monkeypatch):
+    monkeypatch.setattr(llm.settings, "ollama_keep_alive", "")
+    payload = llm._ollama_payload("q", None, stream=False, num_predict=64)
+    assert payload["prompt"] == "q"
+    assert "keep_alive" not in payload
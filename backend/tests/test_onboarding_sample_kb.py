@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.api import routes
+from app.models.document import Document, DocumentStatus
+from app.models.ingestion import IngestionJob, IngestionJobStatus
+from app.models.user import User
+
+
+def _session_factory(monkeypatch, Session):
+    with Session() as db:
+        db.add(User(id=1, email="a@example.com", password_hash="x"))
+        db.commit()
+    monkeypatch.setattr(routes, "upload_file", lambda *args, **kwargs: args[0])
+    return Session
+
+
+def test_sample_kb_queues_ingestion_after_commit(monkeypatch, sqlite_session):
+    Session = _session_factory(monkeypatch, sqlite_session)
+    monkeypatch.setattr(routes, "ingest_document", SimpleNamespace(delay=lambda *args: SimpleNamespace(id="t-1")))
+    with Session() as db:
+        out = routes.create_onboarding_sample_kb(db, User(id=1, email="a@example.com"))
+    assert out["status"] == "queued"
+    with Session() as db:
+        assert db.get(IngestionJob, out["ingestion_job_id"]).celery_task_id == "t-1"
+
+
+def test_sample_kb_broker_failure_is_recorded_on_the_same_session(monkeypatch, sqlite_session):
+    Session = _session_factory(monkeypatch, sqlite_session)
+
+    def _broker_down(*args):
+        raise ConnectionError("broker down")
+
+    monkeypatch.setattr(routes, "ingest_document", SimpleNamespace(delay=_broker_down))
+    with Session() as db, pytest.raises(HTTPException) as exc:
+        routes.create_onboarding_sample_kb(db, User(id=1, email="a@example.com"))
+    assert exc.value.status_code == 503
+    with Session() as db:
+        assert db.query(Document).one().status == DocumentStatus.FAILED
+        assert db.query(IngestionJob).one().status == IngestionJobStatus.FAILED
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app.api import routes
+from app.models.tenant import (
+    Organization,
+    OrganizationMembership,
+    OrganizationRole,
+    Team,
+    TeamMembership,
+    TeamRole,
+)
+from app.models.user import User
+from app.services import access
+
+
+def test_list_organizations_returns_callers_orgs_oldest_first(sqlite_session):
+    Session = sqlite_session
+    now = datetime.utcnow()
+    with Session() as db:
+        db.add_all(
+            [User(id=1, email="a@example.com", password_hash="x"), User(id=2, email="b@example.com", password_hash="x")]
+        )
+        db.add_all(
+            [
+                Organization(id=1, name="Newer", created_at=now),
+                Organization(id=2, name="Older", description="first", created_at=now - timedelta(days=1)),
+                Organization(id=3, name="Other", created_at=now),
+            ]
+        )
+        db.add_all(
+            [
+                OrganizationMembership(organization_id=1, user_id=1, role=OrganizationRole.MEMBER),
+                OrganizationMembership(organization_id=2, user_id=1, role=OrganizationRole.OWNER),
+                OrganizationMembership(organization_id=3, user_id=2, role=OrganizationRole.OWNER),
+            ]
+        )
+        db.commit()
+        out = routes.list_organizations(db, user=User(id=1, email="a@example.com"))
+
+    assert out == [
+        {
+            "id": 2,
+            "name": "Older",
+            "description": "first",
+            "role": OrganizationRole.OWNER,
+            "created_at": (now - timedelta(days=1)).isoformat(),
+        },
+        {"id": 1, "name": "Newer", "description": None, "role": OrganizationRole.MEMBER, "created_at": now.isoformat()},
+    ]
+
+
+def test_list_organization_teams_returns_only_that_orgs_teams(sqlite_session):
+    Session = sqlite_session
+    now = datetime.utcnow()
+    with Session() as db:
+        db.add(User(id=1, email="a@example.com", password_hash="x"))
+        db.add_all([Organization(id=1, name="Org"), Organization(id=2, name="Elsewhere")])
+        db.add(OrganizationMembership(organization_id=1, user_id=1, role=OrganizationRole.MEMBER))
+        db.add_all(
+            [
+                Team(id=1, organization_id=1, name="Support", created_at=now),
+                Team(id=2, organization_id=2, name="Sales", created_at=now),
+            ]
+        )
+        db.commit()
+        out = routes.list_organization_teams(db, user=User(id=1, email="a@example.com"), org_id=1)
+
+    assert out == [
+        {"id": 1, "organization_id": 1, "name": "Support", "description": None, "created_at": now.isoformat()}
+    ]
+
+
+def test_add_team_member_upserts_memberships_and_drops_cached_roles(sqlite_session):
+    Session = sqlite_session
+    with Session() as db:
+        db.add_all(
+            [User(id=1, email="a@example.com", password_hash="x"), User(id=2, email="b@example.com", password_hash="x")]
+        )
+        db.add(Organization(id=1, name="Org"))
+        db.add_all(
+            [
+                OrganizationMembership(organization_id=1, user_id=1, role=OrganizationRole.OWNER),
+                OrganizationMembership(organization_id=1, user_id=2, role=OrganizationRole.ADMIN),
+            ]
+        )
+        db.add(Team(id=1, organization_id=1, name="Support"))
+        db.commit()
+        caller = User(id=1, email="a@example.com")
+
+        first = routes.add_team_member(db, caller, team_id=1, email="b@example.com", role=TeamRole.MEMBER)
+        assert access.cached_team_role(db, 2, 1) == TeamRole.MEMBER
+        second = routes.add_team_member(db, caller, team_id=1, email="b@example.com", role=TeamRole.MANAGER)
+
+        assert (first["role"], second["role"]) == (TeamRole.MEMBER, TeamRole.MANAGER)
+        assert second["created_at"] == first["created_at"]
+        assert access.cached_team_role(db, 2, 1) == TeamRole.MANAGER
+        assert db.query(TeamMembership).count() == 1
+        assert db.scalar(
+            select(OrganizationMembership.role).where(OrganizationMembership.user_id == 2)
+        ) == OrganizationRole.ADMIN
@@ -0,0 +1,17 @@
+from fastapi.routing import APIRoute
+
+from app.main import app
+
+# Routes that return a Response object themselves (HTML page, SSE stream).
+_RAW_RESPONSE_PATHS = {"/", "/chat/stream"}
+
+
+def test_json_routes_declare_response_model():
+    # With a response model and the default response class, FastAPI serializes straight to JSON bytes in
+    # pydantic-core instead of jsonable_encoder + json.dumps.
+    missing = [
+        route.path
+        for route in app.routes
+        if isinstance(route, APIRoute) and route.path not in _RAW_RESPONSE_PATHS and route.response_model is None
+    ]
+    assert missing == []
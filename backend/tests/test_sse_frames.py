@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import pytest
+
+from app.api import routes
+
+
+def test_sse_frame_is_event_stream_bytes():
+    frame = routes._sse("meta", {"session_id": "s-1", "n": 2})
+    assert frame.startswith(b"event: meta\ndata: ") and frame.endswith(b"\n\n")
+    assert json.loads(frame[len(b"event: meta\ndata: ") : -2]) == {"session_id": "s-1", "n": 2}
+
+
+def test_token_frame_matches_generic_frame():
+    for delta in ("hello", 'quote " and \\ slash', "line\nbreak", "café ☃"):
+        assert routes._sse_token(delta) == routes._sse("token", {"delta": delta})
+
+
+def test_source_previews_flatten_newlines_and_truncate():
+    previews = routes._source_previews(
+        [{"snippet": "line one\r\nline two", "score": 0.5}, {"snippet": "x" * 130, "metadata": {"source": "a.md"}}]
+    )
+    assert previews[0] == {"name": "Source 1", "score": 0.5, "snippet_preview": "line one  line two"}
+    assert previews[1]["name"] == "a.md"
+    assert previews[1]["snippet_preview"] == "x" * 120 + "..."
+
+
+def test_reasoning_frame_matches_generic_frame():
+    for step, detail in (("draft", "Drafting an answer."), ("evidence", 'Found "3" chunks\n'), ("fallback", "café")):
+        for elapsed in (0, 1234):
+            expected = routes._sse("reasoning", {"step": step, "detail": detail, "elapsed_ms": elapsed})
+            assert routes._reasoning_frame(step, detail, elapsed) == expected
+
+
+def test_heartbeats_interleave_with_a_stalled_stream():
+    async def _slow():
+        yield "a"
+        await asyncio.sleep(0.05)
+        yield "b"
+
+    async def _collect():
+        return [item async for item in routes._with_heartbeats(_slow(), 0.01)]
+
+    items = asyncio.run(_collect())
+    assert [item for item in items if item is not None] == ["a", "b"]
+    assert items.count(None) >= 2
+
+
+def test_heartbeat_wrapper_reraises_stream_errors():
+    async def _broken():
+        yield "a"
+        raise RuntimeError("ollama down")
+
+    async def _collect():
+        return [item async for item in routes._with_heartbeats(_broken(), 10)]
+
+    with pytest.raises(RuntimeError, match="ollama down"):
+        asyncio.run(_collect())
+
+
+def test_heartbeat_wrapper_awaits_its_tasks_when_closed_early():
+    async def _endless():
+        while True:
+            yield "a"
+            await asyncio.sleep(0.01)
+
+    async def _run():
+        stream = routes._with_heartbeats(_endless(), 0.01)
+        assert await anext(stream) == "a"
+        await stream.aclose()
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    assert asyncio.run(_run()) == []
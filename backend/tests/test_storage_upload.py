@@ -0,0 +1,32 @@
+import io
+
+from app.services import storage
+
+
+class _FakeMinio:
+    def __init__(self):
+        self.calls = []
+
+    def bucket_exists(self, bucket):
+        return True
+
+    def put_object(self, bucket, key, data, length, content_type=None, part_size=0):
+        self.calls.append((key, data, length, part_size))
+
+
+def test_upload_streams_file_object_in_fixed_parts(monkeypatch):
+    client = _FakeMinio()
+    monkeypatch.setattr(storage, "_client", client)
+    monkeypatch.setattr(storage.settings, "storage_upload_part_size_mb", 8)
+    data = io.BytesIO(b"x" * 10)
+    assert storage.upload_file("k", data, 10) == "k"
+    key, sent, length, part_size = client.calls[0]
+    assert sent is data
+    assert (length, part_size) == (10, 8 * 1024 * 1024)
+
+
+def test_part_size_falls_back_when_object_needs_too_many_parts(monkeypatch):
+    monkeypatch.setattr(storage.settings, "storage_upload_part_size_mb", 8)
+    assert storage._part_size_for(100 * 1024**3) == 0
+    monkeypatch.setattr(storage.settings, "storage_upload_part_size_mb", 1)
+    assert storage._part_size_for(10) == 5 * 1024 * 1024